@@ -0,0 +1,109 @@
+"""Latency of the analytics summary, read from the rollups, as the raw events grow.
+
+Fills a scratch database step by step up to the largest size, every step spread over
+the last 30 days, and measures the summary query after every step next to the
+equivalent GROUP BY over the raw events. The 10M step takes a few minutes to fill.
+
+Usage: python -m benchmarks.analytics [--sizes 10000,100000,1000000,10000000] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from portfolio.lib.analytics.events import VisitEvent
+from portfolio.lib.analytics.store import AnalyticsStore
+
+_DAY = 24 * 60 * 60
+_SPAN = 30 * _DAY
+_BATCH = 5_000
+_COUNTRIES = ["DE", "US", "TR", "GB", "FR", "NL", "JP", "BR", "IN", "CA", None]
+_PLATFORMS = ["desktop", "mobile", "tablet", "bot"]
+
+_RAW_SUMMARY = """
+SELECT CAST(ts / 86400 AS INTEGER), country, platform, COUNT(*), COUNT(DISTINCT visitor),
+	SUM(interval_ms IS NULL), AVG(interval_ms)
+FROM events WHERE ts >= ? GROUP BY 1, 2, 3
+"""
+
+
+def _batch(
+	first: int, size: int, total: int, start: float, visitors: list[bytes]
+) -> tuple[list[VisitEvent], list[int | None]]:
+	# events arrive in order, like they would be flushed, spread evenly over the span
+	events = [
+		VisitEvent(
+			ts=start + (first + i) / total * _SPAN,
+			visitor=random.choice(visitors),
+			path="/spotify/top-tracks",
+			status=200,
+			country=random.choice(_COUNTRIES),
+			platform=random.choice(_PLATFORMS),
+		)
+		for i in range(size)
+	]
+	intervals = [None if random.random() < 0.3 else random.randrange(500, 120_000) for _ in events]
+
+	return events, intervals
+
+
+def _median_ms(fn, runs: int) -> float:
+	timings = []
+
+	for _ in range(runs):
+		start = time.perf_counter()
+		fn()
+		timings.append(time.perf_counter() - start)
+
+	return statistics.median(timings) * 1000
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sizes", default="10000,100000,1000000,10000000")
+	parser.add_argument("--runs", type=int, default=20)
+	parser.add_argument("--visitors", type=int, default=20_000)
+	parser.add_argument("--no-raw", action="store_true", help="skip the GROUP BY over the raw events")
+	args = parser.parse_args()
+
+	sizes = sorted(int(size) for size in args.sizes.split(","))
+	visitors = [random.randbytes(8) for _ in range(args.visitors)]
+	now = time.time()
+	start = now - _SPAN
+
+	with tempfile.TemporaryDirectory() as directory:
+		store = AnalyticsStore(os.path.join(directory, "analytics.db"))
+		inserted = 0
+
+		for size in sizes:
+			fill_start = time.perf_counter()
+
+			filled = inserted
+
+			while inserted < size:
+				events, intervals = _batch(
+					inserted - filled, min(_BATCH, size - inserted), size - filled, start, visitors
+				)
+				store.insert(events, intervals)
+				inserted += len(events)
+
+			rate = (inserted - filled) / (time.perf_counter() - fill_start)
+
+			daily = _median_ms(lambda: store.summary("day", start, now + _DAY), args.runs)
+			hourly = _median_ms(lambda: store.summary("hour", now - 7 * _DAY, now + _DAY), args.runs)
+			line = f"{size:>10} events  summary day {daily:7.2f}ms  hour {hourly:7.2f}ms"
+
+			if not args.no_raw:
+				raw = _median_ms(lambda: store.connection.execute(_RAW_SUMMARY, (start,)).fetchall(), 1)
+				line += f"  raw GROUP BY {raw:9.2f}ms"
+
+			print(f"{line}  (inserted at {rate:,.0f} events/s)", flush=True)
+
+		store.close()
+
+
+if __name__ == "__main__":
+	main()
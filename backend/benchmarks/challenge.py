@@ -0,0 +1,110 @@
+"""Throughput of the proof of work: redeeming solutions, checking passes and the middleware with a pass.
+
+Redeeming costs the server the same at every difficulty (one SHA-256, two HMACs and
+recording the challenge in the store, the in-process one here),
+the client's cost doubles with every bit, `solve` shows it for a CPython client.
+
+Usage: python -m benchmarks.challenge [--requests 100000] [--difficulty 16]
+"""
+
+import argparse
+import asyncio
+import time
+
+from portfolio.lib.middleware.challenge import ProofOfWorkMiddleware
+from portfolio.lib.store.memory import MemoryBackend
+from portfolio.lib.util.challenge import ProofOfWork, solve
+
+_CLIENT = "203.0.113.7"
+
+
+async def _app(scope, receive, send) -> None:
+	await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+	await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive() -> dict:
+	return {"type": "http.request", "body": b""}
+
+
+async def _send(message) -> None:
+	pass
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--requests", type=int, default=100_000)
+	parser.add_argument("--difficulty", type=int, default=16, help="difficulty of the solve timing")
+	args = parser.parse_args()
+
+	now = time.time()
+
+	# solving is the slow part, the challenges to redeem are easy ones
+	easy = ProofOfWork(
+		b"benchmark secret",
+		MemoryBackend(),
+		difficulty=4,
+		challenge_ttl=3600,
+		pass_ttl=3600,
+		max_solved=args.requests,
+	)
+	solved = [(challenge, solve(challenge, 4)) for challenge in (easy.challenge(now) for _ in range(args.requests))]
+
+	start = time.perf_counter()
+
+	for challenge, solution in solved:
+		await easy.redeem(challenge, solution, _CLIENT, now)
+
+	elapsed = time.perf_counter() - start
+	print(f"redeem     {len(solved) / elapsed:10.0f}/s  {elapsed / len(solved) * 1e6:6.2f}µs per solution")
+
+	token = easy.issue_pass(_CLIENT, now).encode()
+	start = time.perf_counter()
+
+	for _ in range(args.requests):
+		easy.check_pass(token, _CLIENT, now)
+
+	elapsed = time.perf_counter() - start
+	print(f"pass       {args.requests / elapsed:10.0f}/s  {elapsed / args.requests * 1e6:6.2f}µs per check")
+
+	middleware = ProofOfWorkMiddleware(
+		_app, proof_of_work=easy, paths=["/spotify/"], forwarded_header="X-Forwarded-For"
+	)
+	scope = {
+		"type": "http",
+		"method": "GET",
+		"path": "/spotify/top-tracks",
+		"root_path": "",
+		"headers": [(b"x-forwarded-for", _CLIENT.encode()), (b"cookie", b"theme=dark; pow_pass=" + token)],
+		"client": ("127.0.0.1", 1234),
+	}
+
+	results = {}
+
+	for name, app in (("bare", _app), ("middleware", middleware)):
+		start = time.perf_counter()
+
+		for _ in range(args.requests):
+			await app(scope, _receive, _send)
+
+		results[name] = time.perf_counter() - start
+
+	overhead = (results["middleware"] - results["bare"]) / args.requests
+	print(f"middleware {args.requests / results['middleware']:10.0f}/s  {overhead * 1e6:6.2f}µs overhead per request")
+
+	hard = ProofOfWork(
+		b"benchmark secret", MemoryBackend(), difficulty=args.difficulty, challenge_ttl=3600, pass_ttl=3600
+	)
+	runs = 5
+	start = time.perf_counter()
+
+	for _ in range(runs):
+		solve(hard.challenge(now), args.difficulty)
+
+	print(
+		f"solve      {(time.perf_counter() - start) / runs * 1e3:8.0f}ms per challenge at {args.difficulty} bits (CPython)"
+	)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
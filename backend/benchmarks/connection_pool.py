@@ -0,0 +1,80 @@
+"""Cold connections vs. reused connections against a local, TLS-less mock of api.spotify.com.
+
+Usage: python -m benchmarks.connection_pool [--requests 2000] [--concurrency 20] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import ClientSession, TCPConnector
+
+from portfolio.lib.util.config import HttpConfig
+from portfolio.lib.util.http import PoolStats, create_session, fetch
+
+from .mock_upstream import MockUpstream
+
+
+async def _drive(session: ClientSession, url: str, requests: int, concurrency: int) -> tuple[float, list[float]]:
+	latencies: list[float] = []
+	remaining = iter(range(requests))
+
+	async def worker() -> None:
+		for _ in remaining:
+			start = time.perf_counter()
+			await fetch(session, "GET", url)
+			latencies.append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+	return time.perf_counter() - start, latencies
+
+
+def _report(name: str, elapsed: float, latencies: list[float], stats: PoolStats) -> None:
+	quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+	host = next(iter(stats.hosts.values()))
+
+	print(
+		f"{name:<8} {len(latencies) / elapsed:8.0f} req/s "
+		f"p50={quantiles[49] * 1000:6.2f}ms p99={quantiles[98] * 1000:6.2f}ms "
+		f"created={host.connections_created:<5} reused={host.connections_reused:<5} "
+		f"reuse ratio={host.reuse_ratio or 0:.2f} waited={host.queued}"
+	)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--requests", type=int, default=2000)
+	parser.add_argument("--concurrency", type=int, default=20)
+	parser.add_argument("--latency", type=float, default=0.005, help="mock upstream latency in seconds")
+	args = parser.parse_args()
+
+	upstream = MockUpstream(latency=args.latency)
+	await upstream.start()
+
+	url = upstream.url + "/v1/me/player/currently-playing"
+	config = HttpConfig(limit_per_host=args.concurrency)
+
+	try:
+		# a new connection per request, like a session without keep-alive
+		cold_stats = PoolStats()
+		cold = ClientSession(
+			connector=TCPConnector(force_close=True, limit_per_host=args.concurrency),
+			trace_configs=[cold_stats.trace_config()],
+		)
+		async with cold:
+			elapsed, latencies = await _drive(cold, url, args.requests, args.concurrency)
+		_report("cold", elapsed, latencies, cold_stats)
+
+		reused_stats = PoolStats()
+		async with create_session(config, reused_stats) as reused:
+			elapsed, latencies = await _drive(reused, url, args.requests, args.concurrency)
+		_report("reused", elapsed, latencies, reused_stats)
+	finally:
+		await upstream.stop()
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
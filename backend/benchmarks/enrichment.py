@@ -0,0 +1,107 @@
+"""Per request cost of working out the client: GeoIP lookups, user agent classification and both together.
+
+The GeoIP table is generated, `--ranges` random IPv4 and IPv6 ranges (DB-IP's
+country table has about 600k), and written to a temporary file that is then mapped
+like the real one.
+
+Usage: python -m benchmarks.enrichment [--ranges 600000] [--requests 200000]
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import tempfile
+import time
+
+from portfolio.lib.analytics.enrich import Enricher
+from portfolio.lib.analytics.events import classify_user_agent
+from portfolio.lib.util.geoip import GeoIP, write_database
+
+_COUNTRIES = ("US", "DE", "FR", "GB", "JP", "CN", "BR", "IN", "TR", "AU", "CA", "NL")
+
+_USER_AGENTS = [
+	"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{} Safari/537.36",
+	"Mozilla/5.0 (iPhone; CPU iPhone OS 17_{} like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+	"Mozilla/5.0 (Linux; Android 14; Pixel {}) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36",
+	"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_{}) AppleWebKit/605.1.15 Version/17.5 Safari/605.1.15",
+]
+
+
+def _rows(ranges: int) -> list[tuple[str, str, str]]:
+	rows = []
+
+	# adjacent ranges of random countries, so few of them are merged
+	# IPv6 ranges only differ in their first 64 bits, like the real ones
+	for make, bits, shift, count in (
+		(ipaddress.IPv4Address, 32, 0, ranges * 3 // 4),
+		(ipaddress.IPv6Address, 64, 64, ranges // 4),
+	):
+		step = (1 << bits) // count
+
+		for i in range(count):
+			start, end = i * step << shift, (((i + 1) * step) << shift) - 1
+			rows.append((str(make(start)), str(make(end)), random.choice(_COUNTRIES)))
+
+	return rows
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--ranges", type=int, default=600_000)
+	parser.add_argument("--requests", type=int, default=200_000)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "geoip.bin")
+		ipv4, ipv6 = write_database(_rows(args.ranges), path)
+		print(f"table      {ipv4} IPv4 and {ipv6} IPv6 ranges, {os.path.getsize(path) / 2**20:.1f} MiB")
+
+		start = time.perf_counter()
+		geoip = GeoIP(path)
+		print(f"open       {(time.perf_counter() - start) * 1e3:6.2f}ms")
+
+		for name, addresses in (
+			("ipv4", [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(args.requests)]),
+			("ipv6", [str(ipaddress.IPv6Address(random.getrandbits(128))) for _ in range(args.requests)]),
+		):
+			start = time.perf_counter()
+
+			for address in addresses:
+				geoip.country(address)
+
+			elapsed = (time.perf_counter() - start) / len(addresses)
+			print(f"{name}       {elapsed * 1e6:6.2f}µs per lookup")
+
+		# a realistic mix, a few thousand distinct user agents for many requests
+		user_agents = [random.choice(_USER_AGENTS).format(random.randrange(1000)) for _ in range(args.requests)]
+		start = time.perf_counter()
+
+		for user_agent in user_agents:
+			classify_user_agent(user_agent)
+
+		elapsed = (time.perf_counter() - start) / len(user_agents)
+		info = classify_user_agent.cache_info()
+		print(f"user agent {elapsed * 1e6:6.2f}µs per request, {info.hits / (info.hits + info.misses):.0%} cache hits")
+
+		enricher = Enricher(geoip, forwarded_header="X-Forwarded-For")
+		headers = [
+			[
+				(b"user-agent", user_agent.encode()),
+				(b"x-forwarded-for", str(ipaddress.IPv4Address(random.getrandbits(32))).encode()),
+			]
+			for user_agent in user_agents
+		]
+		start = time.perf_counter()
+
+		for scope_headers in headers:
+			enricher.client({"type": "http", "headers": scope_headers, "client": ("127.0.0.1", 1234)})
+
+		elapsed = (time.perf_counter() - start) / len(headers)
+		print(f"enricher   {elapsed * 1e6:6.2f}µs per request")
+
+		geoip.close()
+
+
+if __name__ == "__main__":
+	main()
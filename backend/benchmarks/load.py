@@ -0,0 +1,240 @@
+"""Load test of the whole app against mock upstreams, throughput and latency percentiles per route.
+
+The app runs in uvicorn with a config generated from `config.example.toml`, its
+Spotify and Hardcover clients point at a `MockUpstream`. Clients send requests at a
+fixed concurrency for `--duration` seconds. The results are printed and written as
+JSON, `--compare` prints the change against an earlier result file.
+
+Usage: python -m benchmarks.load [--concurrency 50] [--duration 10] [--latency 0.05]
+                                 [--error-rate 0] [--error-status 503] [--no-cache]
+                                 [--routes /spotify/last-played,...] [--output results.json]
+                                 [--compare baseline.json]
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tomllib
+from collections import defaultdict
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+import toml
+import uvicorn
+from aiohttp import ClientSession, TCPConnector
+from loguru import logger
+
+from .mock_upstream import MockUpstream
+
+_BACKEND = Path(__file__).resolve().parent.parent
+
+DEFAULT_ROUTES = [
+	"/spotify/currently-playing",
+	"/spotify/last-played",
+	"/spotify/top-tracks?limit=10",
+	"/spotify/top-artists?limit=10",
+	"/books/currently-reading",
+	"/dashboard",
+]
+
+
+def _write_config(directory: Path, *, cache: bool) -> None:
+	"""The example config, without the limits a single load generating client would hit."""
+	with open(_BACKEND / "config.example.toml", "rb") as f:
+		config = tomllib.load(f)
+
+	config["rate_limit"]["enabled"] = False
+	config["analytics"]["database"] = str(directory / "analytics.db")
+
+	if not cache:
+		for name, policy in config["cache"].items():
+			if isinstance(policy, dict):
+				config["cache"][name] = {"ttl": 0, "stale_ttl": 0, "error_ttl": 0}
+
+	(directory / "config.dev.toml").write_text(toml.dumps(config))
+
+
+def _git_commit() -> str | None:
+	try:
+		return subprocess.run(
+			["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND, capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def _summary(latencies: list[float], errors: int, elapsed: float) -> dict[str, Any]:
+	quantiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+
+	return {
+		"requests": len(latencies),
+		"errors": errors,
+		"throughput": len(latencies) / elapsed,
+		"p50_ms": quantiles[49] * 1000,
+		"p95_ms": quantiles[94] * 1000,
+		"p99_ms": quantiles[98] * 1000,
+	}
+
+
+async def _drive(
+	base_url: str, routes: list[str], concurrency: int, duration: float
+) -> tuple[float, dict[str, list[float]], dict[str, int]]:
+	latencies: dict[str, list[float]] = defaultdict(list)
+	errors: dict[str, int] = defaultdict(int)
+
+	async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+		# fill the caches and get the access token before measuring
+		for route in routes:
+			async with session.get(base_url + route) as response:
+				await response.read()
+
+		deadline = time.perf_counter() + duration
+
+		async def client(offset: int) -> None:
+			i = offset
+
+			while time.perf_counter() < deadline:
+				route = routes[i % len(routes)]
+				i += 1
+				start = time.perf_counter()
+
+				async with session.get(base_url + route) as response:
+					await response.read()
+
+				latencies[route].append(time.perf_counter() - start)
+
+				if response.status >= 400:
+					errors[route] += 1
+
+		start = time.perf_counter()
+		await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+
+		return time.perf_counter() - start, latencies, errors
+
+
+async def _run(args: argparse.Namespace, directory: Path) -> dict[str, Any]:
+	upstream = MockUpstream(
+		latency=args.latency, error_rate=args.error_rate, error_status=args.error_status, seed=args.seed
+	)
+	await upstream.start()
+
+	# the app reads `config.dev.toml` from the working directory when it's imported
+	_write_config(directory, cache=not args.no_cache)
+	os.chdir(directory)
+	os.environ["DEPLOYMENT_MODE"] = "DEV"
+
+	from portfolio.lib.api.hardcover_api import HardcoverApi
+	from portfolio.lib.api.spotify_api import SpotifyApi
+
+	SpotifyApi.BASE_URL = upstream.url + "/v1"
+	SpotifyApi.AUTH_URL = upstream.url + "/api"
+	HardcoverApi.GRAPHQL_URL = upstream.url + "/v1/graphql"
+
+	app = importlib.import_module("portfolio.main").app
+
+	server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", access_log=False))
+	serving = asyncio.create_task(server.serve())
+
+	try:
+		while not server.started:
+			if serving.done():
+				serving.result()
+
+			await asyncio.sleep(0.01)
+
+		# the app's logger is set up on startup, a line per request would be measured too
+		logger.remove()
+
+		port = server.servers[0].sockets[0].getsockname()[1]
+		elapsed, latencies, errors = await _drive(
+			f"http://127.0.0.1:{port}/api", args.routes, args.concurrency, args.duration
+		)
+	finally:
+		server.should_exit = True
+		await serving
+		await upstream.stop()
+
+	every = [latency for route in args.routes for latency in latencies[route]]
+
+	return {
+		"benchmark": "load",
+		"started_at": datetime.now(UTC).isoformat(timespec="seconds"),
+		"git_commit": _git_commit(),
+		"python": platform.python_version(),
+		"settings": {
+			"concurrency": args.concurrency,
+			"duration": args.duration,
+			"latency": args.latency,
+			"error_rate": args.error_rate,
+			"error_status": args.error_status,
+			"cache": not args.no_cache,
+		},
+		"total": _summary(every, sum(errors.values()), elapsed),
+		"routes": {route: _summary(latencies[route], errors[route], elapsed) for route in args.routes},
+		"upstream": {"calls": dict(upstream.calls), "errors": dict(upstream.errors)},
+	}
+
+
+def _print(result: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+	def change(section: dict[str, Any], name: str, key: str) -> str:
+		before = (baseline or {}).get("routes", {}).get(name) if name != "total" else (baseline or {}).get("total")
+
+		if not before or not before[key]:
+			return ""
+
+		return f" ({(section[key] / before[key] - 1) * 100:+.0f}%)"
+
+	print(f"{'route':32} {'requests':>8} {'errors':>7} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+
+	for name, section in [*result["routes"].items(), ("total", result["total"])]:
+		print(
+			f"{name:32} {section['requests']:8} {section['errors']:7} {section['throughput']:9.1f} "
+			f"{section['p50_ms']:7.2f}ms {section['p95_ms']:7.2f}ms {section['p99_ms']:7.2f}ms"
+			+ (
+				f"   req/s{change(section, name, 'throughput')} p95{change(section, name, 'p95_ms')}"
+				if baseline
+				else ""
+			)
+		)
+
+	print(f"upstream calls {result['upstream']['calls']} injected errors {result['upstream']['errors']}")
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--concurrency", type=int, default=50)
+	parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+	parser.add_argument("--latency", type=float, default=0.05, help="mock upstream latency in seconds")
+	parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests that fail")
+	parser.add_argument("--error-status", type=int, default=503, help="status of the failed upstream requests")
+	parser.add_argument("--seed", type=int, default=None, help="seed of the injected errors")
+	parser.add_argument("--no-cache", action="store_true", help="every request goes to the upstreams")
+	parser.add_argument("--routes", type=lambda value: value.split(","), default=DEFAULT_ROUTES)
+	parser.add_argument("--output", type=Path, help="result file, benchmarks/results/load-<time>.json by default")
+	parser.add_argument("--compare", type=Path, help="an earlier result file to compare with")
+	args = parser.parse_args()
+
+	output = args.output or _BACKEND / "benchmarks" / "results" / f"load-{datetime.now():%Y%m%d-%H%M%S}.json"
+	output = output.resolve()
+	baseline = json.loads(args.compare.read_text()) if args.compare else None
+
+	with tempfile.TemporaryDirectory() as directory:
+		result = await _run(args, Path(directory))
+
+	output.parent.mkdir(parents=True, exist_ok=True)
+	output.write_text(json.dumps(result, indent=2) + "\n")
+
+	_print(result, baseline)
+	print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
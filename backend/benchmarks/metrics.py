@@ -0,0 +1,79 @@
+"""Cost of recording a metric and per request overhead of the metrics middleware.
+
+Usage: python -m benchmarks.metrics [--observations 1000000] [--requests 200000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+from portfolio.lib.middleware.metrics import MetricsMiddleware
+from portfolio.lib.util.metrics import Histogram
+
+
+async def _endpoint(scope, receive, send) -> None:
+	await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+	await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive() -> dict:
+	return {"type": "http.request", "body": b""}
+
+
+async def _send(message) -> None:
+	pass
+
+
+def _scope(route: str) -> dict:
+	return {
+		"type": "http",
+		"method": "GET",
+		"path": route,
+		"root_path": "",
+		"query_string": b"",
+		"headers": [],
+		"client": ("127.0.0.1", 1234),
+		# set by the router in the app
+		"route": SimpleNamespace(path=route),
+	}
+
+
+async def _per_request(app, scopes: list[dict]) -> float:
+	start = time.perf_counter()
+
+	for scope in scopes:
+		await app(dict(scope), _receive, _send)
+
+	return (time.perf_counter() - start) / len(scopes)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--observations", type=int, default=1_000_000)
+	parser.add_argument("--requests", type=int, default=200_000)
+	args = parser.parse_args()
+
+	histogram = Histogram("bench_seconds", "benchmark", ("route", "method", "status"))
+	labels = [("/spotify/top-{type}", "GET", status) for status in ("200", "304", "429", "502")]
+	values = [(random.choice(labels), random.expovariate(20)) for _ in range(args.observations)]
+
+	start = time.perf_counter()
+	for label, value in values:
+		histogram.observe(label, value)
+	elapsed = (time.perf_counter() - start) / len(values)
+
+	print(f"histogram  observe     {elapsed * 1e6:6.3f}µs per observation")
+
+	routes = ["/spotify/top-{type}", "/spotify/currently-playing", "/books/currently-reading"]
+	scopes = [_scope(random.choice(routes)) for _ in range(args.requests)]
+
+	baseline = await _per_request(_endpoint, scopes)
+	instrumented = await _per_request(MetricsMiddleware(_endpoint), scopes)
+
+	print(f"middleware MetricsMiddleware {(instrumented - baseline) * 1e6:6.3f}µs overhead per request")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
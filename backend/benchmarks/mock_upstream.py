@@ -0,0 +1,125 @@
+"""Local stand-ins for the upstream apis, used by the benchmarks."""
+
+import asyncio
+import random
+from collections import Counter
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+
+@dataclass
+class MockUpstream:
+	"""An aiohttp server that answers like `api.spotify.com`, `accounts.spotify.com` and Hardcover.
+
+	Every request sleeps for `latency` seconds before responding, and `calls` counts
+	the requests per route so benchmarks can report upstream load. A share `error_rate`
+	of the requests (picked at random, reproducible with `seed`) is answered with
+	`error_status` instead, and counted in `errors`.
+	"""
+
+	latency: float = 0.05
+	error_rate: float = 0.0
+	error_status: int = 503
+	seed: int | None = None
+	host: str = "127.0.0.1"
+	port: int = 0
+	calls: Counter = field(default_factory=Counter)
+	errors: Counter = field(default_factory=Counter)
+
+	_random: random.Random = field(default_factory=random.Random)
+
+	_runner: web.AppRunner | None = None
+
+	@property
+	def url(self) -> str:
+		return f"http://{self.host}:{self.port}"
+
+	async def start(self) -> None:
+		self._random.seed(self.seed)
+
+		app = web.Application()
+		app.router.add_post("/api/token", self._token)
+		app.router.add_get("/v1/me/player/currently-playing", self._currently_playing)
+		app.router.add_get("/v1/me/player/recently-played", self._recently_played)
+		app.router.add_get("/v1/me/top/{type}", self._top)
+		app.router.add_post("/v1/graphql", self._graphql)
+
+		self._runner = web.AppRunner(app, access_log=None)
+		await self._runner.setup()
+
+		site = web.TCPSite(self._runner, self.host, self.port)
+		await site.start()
+
+		# resolve the port if an ephemeral one was requested
+		self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+	async def stop(self) -> None:
+		if self._runner:
+			await self._runner.cleanup()
+
+	async def _respond(self, name: str, payload: dict, *, inject_errors: bool = True) -> web.Response:
+		self.calls[name] += 1
+		await asyncio.sleep(self.latency)
+
+		if inject_errors and self.error_rate and self._random.random() < self.error_rate:
+			self.errors[name] += 1
+			return web.json_response(
+				{"error": {"status": self.error_status, "message": "injected error"}}, status=self.error_status
+			)
+
+		return web.json_response(payload)
+
+	async def _token(self, request: web.Request) -> web.Response:
+		# the token endpoint never fails, the app couldn't start otherwise
+		return await self._respond("token", {"access_token": "mock-token", "expires_in": 3600}, inject_errors=False)
+
+	async def _currently_playing(self, request: web.Request) -> web.Response:
+		return await self._respond("currently-playing", {"is_playing": True, "progress_ms": 1000, "item": _track(0)})
+
+	async def _recently_played(self, request: web.Request) -> web.Response:
+		limit = int(request.query.get("limit", 20))
+		items = [{"track": _track(i), "played_at": f"2026-01-01T00:{i:02}:00.000Z"} for i in range(limit)]
+		return await self._respond("recently-played", {"items": items, "cursors": {"after": "0", "before": "0"}})
+
+	async def _top(self, request: web.Request) -> web.Response:
+		limit = int(request.query.get("limit", 20))
+
+		if request.match_info["type"] == "tracks":
+			items = [_track(i) for i in range(limit)]
+		else:
+			items = [_artist(i) for i in range(limit)]
+
+		return await self._respond(f"top-{request.match_info['type']}", {"items": items})
+
+	async def _graphql(self, request: web.Request) -> web.Response:
+		user_book = {
+			"book": {
+				"id": 1,
+				"title": "Mock Book",
+				"pages": 320,
+				"slug": "mock-book",
+				"image": {"url": "https://assets.hardcover.app/mock.jpg", "color": "#336699"},
+				"contributions": [{"author": {"name": "Mock Author"}}],
+			},
+			"user_book_reads": [{"progress": 42.0}],
+		}
+		return await self._respond("graphql", {"data": {"me": [{"user_books": [user_book]}]}})
+
+
+def _track(i: int) -> dict:
+	return {
+		"name": f"Track {i}",
+		"duration_ms": 180_000 + i,
+		"uri": f"spotify:track:track{i}",
+		"album": {"name": f"Album {i}", "images": [{"url": f"https://i.scdn.co/image/album{i}"}]},
+		"artists": [{"name": f"Artist {i}"}, {"name": "Featured Artist"}],
+	}
+
+
+def _artist(i: int) -> dict:
+	return {
+		"name": f"Artist {i}",
+		"uri": f"spotify:artist:artist{i}",
+		"images": [{"url": f"https://i.scdn.co/image/artist{i}"}],
+	}
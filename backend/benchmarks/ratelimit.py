@@ -0,0 +1,87 @@
+"""Per request overhead of the rate limiting middleware and of the bare limiters.
+
+Usage: python -m benchmarks.ratelimit [--requests 200000] [--clients 10000]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from portfolio.lib.middleware.ratelimit import RateLimitMiddleware
+from portfolio.lib.util.config import RateLimitRule
+from portfolio.lib.util.ratelimit import SlidingWindowLog, TokenBucket
+
+
+async def _app(scope, receive, send) -> None:
+	await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+	await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive() -> dict:
+	return {"type": "http.request", "body": b""}
+
+
+async def _send(message) -> None:
+	pass
+
+
+def _scopes(clients: int, requests: int) -> list[dict]:
+	ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(clients)]
+
+	return [
+		{
+			"type": "http",
+			"method": "GET",
+			"path": "/spotify/top-tracks",
+			"root_path": "",
+			"query_string": b"",
+			"headers": [(b"x-forwarded-for", random.choice(ips).encode())],
+			"client": ("127.0.0.1", 1234),
+		}
+		for _ in range(requests)
+	]
+
+
+async def _per_request(app, scopes: list[dict]) -> float:
+	start = time.perf_counter()
+
+	for scope in scopes:
+		await app(scope, _receive, _send)
+
+	return (time.perf_counter() - start) / len(scopes)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--requests", type=int, default=200_000)
+	parser.add_argument("--clients", type=int, default=10_000)
+	args = parser.parse_args()
+
+	scopes = _scopes(args.clients, args.requests)
+	baseline = await _per_request(_app, scopes)
+
+	for algorithm in ("token_bucket", "sliding_window"):
+		middleware = RateLimitMiddleware(
+			_app,
+			rules=[RateLimitRule(prefix="/spotify/", algorithm=algorithm, limit=60, window=60)],
+			max_keys=100_000,
+			forwarded_header="X-Forwarded-For",
+		)
+		elapsed = await _per_request(middleware, scopes)
+		print(f"middleware {algorithm:<15} {(elapsed - baseline) * 1e6:6.2f}µs overhead per request")
+
+	keys = [f"client-{random.randrange(args.clients)}" for _ in range(args.requests)]
+
+	for limiter in (TokenBucket(60, 60, 100_000), SlidingWindowLog(60, 60, 100_000)):
+		start = time.perf_counter()
+
+		for key in keys:
+			limiter.hit(key, time.monotonic())
+
+		elapsed = (time.perf_counter() - start) / len(keys)
+		print(f"limiter    {type(limiter).__name__:<15} {elapsed * 1e6:6.2f}µs per hit, {len(limiter)} keys")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
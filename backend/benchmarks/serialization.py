@@ -0,0 +1,237 @@
+"""FastAPI's response model validation and serialization vs the cached JSON of the models, per endpoint.
+
+`serve` is the cost of a request through the app once the models are cached,
+`encode` the cost of encoding the models the first time (after a cache refresh)
+with the json module and with orjson.
+
+Usage: python -m benchmarks.serialization [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Callable
+from typing import Any
+
+from fastapi import FastAPI
+
+from portfolio.lib.api.hardcover_api import HardcoverBook
+from portfolio.lib.api.spotify_api import TopArtist, Track
+from portfolio.lib.util import encoding
+from portfolio.lib.util.encoding import CachedJsonModel, dumps, json_response
+from portfolio.routers.dashboard import Dashboard
+
+from .mock_upstream import _artist, _track
+
+
+def _track_fields(item: dict, **extra: Any) -> dict:
+	return {
+		"name": item["name"],
+		"album_name": item["album"]["name"],
+		"album_image": item["album"]["images"][0]["url"],
+		"artists": [artist["name"] for artist in item["artists"]],
+		"track_url": f"https://open.spotify.com/track/{item['uri'].split(':')[2]}",
+		**extra,
+	}
+
+
+def _artist_fields(item: dict) -> dict:
+	return {
+		"name": item["name"],
+		"url": f"https://open.spotify.com/artist/{item['uri'].split(':')[2]}",
+		"image": item["images"][0]["url"],
+	}
+
+
+_BOOK = {
+	"title": "Mock Book",
+	"author": "Mock Author",
+	"pages": 320,
+	"image_url": "https://assets.hardcover.app/mock.jpg",
+	"image_dominant_color": "#336699",
+	"progress": 42.0,
+	"link": "https://hardcover.app/books/mock-book",
+}
+
+
+Build = Callable[[type[CachedJsonModel], dict], Any]
+
+
+def _playing(build: Build) -> Any:
+	return build(Track, _track_fields(_track(0), is_playing=True, progress_ms=1000, duration_ms=180_000))
+
+
+def _top_tracks(build: Build, limit: int = 50) -> list[Any]:
+	return [build(Track, _track_fields(_track(i))) for i in range(limit)]
+
+
+def _top_artists(build: Build, limit: int = 50) -> list[Any]:
+	return [build(TopArtist, _artist_fields(_artist(i))) for i in range(limit)]
+
+
+def _book(build: Build) -> Any:
+	return build(HardcoverBook, _BOOK)
+
+
+# what each endpoint builds from the upstream responses
+_ENDPOINTS: dict[str, Callable[[Build], Any]] = {
+	"currently-playing": _playing,
+	"last-played": lambda build: build(Track, _track_fields(_track(1))),
+	"top-tracks?limit=50": _top_tracks,
+	"top-artists?limit=50": _top_artists,
+	"books/currently-reading": _book,
+	"dashboard": lambda build: {
+		"currently_playing": _playing(build),
+		"last_played": build(Track, _track_fields(_track(1))),
+		"top_tracks": _top_tracks(build, 10),
+		"top_artists": _top_artists(build, 10),
+		"currently_reading": _book(build),
+		"errors": {},
+	},
+}
+
+
+def _build(model: type[CachedJsonModel], fields: dict) -> CachedJsonModel:
+	return model(**fields)
+
+
+_RESPONSE_MODELS: dict[str, Any] = {
+	"currently-playing": Track | None,
+	"last-played": Track | None,
+	"top-tracks?limit=50": list[Track] | list[TopArtist] | None,
+	"top-artists?limit=50": list[Track] | list[TopArtist] | None,
+	"books/currently-reading": HardcoverBook | None,
+	"dashboard": Dashboard,
+}
+
+
+def _endpoint(value: Any, fast: bool) -> Callable[[], Any]:
+	if fast:
+
+		async def endpoint():
+			return json_response(value)
+	else:
+
+		async def endpoint():
+			return value
+
+	return endpoint
+
+
+def _app(fast: bool) -> FastAPI:
+	"""One route per endpoint with the response model of the real route."""
+	app = FastAPI()
+
+	for name, endpoint_values in _ENDPOINTS.items():
+		value = endpoint_values(_build)
+
+		if name == "dashboard" and not fast:
+			value = Dashboard(**value)
+
+		app.add_api_route(f"/{name.split('?')[0]}", _endpoint(value, fast), response_model=_RESPONSE_MODELS[name])
+
+	return app
+
+
+async def _serve(app: FastAPI, path: str, requests: int) -> float:
+	scope = {
+		"type": "http",
+		"asgi": {"version": "3.0"},
+		"http_version": "1.1",
+		"method": "GET",
+		"scheme": "http",
+		"path": path,
+		"raw_path": path.encode(),
+		"root_path": "",
+		"query_string": b"",
+		"headers": [],
+		"client": ("127.0.0.1", 1234),
+		"server": ("127.0.0.1", 8000),
+	}
+	body = b""
+
+	async def receive() -> dict:
+		return {"type": "http.request", "body": b""}
+
+	async def send(message: dict) -> None:
+		nonlocal body
+
+		if message["type"] == "http.response.body":
+			body = message["body"]
+
+	start = time.perf_counter()
+
+	for _ in range(requests):
+		await app(dict(scope), receive, send)
+
+	elapsed = (time.perf_counter() - start) / requests
+	assert body, path
+
+	return elapsed
+
+
+def _plain(value: Any) -> Any:
+	if isinstance(value, CachedJsonModel):
+		return value.plain()
+
+	if isinstance(value, dict):
+		return {key: _plain(item) for key, item in value.items()}
+
+	if isinstance(value, list):
+		return [_plain(item) for item in value]
+
+	return value
+
+
+def _encode(value: Any, runs: int, use_orjson: bool) -> float:
+	plain = _plain(value)
+	installed = encoding.orjson
+
+	if use_orjson and installed is None:
+		return float("nan")
+
+	encoding.orjson = installed if use_orjson else None
+
+	try:
+		start = time.perf_counter()
+
+		for _ in range(runs):
+			dumps(plain)
+
+		return (time.perf_counter() - start) / runs
+	finally:
+		encoding.orjson = installed
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--requests", type=int, default=5000)
+	args = parser.parse_args()
+
+	print(f"{'endpoint':24} {'serve before':>13} {'after':>9} {'speedup':>8}   {'encode json':>12} {'orjson':>9}")
+
+	before = _app(fast=False)
+	after = _app(fast=True)
+
+	for name, endpoint_values in _ENDPOINTS.items():
+		path = "/" + name.split("?")[0]
+
+		# warm up, the first request through the fast app encodes the models
+		await _serve(before, path, 10)
+		await _serve(after, path, 10)
+
+		serve_before = await _serve(before, path, args.requests)
+		serve_after = await _serve(after, path, args.requests)
+
+		value = endpoint_values(_build)
+		encode_json = _encode(value, args.requests, use_orjson=False)
+		encode_orjson = _encode(value, args.requests, use_orjson=True)
+
+		print(
+			f"{name:24} {serve_before * 1e6:11.1f}µs {serve_after * 1e6:7.1f}µs {serve_before / serve_after:7.1f}x"
+			f"   {encode_json * 1e6:10.1f}µs {encode_orjson * 1e6:7.1f}µs"
+		)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,134 @@
+"""Memory per live session and per request cost of the session middleware, with a million sessions.
+
+`memory` is what the memory store (records, ids and the timing wheel) takes per
+session, measured with tracemalloc. The per request costs are for a request with a
+valid cookie: the signature check alone, the store lookup and update, and the whole
+middleware over a bare app.
+
+Usage: python -m benchmarks.sessions [--sessions 1000000] [--requests 200000]
+"""
+
+import argparse
+import asyncio
+import gc
+import hashlib
+import random
+import time
+import tracemalloc
+
+from portfolio.lib.analytics.enrich import Enricher
+from portfolio.lib.middleware.session import SessionMiddleware
+from portfolio.lib.sessions.session import ID_SIZE, Session, SessionSigner
+from portfolio.lib.sessions.store import MemorySessionStore
+
+_TTL = 30 * 24 * 60 * 60
+
+
+async def _app(scope, receive, send) -> None:
+	await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+	await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def _receive() -> dict:
+	return {"type": "http.request", "body": b""}
+
+
+async def _send(message) -> None:
+	pass
+
+
+def _id(i: int) -> bytes:
+	# derived from the index instead of random, so the benchmark doesn't need to keep a list of them
+	return hashlib.blake2b(i.to_bytes(8, "big"), digest_size=ID_SIZE).digest()
+
+
+async def _fill(store: MemorySessionStore, sessions: int, now: int) -> None:
+	for i in range(sessions):
+		# one a second back from now, so they land in many buckets of the wheel
+		session = Session.new(now - i, f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", "desktop", "DE")
+		session.id = _id(i)
+		await store.save(session)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--sessions", type=int, default=1_000_000)
+	parser.add_argument("--requests", type=int, default=200_000)
+	args = parser.parse_args()
+
+	now = int(time.time())
+	signer = SessionSigner(b"benchmark secret")
+
+	gc.collect()
+	tracemalloc.start()
+	store = MemorySessionStore(_TTL, max_sessions=args.sessions, now=now)
+	start = time.perf_counter()
+	await _fill(store, args.sessions, now)
+	created = time.perf_counter() - start
+	memory = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+
+	print(f"{args.sessions} sessions created in {created:.1f}s ({created / args.sessions * 1e6:.2f}µs each)")
+	print(f"memory     {memory / args.sessions:6.0f} bytes per session, {memory / 2**20:.0f} MiB in total")
+
+	cookies = [signer.sign(_id(random.randrange(args.sessions))).encode() for _ in range(args.requests)]
+
+	start = time.perf_counter()
+
+	for cookie in cookies:
+		signer.verify(cookie)
+
+	elapsed = (time.perf_counter() - start) / len(cookies)
+	print(f"verify     {elapsed * 1e6:6.2f}µs per cookie")
+
+	verified = [signer.verify(cookie) for cookie in cookies]
+	start = time.perf_counter()
+
+	for id in verified:
+		session = await store.get(id, now)
+		session.last_seen = now
+		session.requests += 1
+		await store.save(session)
+
+	elapsed = (time.perf_counter() - start) / len(verified)
+	print(f"store      {elapsed * 1e6:6.2f}µs per lookup and update")
+
+	middleware = SessionMiddleware(_app, store=store, signer=signer, enricher=Enricher(), paths=["/"], secure=True)
+	# the first request expires the store
+	await middleware({"type": "http", "path": "/", "headers": []}, _receive, _send)
+
+	scopes = [
+		{
+			"type": "http",
+			"path": "/spotify/top-tracks",
+			"root_path": "",
+			"headers": [(b"user-agent", b"Mozilla/5.0"), (b"cookie", b"theme=dark; session=" + cookie)],
+			"client": ("127.0.0.1", 1234),
+		}
+		for cookie in cookies
+	]
+
+	baseline = time.perf_counter()
+
+	for scope in scopes:
+		await _app(scope, _receive, _send)
+
+	baseline = time.perf_counter() - baseline
+	start = time.perf_counter()
+
+	for scope in scopes:
+		await middleware(scope, _receive, _send)
+
+	elapsed = time.perf_counter() - start - baseline
+	print(f"middleware {elapsed / len(scopes) * 1e6:6.2f}µs overhead per request")
+
+	# the tenth of the sessions seen longest ago (and not used above) are past the ttl
+	later = now + _TTL - args.sessions * 9 // 10
+	start = time.perf_counter()
+	expired = await store.expire(later)
+	elapsed = time.perf_counter() - start
+	print(f"expire     {elapsed * 1e3:6.1f}ms for {expired} expired sessions, {await store.count()} left")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Upstream call count and latency of concurrent identical calls, with and without single-flight.
+
+Usage: python -m benchmarks.singleflight [--concurrency 200] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from portfolio.lib.api.hardcover_api import HardcoverApi
+from portfolio.lib.api.spotify_api import SpotifyApi
+from portfolio.lib.util.config import ApiConfig, Config, HardcoverConfig, SpotifyConfig
+
+from .mock_upstream import MockUpstream
+
+
+class _NoCoalescing:
+	"""Drop-in for `SingleFlight` that runs every call on its own, i.e. the old behaviour."""
+
+	async def do(self, key, fn):
+		return await fn()
+
+
+def _config() -> Config:
+	return Config(
+		spotify=SpotifyConfig(client_id="id", client_secret="secret", refresh_token="refresh"),
+		hardcover=HardcoverConfig(user_id="1", api_token="token"),
+		api=ApiConfig(allowed_origins=("*",)),
+	)
+
+
+def _percentile(samples: list[float], q: float) -> float:
+	return statistics.quantiles(samples, n=100, method="inclusive")[q - 1] if len(samples) > 1 else samples[0]
+
+
+async def _run(upstream: MockUpstream, concurrency: int, coalesce: bool) -> None:
+	spotify = SpotifyApi(_config())
+	hardcover = HardcoverApi(_config())
+
+	SpotifyApi.BASE_URL = upstream.url + "/v1"
+	SpotifyApi.AUTH_URL = upstream.url + "/api"
+	HardcoverApi.GRAPHQL_URL = upstream.url + "/v1/graphql"
+
+	if not coalesce:
+		spotify.inflight = _NoCoalescing()  # type: ignore
+		hardcover.inflight = _NoCoalescing()  # type: ignore
+
+	async with ClientSession() as session:
+		# get the access token out of the way, it's not what we measure here
+		await spotify.token.get(session)
+
+		for name, call in [
+			("spotify currently-playing", lambda: spotify.get_currently_playing(session)),
+			("hardcover currently-reading", lambda: hardcover.get_currently_reading_book(session)),
+		]:
+			upstream.calls.clear()
+
+			async def timed(call=call) -> float:
+				start = time.perf_counter()
+				await call()
+				return time.perf_counter() - start
+
+			latencies = await asyncio.gather(*(timed() for _ in range(concurrency)))
+
+			print(
+				f"{'single-flight' if coalesce else 'no coalescing':<14} {name:<28} "
+				f"upstream calls={sum(upstream.calls.values()):<4} "
+				f"p50={_percentile(latencies, 50) * 1000:7.2f}ms "
+				f"p99={_percentile(latencies, 99) * 1000:7.2f}ms"
+			)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--concurrency", type=int, default=200)
+	parser.add_argument("--latency", type=float, default=0.05, help="mock upstream latency in seconds")
+	args = parser.parse_args()
+
+	logger.remove()
+
+	upstream = MockUpstream(latency=args.latency)
+	await upstream.start()
+
+	try:
+		await _run(upstream, args.concurrency, coalesce=False)
+		await _run(upstream, args.concurrency, coalesce=True)
+	finally:
+		await upstream.stop()
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
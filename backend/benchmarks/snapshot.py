@@ -0,0 +1,82 @@
+"""Cost of the warm start snapshot and what it saves the first request after a restart.
+
+A fake api client with `--latency` seconds of upstream latency fills the cache with
+`--entries` entries of a few KB each. `save` and `restore` are the time to write
+and read back the encrypted snapshot, `cold` and `warm` the latency of the first
+request of a fresh process without and with the snapshot.
+
+Usage: python -m benchmarks.snapshot [--entries 200] [--latency 0.2]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from portfolio.lib.util.cache import SwrCache, cached
+from portfolio.lib.util.config import CachePolicy
+from portfolio.lib.util.snapshot import Snapshot
+
+_POLICIES = {"top_items": CachePolicy(ttl=60 * 60, stale_ttl=60 * 60, error_ttl=24 * 60 * 60)}
+
+
+class _Api:
+	def __init__(self, cache: SwrCache, latency: float) -> None:
+		self.cache = cache
+		self._latency = latency
+
+	@cached("top_items")
+	async def get_items(self, session, *, page: int) -> list[dict[str, str | int]]:
+		await asyncio.sleep(self._latency)
+
+		return [
+			{"name": f"Track {page}.{i}", "artists": "Some Artist, Another One", "duration_ms": 200_000}
+			for i in range(50)
+		]
+
+
+def _snapshot(path: str, cache: SwrCache, api: _Api) -> Snapshot:
+	return Snapshot(path, b"benchmark secret", cache=cache, tokens={}, owners=[api], interval=60)
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--entries", type=int, default=200)
+	parser.add_argument("--latency", type=float, default=0.2, help="upstream latency in seconds")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "snapshot.bin")
+
+		cache = SwrCache(args.entries, _POLICIES)
+		api = _Api(cache, args.latency)
+		await asyncio.gather(*(api.get_items(None, page=page) for page in range(args.entries)))
+
+		snapshot = _snapshot(path, cache, api)
+		# the key is derived once per process, not per save
+		await snapshot.save()
+		start = time.perf_counter()
+		await snapshot.save()
+		elapsed = time.perf_counter() - start
+		print(f"save       {elapsed * 1e3:7.1f}ms for {args.entries} entries, {os.path.getsize(path) / 2**10:.0f} KiB")
+
+		cold = _Api(SwrCache(args.entries, _POLICIES), args.latency)
+		start = time.perf_counter()
+		await cold.get_items(None, page=0)
+		print(f"cold       {(time.perf_counter() - start) * 1e3:7.1f}ms first request")
+
+		cache = SwrCache(args.entries, _POLICIES)
+		warm = _Api(cache, args.latency)
+		snapshot = _snapshot(path, cache, warm)
+		start = time.perf_counter()
+		await snapshot.restore(None)
+		print(f"restore    {(time.perf_counter() - start) * 1e3:7.1f}ms, including the key derivation")
+
+		start = time.perf_counter()
+		await warm.get_items(None, page=0)
+		print(f"warm       {(time.perf_counter() - start) * 1e3:7.1f}ms first request")
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
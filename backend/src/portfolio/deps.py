@@ -1,13 +1,33 @@
+import secrets
+import time
 from functools import lru_cache
 from os import environ
 from typing import Annotated, Literal
 
 from aiohttp import ClientSession
 from fastapi import Depends
+from loguru import logger
 
+from .lib.analytics.enrich import Enricher
+from .lib.analytics.pipeline import AnalyticsPipeline
 from .lib.api.hardcover_api import HardcoverApi
 from .lib.api.spotify_api import SpotifyApi
+from .lib.api.spotify_poller import CurrentlyPlayingPoller
+from .lib.history.recorder import HistoryRecorder
+from .lib.images.colors import DominantColors
+from .lib.images.proxy import ImageProxy
+from .lib.sessions.session import SessionSigner
+from .lib.sessions.store import MemorySessionStore, SessionStore
+from .lib.store.base import StoreBackend
+from .lib.store.memory import MemoryBackend
+from .lib.util.blocklist import Blocklist
+from .lib.util.cache import SwrCache
+from .lib.util.challenge import ProofOfWork
 from .lib.util.config import Config, load_config
+from .lib.util.geoip import GeoIP
+from .lib.util.http import PoolStats, create_session
+from .lib.util.profiler import RequestProfiler
+from .lib.util.snapshot import Snapshot
 
 
 # Config Management
@@ -25,10 +45,31 @@ def get_config() -> Config:
 	return load_config(mode)  # type: ignore
 
 
+@lru_cache
+def get_blocklist() -> Blocklist:
+	"""Singleton provider for the blocklist, loaded with the configured networks."""
+	config = get_config().blocklist
+	blocklist = Blocklist()
+
+	for network in config.networks:
+		blocklist.add(network)
+
+	if config.file is not None:
+		with open(config.file) as f:
+			for line in f:
+				network = line.split("#", 1)[0].strip()
+
+				if network:
+					blocklist.add(network)
+
+	return blocklist
+
+
 # Session Management
 class ClientSessionManager:
 	def __init__(self):
 		self._session: ClientSession | None = None
+		self.pool_stats = PoolStats()
 
 	def __call__(self) -> ClientSession:
 		if self._session is None:
@@ -37,7 +78,7 @@ class ClientSessionManager:
 
 	async def init(self):
 		if self._session is None:
-			self._session = ClientSession()
+			self._session = create_session(get_config().http, self.pool_stats)
 
 	async def close(self):
 		if self._session:
@@ -48,18 +89,170 @@ class ClientSessionManager:
 get_client_session = ClientSessionManager()
 
 
+@lru_cache
+def get_store() -> StoreBackend:
+	"""Singleton provider for the backend shared by every worker."""
+	config = get_config()
+
+	if config.store.backend == "redis":
+		# redis is an optional dependency, only import it when it's configured
+		from .lib.store.redis import RedisBackend
+
+		return RedisBackend.from_url(config.store.redis_url, key_prefix=config.store.key_prefix)
+
+	return MemoryBackend()
+
+
+@lru_cache
+def get_session_store() -> SessionStore:
+	"""Singleton provider for the browser sessions."""
+	config = get_config()
+
+	if config.sessions.backend == "redis":
+		# redis is an optional dependency, only import it when it's configured
+		from .lib.sessions.redis import RedisSessionStore
+
+		return RedisSessionStore.from_url(
+			config.store.redis_url, config.sessions.ttl, key_prefix=config.store.key_prefix
+		)
+
+	return MemorySessionStore(config.sessions.ttl, max_sessions=config.sessions.max_sessions, now=int(time.time()))
+
+
+@lru_cache
+def get_session_signer() -> SessionSigner:
+	"""Singleton provider for the signer of the session cookies."""
+	config = get_config()
+
+	if config.sessions.secret is None:
+		logger.warning("No [sessions] secret is set, the sessions won't survive a restart")
+		return SessionSigner(secrets.token_bytes(32))
+
+	return SessionSigner(config.sessions.secret.encode())
+
+
+@lru_cache
+def get_proof_of_work() -> ProofOfWork:
+	"""Singleton provider for the proof of work challenges and passes."""
+	config = get_config()
+
+	if config.challenge.secret is None:
+		logger.warning("No [challenge] secret is set, the passes won't survive a restart")
+
+	return ProofOfWork(
+		config.challenge.secret.encode() if config.challenge.secret is not None else secrets.token_bytes(32),
+		get_store(),
+		difficulty=config.challenge.difficulty,
+		challenge_ttl=config.challenge.challenge_ttl,
+		pass_ttl=config.challenge.pass_ttl,
+	)
+
+
+@lru_cache
+def get_response_cache() -> SwrCache:
+	"""Singleton provider for the upstream response cache shared by the api clients."""
+	config = get_config()
+	return SwrCache.from_config(config.cache, get_store())
+
+
+@lru_cache
+def get_image_proxy() -> ImageProxy:
+	"""Singleton provider for the proxy of the album art and book covers."""
+	config = get_config()
+	return ImageProxy(config.images)
+
+
+@lru_cache
+def get_dominant_colors() -> DominantColors:
+	"""Singleton provider for the dominant colors of the album art and artist images."""
+	config = get_config()
+	return DominantColors(config.colors)
+
+
 @lru_cache
 def _get_spotify_api() -> SpotifyApi:
 	"""Singleton provider for SpotifyApi."""
 	config = get_config()
-	return SpotifyApi(config)
+	images = get_image_proxy() if config.images.enabled else None
+	colors = get_dominant_colors() if config.colors.enabled else None
+	return SpotifyApi(config, get_response_cache(), get_store(), images, colors)
 
 
 @lru_cache
 def _get_hardcover_api() -> HardcoverApi:
 	"""Singleton provider for HardcoverApi."""
 	config = get_config()
-	return HardcoverApi(config)
+	images = get_image_proxy() if config.images.enabled else None
+	return HardcoverApi(config, get_response_cache(), images)
+
+
+@lru_cache
+def get_snapshot() -> Snapshot:
+	"""Singleton provider for the warm start snapshot of the upstream data."""
+	config = get_config().snapshot
+
+	if config.secret is None:
+		raise ValueError("[snapshot] needs a secret, the snapshot holds the access token")
+
+	spotify = _get_spotify_api()
+
+	return Snapshot(
+		config.path,
+		config.secret.encode(),
+		cache=get_response_cache(),
+		tokens={"spotify": spotify.token},
+		owners=[spotify, _get_hardcover_api()],
+		interval=config.save_interval,
+		lock_store=get_store(),
+	)
+
+
+@lru_cache
+def get_currently_playing_poller() -> CurrentlyPlayingPoller:
+	"""Singleton provider for the poller behind the currently playing stream."""
+	config = get_config()
+	return CurrentlyPlayingPoller(_get_spotify_api(), config.stream)
+
+
+@lru_cache
+def get_history_recorder() -> HistoryRecorder:
+	"""Singleton provider for the listening history."""
+	config = get_config()
+	return HistoryRecorder(_get_spotify_api(), config.history, get_store())
+
+
+@lru_cache
+def get_analytics_pipeline() -> AnalyticsPipeline:
+	"""Singleton provider for the analytics pipeline."""
+	config = get_config()
+	return AnalyticsPipeline(config.analytics)
+
+
+@lru_cache
+def get_geoip() -> GeoIP:
+	"""Singleton provider for the GeoIP table, mapped once per worker."""
+	config = get_config()
+	return GeoIP(config.geoip.database)
+
+
+@lru_cache
+def get_enricher() -> Enricher:
+	"""Singleton provider for the client info (IP, country, platform) of the middlewares."""
+	config = get_config()
+	return Enricher(
+		get_geoip() if config.geoip.enabled else None,
+		forwarded_header=config.api.forwarded_ip_header,
+		country_header=config.analytics.country_header,
+	)
+
+
+@lru_cache
+def get_profiler() -> RequestProfiler:
+	"""Singleton provider for the request profiler."""
+	config = get_config().profiling
+	return RequestProfiler(
+		interval=config.interval, max_profiles=config.max_profiles, max_concurrent=config.max_concurrent
+	)
 
 
 async def get_spotify_service(
@@ -0,0 +1,68 @@
+from typing import NamedTuple
+
+from starlette.types import Scope
+
+from ..middleware.request import client_ip
+from ..util.geoip import GeoIP
+from .events import classify_user_agent
+
+
+class ClientInfo(NamedTuple):
+	"""What is known about the client of a request."""
+
+	ip: str
+	user_agent: str
+	country: str | None
+	# device class of `classify_user_agent`
+	platform: str
+	os: str
+
+
+class Enricher:
+	"""Works out the client of a request once, for all the middlewares that need it.
+
+	The country comes from the proxy's or CDN's country header if there is one, and
+	from the GeoIP table otherwise. The result is kept in the request state
+	(`request.state.client`), so later middlewares and the routes get it for free.
+	"""
+
+	def __init__(
+		self, geoip: GeoIP | None = None, *, forwarded_header: str | None = None, country_header: str | None = None
+	) -> None:
+		"""Initialize the enricher.
+
+		Args:
+			geoip (GeoIP | None): the GeoIP table, countries only come from the header without it
+			forwarded_header (str | None): header with the client IP set by the reverse proxy
+			country_header (str | None): header with the client's country code set by a proxy or CDN
+
+		"""
+		self.geoip = geoip
+		self._forwarded_header = forwarded_header.lower().encode() if forwarded_header else None
+		self._country_header = country_header.lower().encode() if country_header else None
+
+	def client(self, scope: Scope) -> ClientInfo:
+		state = scope.setdefault("state", {})
+		client = state.get("client")
+
+		if client is not None:
+			return client
+
+		user_agent = ""
+		country = None
+
+		for name, value in scope["headers"]:
+			if name == b"user-agent":
+				user_agent = value.decode("latin-1")
+			elif name == self._country_header:
+				country = value.decode("latin-1").upper()[:2]
+
+		ip = client_ip(scope, self._forwarded_header)
+
+		if not country and self.geoip is not None:
+			country = self.geoip.country(ip)
+
+		platform, os = classify_user_agent(user_agent)
+		client = state["client"] = ClientInfo(ip, user_agent, country or None, platform, os)
+
+		return client
@@ -0,0 +1,139 @@
+import random
+from collections import deque
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Literal, NamedTuple
+
+
+class VisitEvent(NamedTuple):
+	"""A single recorded request, kept small since many of them sit in the buffer."""
+
+	# unix time in seconds
+	ts: float
+	# keyed hash of the client, never the raw IP
+	visitor: bytes
+	path: str
+	status: int
+	country: str | None
+	platform: str
+
+
+class UserAgent(NamedTuple):
+	# device class: `bot`, `tablet`, `mobile`, `desktop` or `unknown`
+	platform: str
+	# `windows`, `macos`, `ios`, `android`, `chromeos`, `linux` or `unknown`
+	os: str
+
+
+# (substring of the lowercase user agent, operating system), the first match wins, so
+# Android goes before Linux and iOS before macOS ("like Mac OS X"). ChromeOS is matched
+# by its whole "X11; CrOS <arch>" token, a bare "cros" is in every "Microsoft".
+_OPERATING_SYSTEMS = (
+	("android", "android"),
+	("iphone", "ios"),
+	("ipad", "ios"),
+	("ipod", "ios"),
+	("; cros ", "chromeos"),
+	("mac os x", "macos"),
+	("macintosh", "macos"),
+	("windows", "windows"),
+	("linux", "linux"),
+	("x11", "linux"),
+)
+
+
+@lru_cache(maxsize=4096)
+def classify_user_agent(user_agent: str) -> UserAgent:
+	"""Rough device platform and operating system of a user agent.
+
+	There are far fewer distinct user agents than requests, so the results are kept in
+	an LRU cache and classifying a known user agent is a single dict lookup.
+	"""
+	ua = user_agent.lower()
+
+	if not ua:
+		return UserAgent("unknown", "unknown")
+
+	os = next((name for part, name in _OPERATING_SYSTEMS if part in ua), "unknown")
+
+	if "bot" in ua or "crawl" in ua or "spider" in ua:
+		platform = "bot"
+	elif "ipad" in ua or "tablet" in ua or (os == "android" and "mobi" not in ua):
+		# Android tablets leave "Mobile" out of the user agent
+		platform = "tablet"
+	elif "mobi" in ua or "iphone" in ua or "ipod" in ua:
+		platform = "mobile"
+	else:
+		platform = "desktop"
+
+	return UserAgent(platform, os)
+
+
+def classify_platform(user_agent: str) -> str:
+	"""Rough device platform of a user agent: `bot`, `tablet`, `mobile`, `desktop` or `unknown`."""
+	return classify_user_agent(user_agent).platform
+
+
+@dataclass(slots=True)
+class BufferStats:
+	accepted: int = 0
+	# thrown away because the buffer was full
+	dropped: int = 0
+	# left out by sampling while the buffer was filling up
+	sampled_out: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class EventBuffer:
+	"""A bounded in-memory buffer between the request path and the database writer.
+
+	`push` never blocks and never allocates beyond `capacity` events. When the writer
+	falls behind, the `drop` policy drops new events once the buffer is full, the
+	`sample` policy starts keeping only a `sample_rate` share of new events once the
+	buffer is `high_watermark` full, and drops them when it's completely full.
+	"""
+
+	def __init__(
+		self,
+		capacity: int,
+		*,
+		policy: Literal["drop", "sample"] = "drop",
+		sample_rate: float = 0.1,
+		high_watermark: float = 0.75,
+	) -> None:
+		self._events: deque[VisitEvent] = deque()
+		self._capacity = capacity
+		self._policy = policy
+		self._sample_rate = sample_rate
+		self._high_watermark = int(capacity * high_watermark)
+
+		self.stats = BufferStats()
+
+	def __len__(self) -> int:
+		return len(self._events)
+
+	def push(self, event: VisitEvent) -> bool:
+		"""Add an event, returns whether it was kept."""
+		size = len(self._events)
+
+		if size >= self._capacity:
+			self.stats.dropped += 1
+			return False
+
+		if self._policy == "sample" and size >= self._high_watermark and random.random() >= self._sample_rate:
+			self.stats.sampled_out += 1
+			return False
+
+		self._events.append(event)
+		self.stats.accepted += 1
+
+		return True
+
+	def drain(self, limit: int) -> list[VisitEvent]:
+		"""Take up to `limit` of the oldest events out of the buffer."""
+		events = self._events
+		count = min(limit, len(events))
+
+		return [events.popleft() for _ in range(count)]
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+from ..util.config import AnalyticsConfig
+from .events import EventBuffer, VisitEvent
+from .store import AnalyticsStore, Granularity, Summary
+
+
+class AnalyticsPipeline:
+	"""Moves recorded visits from the in-memory buffer to the database in batches.
+
+	The request path only calls `record`, which pushes into the bounded `EventBuffer`
+	and returns. A background task started in the lifespan drains the buffer every
+	`flush_interval` seconds (or as soon as a batch is full) and writes it in a single
+	transaction on a worker thread, so the event loop never waits on the disk.
+
+	The flusher also works out the interaction interval of every event, the time since
+	the same visitor's previous request, from a bounded map of last seen times, and
+	every `compact_interval` seconds deletes the raw events past their retention.
+	"""
+
+	def __init__(self, config: AnalyticsConfig) -> None:
+		self._config = config
+		self.buffer = EventBuffer(
+			config.buffer_size,
+			policy=config.overflow_policy,
+			sample_rate=config.sample_rate,
+		)
+
+		# a stable salt keeps visitor hashes comparable across restarts and workers
+		self._salt = config.salt.encode() if config.salt else secrets.token_bytes(16)
+
+		self._store: AnalyticsStore | None = None
+		self._task: asyncio.Task | None = None
+		self._batch_ready = asyncio.Event()
+		self._last_seen: OrderedDict[bytes, float] = OrderedDict()
+
+		self._last_compaction = 0.0
+
+		self.flushed = 0
+		self.compacted = 0
+
+	def visitor_id(self, ip: str, user_agent: str) -> bytes:
+		"""Keyed hash of a client, so the raw IP is never stored."""
+		return hashlib.blake2b(f"{ip}|{user_agent}".encode(), key=self._salt[:64], digest_size=8).digest()
+
+	@property
+	def running(self) -> bool:
+		return self._store is not None
+
+	def record(self, event: VisitEvent) -> None:
+		"""Queue an event for the database, never blocks."""
+		self.buffer.push(event)
+
+		if len(self.buffer) >= self._config.batch_size:
+			self._batch_ready.set()
+
+	async def start(self) -> None:
+		self._store = await asyncio.to_thread(AnalyticsStore, self._config.database)
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+			self._task = None
+
+		if self._store is not None:
+			# write what's left before shutting down
+			await self.flush()
+			await asyncio.to_thread(self._store.close)
+			self._store = None
+
+	async def flush(self) -> int:
+		"""Write everything that's buffered right now, returns the number of events written."""
+		written = 0
+
+		while len(self.buffer):
+			events = self.buffer.drain(self._config.batch_size)
+			intervals = self._intervals(events)
+
+			try:
+				await asyncio.to_thread(self._write, events, intervals)
+			except Exception as e:
+				logger.exception(f"Writing {len(events)} analytics events failed: {e!r}")
+				break
+
+			written += len(events)
+
+		self.flushed += written
+
+		return written
+
+	async def summary(self, granularity: Granularity, start: float, end: float) -> Summary:
+		"""Statistics of the buckets starting in `[start, end)`, see `AnalyticsStore.summary`."""
+		assert self._store is not None
+		return await asyncio.to_thread(self._store.summary, granularity, start, end)
+
+	async def compact(self) -> int:
+		"""Delete the raw events and hourly rollups past their retention."""
+		assert self._store is not None
+
+		deleted = await asyncio.to_thread(
+			self._store.compact,
+			time.time(),
+			raw_retention=self._config.raw_retention,
+			hourly_retention=self._config.hourly_retention,
+		)
+		self.compacted += deleted
+
+		return deleted
+
+	def _write(self, events: list[VisitEvent], intervals: list[int | None]) -> None:
+		assert self._store is not None
+		self._store.insert(events, intervals)
+
+	async def _run(self) -> None:
+		while True:
+			try:
+				await asyncio.wait_for(self._batch_ready.wait(), self._config.flush_interval)
+			except TimeoutError:
+				pass
+
+			self._batch_ready.clear()
+			await self.flush()
+
+			# compaction runs on the same task as the writes, so they never overlap
+			if time.monotonic() - self._last_compaction >= self._config.compact_interval:
+				self._last_compaction = time.monotonic()
+
+				try:
+					await self.compact()
+				except Exception as e:
+					logger.exception(f"Compacting the analytics database failed: {e!r}")
+
+	def _intervals(self, events: list[VisitEvent]) -> list[int | None]:
+		last_seen = self._last_seen
+		visit_gap = self._config.visit_gap
+		intervals: list[int | None] = []
+
+		for event in events:
+			previous = last_seen.pop(event.visitor, None)
+			last_seen[event.visitor] = event.ts
+
+			# a long pause starts a new visit, its first request has no interval
+			if previous is None or event.ts - previous > visit_gap:
+				intervals.append(None)
+			else:
+				intervals.append(int((event.ts - previous) * 1000))
+
+		while len(last_seen) > self._config.max_visitors:
+			last_seen.popitem(last=False)
+
+		return intervals
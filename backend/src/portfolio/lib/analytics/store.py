@@ -0,0 +1,305 @@
+import sqlite3
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Literal
+
+from pydantic import BaseModel
+
+from .events import VisitEvent
+
+Granularity = Literal["hour", "day"]
+
+# bucket length of every granularity in seconds, buckets are aligned to UTC
+GRANULARITIES: dict[Granularity, int] = {"hour": 60 * 60, "day": 24 * 60 * 60}
+
+# the breakdowns kept in the rollups besides the total ("", "")
+_DIMENSIONS = ("country", "platform")
+
+# rows deleted per statement when compacting, keeps every transaction short
+_COMPACT_CHUNK = 10_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+	id INTEGER PRIMARY KEY,
+	ts REAL NOT NULL,
+	visitor BLOB NOT NULL,
+	path TEXT NOT NULL,
+	status INTEGER NOT NULL,
+	country TEXT,
+	platform TEXT NOT NULL,
+	-- ms since the visitor's previous request, NULL for the first request of a visit
+	interval_ms INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+
+-- counters per bucket, for the total (dimension and value '') and per country and platform
+CREATE TABLE IF NOT EXISTS rollups (
+	granularity TEXT NOT NULL,
+	-- unix time the bucket starts at
+	bucket INTEGER NOT NULL,
+	dimension TEXT NOT NULL,
+	value TEXT NOT NULL,
+	requests INTEGER NOT NULL,
+	-- requests that started a visit
+	visits INTEGER NOT NULL,
+	visitors INTEGER NOT NULL,
+	interval_sum INTEGER NOT NULL,
+	interval_count INTEGER NOT NULL,
+	PRIMARY KEY (granularity, bucket, dimension, value)
+) WITHOUT ROWID;
+
+-- the visitors already counted in a bucket, only kept while events for the bucket can still arrive
+CREATE TABLE IF NOT EXISTS rollup_visitors (
+	granularity TEXT NOT NULL,
+	bucket INTEGER NOT NULL,
+	dimension TEXT NOT NULL,
+	value TEXT NOT NULL,
+	visitor BLOB NOT NULL,
+	PRIMARY KEY (granularity, bucket, dimension, value, visitor)
+) WITHOUT ROWID;
+"""
+
+
+class Breakdown(BaseModel):
+	requests: int
+	visits: int
+
+
+class Bucket(BaseModel):
+	# unix time the bucket starts at
+	start: int
+	requests: int
+	visits: int
+	visitors: int
+	mean_interval_ms: float | None
+
+
+class Summary(BaseModel):
+	granularity: Granularity
+	start: int
+	end: int
+	requests: int
+	visits: int
+	mean_interval_ms: float | None
+	buckets: list[Bucket]
+	countries: dict[str, Breakdown]
+	platforms: dict[str, Breakdown]
+
+
+class AnalyticsStore:
+	"""The SQLite database of the analytics, in WAL mode.
+
+	Besides the raw events, every insert updates hourly and daily rollups in the same
+	transaction: request, visit and unique visitor counts and the interaction interval,
+	in total and per country and platform. `summary` only reads the rollups, so it
+	costs the same no matter how many raw events there are, and raw events can be
+	compacted away after a retention window without losing the statistics.
+
+	All the methods are blocking, call them with e.g. `asyncio.to_thread`. The writing
+	methods (`insert`, `compact`) are meant to be called one at a time, `summary` uses
+	its own connection and can run alongside them.
+	"""
+
+	def __init__(self, path: str) -> None:
+		# opened in the thread that builds the store, then written to from whichever worker thread
+		# `to_thread` picks, one call at a time
+		self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._connection.execute("PRAGMA journal_mode = WAL")
+		# with WAL, NORMAL only risks the last transactions on power loss, never corruption
+		self._connection.execute("PRAGMA synchronous = NORMAL")
+		self._connection.executescript(_SCHEMA)
+
+		# in WAL mode readers don't block the writer, the summaries get a connection of their own
+		self._reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._reader_lock = threading.Lock()
+
+	@property
+	def connection(self) -> sqlite3.Connection:
+		return self._connection
+
+	def insert(self, events: Sequence[VisitEvent], intervals: Sequence[int | None]) -> None:
+		"""Insert a batch of events in a single transaction."""
+		with self._transaction():
+			self._connection.executemany(
+				"INSERT INTO events (ts, visitor, path, status, country, platform, interval_ms)"
+				" VALUES (?, ?, ?, ?, ?, ?, ?)",
+				(
+					(event.ts, event.visitor, event.path, event.status, event.country, event.platform, interval)
+					for event, interval in zip(events, intervals, strict=True)
+				),
+			)
+			self._roll_up(events, intervals)
+
+	def _roll_up(self, events: Sequence[VisitEvent], intervals: Sequence[int | None]) -> None:
+		# [requests, visits, interval_sum, interval_count] and the visitors of every rollup row of the batch
+		counters: dict[tuple[str, int, str, str], list[int]] = {}
+		visitors: dict[tuple[str, int, str, str], set[bytes]] = {}
+
+		for event, interval in zip(events, intervals, strict=True):
+			breakdowns = (("", ""), ("country", event.country or ""), ("platform", event.platform))
+
+			for granularity, length in GRANULARITIES.items():
+				bucket = int(event.ts // length * length)
+
+				for dimension, value in breakdowns:
+					key = (granularity, bucket, dimension, value)
+					row = counters.get(key)
+
+					if row is None:
+						row = counters[key] = [0, 0, 0, 0]
+						visitors[key] = set()
+
+					row[0] += 1
+
+					if interval is None:
+						row[1] += 1
+					else:
+						row[2] += interval
+						row[3] += 1
+
+					visitors[key].add(event.visitor)
+
+		connection = self._connection
+
+		for key, row in counters.items():
+			# the number of visitors that weren't in the bucket yet
+			new_visitors = connection.executemany(
+				"INSERT OR IGNORE INTO rollup_visitors VALUES (?, ?, ?, ?, ?)",
+				((*key, visitor) for visitor in visitors[key]),
+			).rowcount
+
+			connection.execute(
+				"INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+				" ON CONFLICT DO UPDATE SET"
+				" requests = requests + excluded.requests,"
+				" visits = visits + excluded.visits,"
+				" visitors = visitors + excluded.visitors,"
+				" interval_sum = interval_sum + excluded.interval_sum,"
+				" interval_count = interval_count + excluded.interval_count",
+				(*key, row[0], row[1], new_visitors, row[2], row[3]),
+			)
+
+	def compact(self, now: float, *, raw_retention: float, hourly_retention: float) -> int:
+		"""Delete raw events and hourly rollups past their retention, returns how many events were deleted.
+
+		The visitor sets behind the unique visitor counts are only kept for the buckets
+		that can still receive events. Daily rollups are kept for good.
+
+		Args:
+			now (float): the current unix time
+			raw_retention (float): seconds raw events are kept
+			hourly_retention (float): seconds hourly rollups are kept
+
+		Returns:
+			int: the number of raw events deleted
+
+		"""
+		deleted = 0
+
+		while True:
+			# in chunks, so a large backlog doesn't hold the write lock for long
+			with self._transaction():
+				count = self._connection.execute(
+					"DELETE FROM events WHERE id IN (SELECT id FROM events WHERE ts < ? ORDER BY ts LIMIT ?)",
+					(now - raw_retention, _COMPACT_CHUNK),
+				).rowcount
+
+			deleted += count
+
+			if count < _COMPACT_CHUNK:
+				break
+
+		with self._transaction():
+			self._connection.execute(
+				"DELETE FROM rollups WHERE granularity = 'hour' AND bucket < ?",
+				(now - hourly_retention,),
+			)
+
+			for granularity, length in GRANULARITIES.items():
+				# a bucket that ended over a bucket length ago won't get any more events
+				self._connection.execute(
+					"DELETE FROM rollup_visitors WHERE granularity = ? AND bucket < ?",
+					(granularity, now - 2 * length),
+				)
+
+		return deleted
+
+	def summary(self, granularity: Granularity, start: float, end: float) -> Summary:
+		"""Statistics of the buckets starting in `[start, end)`, read from the rollups only.
+
+		Unique visitors are only counted per bucket, visitors can't be added up across buckets.
+		"""
+		length = GRANULARITIES[granularity]
+		first = int(start // length * length)
+
+		with self._reader_lock:
+			rows = self._reader.execute(
+				"SELECT bucket, dimension, value, requests, visits, visitors, interval_sum, interval_count"
+				" FROM rollups WHERE granularity = ? AND bucket >= ? AND bucket < ?",
+				(granularity, first, end),
+			).fetchall()
+
+		buckets: list[Bucket] = []
+		breakdowns: dict[str, dict[str, Breakdown]] = {dimension: {} for dimension in _DIMENSIONS}
+		requests = visits = interval_sum = interval_count = 0
+
+		for bucket, dimension, value, row_requests, row_visits, visitors, row_interval_sum, row_interval_count in rows:
+			if not dimension:
+				buckets.append(
+					Bucket(
+						start=bucket,
+						requests=row_requests,
+						visits=row_visits,
+						visitors=visitors,
+						mean_interval_ms=row_interval_sum / row_interval_count if row_interval_count else None,
+					)
+				)
+
+				requests += row_requests
+				visits += row_visits
+				interval_sum += row_interval_sum
+				interval_count += row_interval_count
+				continue
+
+			# events without a country are rolled up under ""
+			key = value or "unknown"
+			breakdown = breakdowns[dimension].get(key)
+
+			if breakdown is None:
+				breakdowns[dimension][key] = Breakdown(requests=row_requests, visits=row_visits)
+			else:
+				breakdown.requests += row_requests
+				breakdown.visits += row_visits
+
+		buckets.sort(key=lambda b: b.start)
+
+		return Summary(
+			granularity=granularity,
+			start=first,
+			end=int(end),
+			requests=requests,
+			visits=visits,
+			mean_interval_ms=interval_sum / interval_count if interval_count else None,
+			buckets=buckets,
+			countries=breakdowns["country"],
+			platforms=breakdowns["platform"],
+		)
+
+	@contextmanager
+	def _transaction(self) -> Iterator[sqlite3.Connection]:
+		"""`BEGIN` ... `COMMIT`, or `ROLLBACK` on error, the connection is in autocommit mode."""
+		self._connection.execute("BEGIN")
+
+		try:
+			yield self._connection
+		except BaseException:
+			self._connection.execute("ROLLBACK")
+			raise
+
+		self._connection.execute("COMMIT")
+
+	def close(self) -> None:
+		self._reader.close()
+		self._connection.close()
@@ -1,13 +1,19 @@
 from aiohttp import ClientSession
 from loguru import logger
-from pydantic import BaseModel, HttpUrl
+from pydantic import HttpUrl
 
+from ..images.proxy import ImageProxy
+from ..util.breaker import CircuitBreaker, CircuitOpen
+from ..util.cache import SwrCache, cached
 from ..util.config import Config
+from ..util.encoding import CachedJsonModel
+from ..util.http import fetch, request_key
+from ..util.singleflight import SingleFlight
 
 _STATUS_SUCCESS = 200
 
 
-class HardcoverBook(BaseModel):
+class HardcoverBook(CachedJsonModel):
 	title: str
 	author: str
 	pages: int
@@ -34,10 +40,16 @@ class HardcoverApi:
 
 	GRAPHQL_URL = "https://api.hardcover.app/v1/graphql"
 
-	def __init__(self, config: Config) -> None:
+	def __init__(self, config: Config, cache: SwrCache | None = None, images: ImageProxy | None = None) -> None:
 		self._USER_ID: str = config.hardcover.user_id
 		self._API_TOKEN: str = config.hardcover.api_token
 
+		self.cache = cache
+		self.images = images
+		self.inflight = SingleFlight()
+		self.breaker = CircuitBreaker("Hardcover", config.breaker)
+
+	@cached("currently_reading")
 	async def get_currently_reading_book(
 		self,
 		session: ClientSession,
@@ -55,7 +67,8 @@ class HardcoverApi:
 			HardcoverBook: The currently reading book.
 
 		Raises:
-			HardcoverError: If the API request fails or returns a non-success status code.
+			HardcoverError: If the API request fails or returns a non-success status code,
+				or the circuit is open (with the seconds until the next try as `retry_after`).
 
 		"""
 		headers = {
@@ -91,24 +104,42 @@ class HardcoverApi:
 			}
 		""".replace("__USER_ID__", str(self._USER_ID))  # noqa: E501
 
-		response = await session.post(self.GRAPHQL_URL, headers=headers, json={"query": query})
+		body = {"query": query}
+
+		# concurrent callers share the same GraphQL request, it's a read only query so it's retried like a GET
+		try:
+			response = await self.inflight.do(
+				request_key("POST", self.GRAPHQL_URL, body=body),
+				lambda: self.breaker.call(
+					lambda: fetch(session, "POST", self.GRAPHQL_URL, headers=headers, json=body),
+				),
+			)
+		except CircuitOpen as e:
+			raise HardcoverError({"status_code": 503, "message": str(e), "retry_after": e.retry_after}) from e
 
 		if response.status != _STATUS_SUCCESS:
-			raise HardcoverError({"status_code": response.status, "message": await response.text()})
+			raise HardcoverError({"status_code": response.status, "message": response.text()})
 
-		data = await response.json()
+		data = response.json()
 
 		logger.info("Hardcover API book request hit")
 		logger.info(f"JSON data: \n {data}")
 
-		# Extract the list of books
-		books = data.get("data", {}).get("list_books", [])
+		# `me` is a list with the token's user, the books are what the query asked for
+		users = data.get("data", {}).get("me") or [{}]
+		books = users[0].get("user_books", [])
 
 		# No currently reading book
 		if not books:
 			return None
 
 		book_data = books[0]["book"]
+		reads = books[0].get("user_book_reads") or [{}]
+		image = book_data.get("image") or {}
+		image_url = image.get("url")
+
+		if image_url and self.images is not None:
+			image_url = self.images.url(image_url)
 
 		contributions = book_data.get("contributions", [])
 		author = contributions[0]["author"].get("name") if contributions and contributions[0].get("author") else None
@@ -117,8 +148,8 @@ class HardcoverApi:
 			title=book_data.get("title"),
 			author=author or "Unknown Author",
 			pages=book_data.get("pages"),
-			image_url=book_data.get("image", {}).get("url"),
+			image_url=image_url,
 			link=f"https://hardcover.app/books/{book_data.get('slug')}",
-			progress=book_data.get("user_book_reads").get("progress"),
-			image_dominant_color=book_data.get("image", {}).get("color"),
+			progress=reads[0].get("progress") or 0.0,
+			image_dominant_color=image.get("color"),
 		)
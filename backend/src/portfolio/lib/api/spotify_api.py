@@ -1,15 +1,30 @@
 import base64
-from datetime import datetime, timedelta
-from typing import Annotated, TypeVar
+from datetime import datetime
+from typing import Annotated, Literal, TypeVar
 
 from aiohttp import ClientSession
 from pydantic import BaseModel, ConfigDict, Field, HttpUrl, validate_call
 
+from ..images.colors import DominantColors
+from ..images.proxy import ImageProxy
+from ..store.base import StoreBackend
+from ..util.breaker import CircuitBreaker, CircuitOpen
+from ..util.cache import SwrCache, cached
 from ..util.config import Config
+from ..util.encoding import CachedJsonModel
+from ..util.http import UpstreamResponse, fetch, request_key
+from ..util.singleflight import SingleFlight
+from ..util.token import TokenManager
 
 _STATUS_OK = 200
 _STATUS_NO_CONTENT = 204
 
+# the most top items the api returns in one page
+_TOP_ITEMS_LIMIT = 50
+
+# ~4 weeks, ~6 months and ~1 year
+TimeRange = Literal["short_term", "medium_term", "long_term"]
+
 T = TypeVar("T")
 
 
@@ -20,7 +35,7 @@ class SpotifyError(Exception):
 		super().__init__(*args)
 
 
-class Track(BaseModel):
+class Track(CachedJsonModel):
 	"""Dataclass representing the a track returned from the spotify api.
 
 	Most of the data from the original response isn't included here since
@@ -33,16 +48,33 @@ class Track(BaseModel):
 	is_playing: bool | None = Field(default=None)
 	album_name: str
 	album_image: HttpUrl
+	# "#rrggbb", `None` if colors are disabled or the image couldn't be analyzed (yet, the top
+	# tracks are served before their images are analyzed)
+	album_image_dominant_color: str | None = Field(default=None)
 	duration_ms: int | None = Field(default=None)
 	progress_ms: int | None = Field(default=None)
 
 
-class TopArtist(BaseModel):
+class TopArtist(CachedJsonModel):
 	"""Dataclass representing an artist returned from the spotify's top artists response."""
 
 	name: str
 	url: HttpUrl
 	image: HttpUrl
+	image_dominant_color: str | None = Field(default=None)
+
+
+class Play(BaseModel):
+	"""A play of a track from the recently played tracks, as it's kept in the listening history."""
+
+	# unix ms the track was played at (finished)
+	played_at: int
+	track_id: str
+	name: str
+	artists: list[str]
+	album_name: str
+	album_image: str
+	duration_ms: int
 
 
 # to be used with map to get only the artist name
@@ -55,39 +87,80 @@ class SpotifyApi:
 
 	Functionality of this class is as follows, refreshing/creating access tokens, fetching the currently playing track,
 	fetching the last played track (to be used if there's no currently playing track),
-	fetching the top artists of the month, fetching the top tracks of the month.
+	fetching the top artists and the top tracks of a time range.
 	"""
 
 	BASE_URL: str = "https://api.spotify.com/v1"
 	AUTH_URL: str = "https://accounts.spotify.com/api"
 
-	def __init__(self, config: Config) -> None:
-		"""Initialize the SpotifyHelper instance by loading client credentials and setting access token properties."""
+	def __init__(
+		self,
+		config: Config,
+		cache: SwrCache | None = None,
+		store: StoreBackend | None = None,
+		images: ImageProxy | None = None,
+		colors: DominantColors | None = None,
+	) -> None:
+		"""Initialize the SpotifyHelper instance by loading client credentials and setting access token properties.
+
+		If a `cache` is given, responses of the `get_*` methods are served from it.
+		If a `store` is given, the access token is shared through it with the other workers.
+		If `images` is given, the image urls of the tracks and artists point at the image proxy.
+		If `colors` is given, the tracks and artists get the dominant color of their image.
+		"""
 		self._CLIENT_ID: str = config.spotify.client_id
 		self._CLIENT_SECRET: str = config.spotify.client_secret
 		self._REFRESH_TOKEN: str = config.spotify.refresh_token
 
-		self._access_token: str | None = None
-		self._expiry_time: datetime | None = None
+		self.token = TokenManager(
+			self._request_access_token,
+			margin=config.spotify.token_refresh_margin,
+			store=store,
+			store_key="token:spotify",
+			name="spotify",
+		)
+
+		self.cache = cache
+		self.images = images
+		self.colors = colors
+		self.inflight = SingleFlight()
+		self.breaker = CircuitBreaker("Spotify", config.breaker)
+
+	def image_url(self, url: str) -> str:
+		"""The url clients get for the image at `url`, the image proxy's if it's enabled."""
+		return self.images.url(url) if self.images is not None else url
+
+	async def _color(self, session: ClientSession, images: list[dict]) -> str | None:
+		if self.colors is None or not images:
+			return None
 
-	async def _refresh_access_token(self, session: ClientSession) -> None:
-		"""Refresh the Spotify access token if it has expired.
+		# the images are sorted widest first, the smallest one (64px) is plenty to analyze
+		return await self.colors.color(session, images[-1]["url"])
+
+	def _known_color(self, session: ClientSession, images: list[dict]) -> str | None:
+		# for lists, the unknown colors are analyzed in the background instead of holding up the response
+		if self.colors is None or not images:
+			return None
+
+		return self.colors.peek(session, images[-1]["url"])
+
+	async def _request_access_token(self, session: ClientSession) -> tuple[str, float]:
+		"""Request a new Spotify access token with the refresh token.
+
+		This is called by `self.token` (the `TokenManager`), which decides when a new token is needed.
 
 		Args:
 			session (ClientSession):
 				aiohttp client session for making requests
 
+		Returns:
+			tuple[str, float]: the access token and its lifetime in seconds
+
 		Raises:
 			SpotifyError:
 				if response status code is anything except `200 (OK)`
 
 		"""
-		# check if current token is expired before requesting a new access token
-		# so we don't waste a token thats still valid
-		now = datetime.now()
-		if self._expiry_time and now <= self._expiry_time:
-			return
-
 		url = self.AUTH_URL + "/token"
 
 		basic_auth: str = base64.b64encode(f"{self._CLIENT_ID}:{self._CLIENT_SECRET}".encode()).decode("utf-8")
@@ -102,20 +175,52 @@ class SpotifyApi:
 			"refresh_token": self._REFRESH_TOKEN,
 		}
 
-		response = await session.post(url, headers=headers, data=payload)
+		response = await fetch(session, "POST", url, headers=headers, data=payload)
 
 		# Error handling
 		if response.status != _STATUS_OK:
-			raise SpotifyError({"status_code": response.status, "message": await response.text()})
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
 
-		json_data = await response.json()
-		self._access_token = json_data["access_token"]
+		json_data = response.json()
 
-		# set the expiry to current time + spotify's expires_in
-		current_time = datetime.now()
-		self._expiry_time = current_time + timedelta(seconds=json_data["expires_in"])
+		return json_data["access_token"], float(json_data["expires_in"])
 
-	@validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+	async def _get(
+		self,
+		session: ClientSession,
+		url: str,
+		params: dict[str, str | int] | None = None,
+	) -> UpstreamResponse:
+		"""Send an authorized GET request to the Spotify API.
+
+		Concurrent calls with the same url and params share a single upstream request,
+		which goes through the circuit breaker and is retried if it fails.
+
+		Args:
+			session (ClientSession): aiohttp client session for making requests
+			url (str): the endpoint url
+			params (dict[str, str | int] | None): url query parameters
+
+		Returns:
+			UpstreamResponse: the fully read response
+
+		Raises:
+			SpotifyError: if the circuit is open, with the seconds until the next try as `retry_after`
+
+		"""
+		access_token = await self.token.get(session)
+
+		headers = {"Authorization": f"Bearer {access_token}"}
+
+		try:
+			return await self.inflight.do(
+				request_key("GET", url, params),
+				lambda: self.breaker.call(lambda: fetch(session, "GET", url, params=params, headers=headers)),
+			)
+		except CircuitOpen as e:
+			raise SpotifyError({"status_code": 503, "message": str(e), "retry_after": e.retry_after}) from e
+
+	@cached("currently_playing")
 	async def get_currently_playing(self, session: ClientSession) -> Track | None:
 		"""Retrieve the user's currently playing track.
 
@@ -132,22 +237,19 @@ class SpotifyApi:
 			SpotifyError: if response status code is anything except `200 (OK)`
 
 		"""
-		await self._refresh_access_token(session)
-
 		url = self.BASE_URL + "/me/player/currently-playing"
 
-		headers = {"Authorization": f"Bearer {self._access_token}"}
-
-		response = await session.get(url, headers=headers)
+		response = await self._get(session, url)
 
 		# if status code is not 200 or 204 raise exception
 		if response.status not in [_STATUS_OK, _STATUS_NO_CONTENT]:
-			raise SpotifyError({"status_code": response.status, "message": await response.text()})
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
 
 		if response.status == _STATUS_NO_CONTENT:
 			return None
 
-		json_data = await response.json()
+		json_data = response.json()
+		album_images = json_data["item"]["album"]["images"]
 
 		return Track(
 			name=json_data["item"]["name"],
@@ -155,12 +257,13 @@ class SpotifyApi:
 			progress_ms=json_data["progress_ms"],
 			duration_ms=json_data["item"]["duration_ms"],
 			album_name=json_data["item"]["album"]["name"],
-			album_image=json_data["item"]["album"]["images"][0]["url"],
+			album_image=self.image_url(album_images[0]["url"]),
+			album_image_dominant_color=await self._color(session, album_images),
 			artists=map(_format_artists, json_data["item"]["artists"]),
 			track_url=f"https://open.spotify.com/track/{json_data['item']['uri'].split(':')[2]}",
 		)
 
-	@validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+	@cached("last_played")
 	async def get_last_played_track(self, session: ClientSession) -> Track | None:
 		"""Retrieve the user's last played track.
 
@@ -177,49 +280,50 @@ class SpotifyApi:
 			SpotifyError: if response status code is anything except `200 (OK)`
 
 		"""
-		await self._refresh_access_token(session)
-
 		url = self.BASE_URL + "/me/player/recently-played"
 
 		url_params = {"limit": 1}
 
-		headers = {"Authorization": f"Bearer {self._access_token}"}
-
-		response = await session.get(url, headers=headers, params=url_params)
+		response = await self._get(session, url, url_params)
 
 		if response.status not in [204, 200]:
-			raise SpotifyError({"status_code": response.status, "message": await response.text()})
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
 		if response.status == _STATUS_NO_CONTENT:  # 204 (No Content)
 			return None
 
-		json_data = await response.json()
+		json_data = response.json()
 
 		track0 = json_data["items"][0]["track"]
 
 		return Track(
 			name=track0["name"],
 			album_name=track0["album"]["name"],
-			album_image=track0["album"]["images"][0]["url"],
+			album_image=self.image_url(track0["album"]["images"][0]["url"]),
+			album_image_dominant_color=await self._color(session, track0["album"]["images"]),
 			artists=map(_format_artists, track0["artists"]),
 			track_url=f"https://open.spotify.com/track/{track0['uri'].split(':')[2]}",
 		)
 
 	@validate_call(config=ConfigDict(arbitrary_types_allowed=True))
-	async def get_top_month_tracks(
+	async def get_top_tracks(
 		self,
 		session: ClientSession,
 		*,  # pydantic keyword only
-		limit: Annotated[int, Field(default=10, ge=1, le=50)],
+		limit: Annotated[int, Field(default=10, ge=1, le=_TOP_ITEMS_LIMIT)],
+		time_range: TimeRange = "short_term",
 	) -> list[Track] | None:
-		"""Retrieve user's top tracks of the last 4 weeks.
+		"""Retrieve user's top tracks of a time range.
 
-		Returns `None` if there is no this month's top tracks
+		Returns `None` if there are no top tracks in the time range
 
 		Args:
 			session (ClientSession): aiohttp client session to make requests
 
 			limit (int): the limit lenght of the tracks returned.
-				1 <= limit <= 50, Default: 50
+				1 <= limit <= 50, Default: 10
+
+			time_range (TimeRange): `short_term` (~4 weeks), `medium_term` (~6 months)
+				or `long_term` (~1 year), Default: `short_term`
 
 		Returns:
 			list[Track]: list of user's top tracks
@@ -228,33 +332,68 @@ class SpotifyApi:
 			SpotifyError: if response status code is anything except `200 (OK)`
 
 		"""
-		await self._refresh_access_token(session)
+		tracks = await self._fetch_top_tracks(session, time_range=time_range)
+
+		return tracks[:limit] if tracks is not None else None
+
+	@validate_call(config=ConfigDict(arbitrary_types_allowed=True))
+	async def get_top_artists(
+		self,
+		session: ClientSession,
+		*,  # pydantic keyword only
+		limit: Annotated[int, Field(default=10, ge=1, le=_TOP_ITEMS_LIMIT)],
+		time_range: TimeRange = "short_term",
+	) -> list[TopArtist] | None:
+		"""Retrieve user's top artists of a time range.
+
+		Returns `None` if there are no top artists in the time range
+
+		Args:
+			session (ClientSession): aiohttp client session for making requests
+
+			limit (int): the limit length of the artists returned.
+				1 <= limit <= 50, Default: 10
+
+			time_range (TimeRange): `short_term` (~4 weeks), `medium_term` (~6 months)
+				or `long_term` (~1 year), Default: `short_term`
+
+		Returns:
+			list[TopArtist]: list of user's top artists
+
+		Raises:
+			SpotifyError: if response status code is anything except `200 (OK)`
+
+		"""
+		artists = await self._fetch_top_artists(session, time_range=time_range)
+
+		return artists[:limit] if artists is not None else None
+
+	# the full lists are fetched and cached once per time range, every `limit` is a slice of them
 
+	@cached("top_items")
+	async def _fetch_top_tracks(self, session: ClientSession, *, time_range: TimeRange) -> list[Track] | None:
 		url = self.BASE_URL + "/me/top/tracks"
 
 		url_params = {
-			"limit": limit,
-			"time_range": "short_term",  # 4 weeks
+			"limit": _TOP_ITEMS_LIMIT,
+			"time_range": time_range,
 		}
 
-		headers = {"Authorization": f"Bearer {self._access_token}"}
-
-		response = await session.get(url, params=url_params, headers=headers)
+		response = await self._get(session, url, url_params)
 
 		if response.status not in [204, 200]:
-			raise SpotifyError({"status_code": response.status, "message": await response.text()})
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
 		if response.status == _STATUS_NO_CONTENT:
 			return None
 
-		data_items = (await response.json())["items"]
-
 		tracks: list[Track] = []
 
-		for track_data in data_items:
+		for track_data in response.json()["items"]:
 			track = Track(
 				name=track_data["name"],
 				album_name=track_data["album"]["name"],
-				album_image=track_data["album"]["images"][0]["url"],
+				album_image=self.image_url(track_data["album"]["images"][0]["url"]),
+				album_image_dominant_color=self._known_color(session, track_data["album"]["images"]),
 				artists=list(map(_format_artists, track_data["artists"])),
 				track_url=f"https://open.spotify.com/track/{track_data['uri'].split(':')[2]}",
 			)
@@ -263,57 +402,103 @@ class SpotifyApi:
 
 		return tracks
 
-	@validate_call(config=ConfigDict(arbitrary_types_allowed=True))
-	async def get_top_month_artists(
-		self,
-		session: ClientSession,
-		*,  # pydantic keyword only
-		limit: Annotated[int, Field(default=10, ge=1, le=50)],
-	) -> list[TopArtist] | None:
-		"""Retrieve user's top artists of the last 4 weeks.
-
-		Args:
-			session (ClientSession): aiohttp client session for making requests
-
-			limit (int): the limit length of the artists returned.
-				1 <= limit <= 50, Default: 50
-
-		Returns:
-			list[TopArtist]: list of user's top artists
-
-		Raises:
-			SpotifyError: if response status code is anything except `200 (OK)`
-
-		"""
-		await self._refresh_access_token(session)
-
+	@cached("top_items")
+	async def _fetch_top_artists(self, session: ClientSession, *, time_range: TimeRange) -> list[TopArtist] | None:
 		url = self.BASE_URL + "/me/top/artists"
 
 		url_params = {
-			"limit": limit,
-			"time_range": "short_term",  # 4 weeks
+			"limit": _TOP_ITEMS_LIMIT,
+			"time_range": time_range,
 		}
 
-		headers = {"Authorization": f"Bearer {self._access_token}"}
-
-		response = await session.get(url, params=url_params, headers=headers)
+		response = await self._get(session, url, url_params)
 
 		if response.status not in [204, 200]:
-			raise SpotifyError({"status_code": response.status, "message": await response.text()})
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
 		if response.status == _STATUS_NO_CONTENT:
 			return None
 
-		data_items = (await response.json())["items"]
-
 		artists: list[TopArtist] = []
 
-		for data in data_items:
+		for data in response.json()["items"]:
 			artist = TopArtist(
 				name=data["name"],
 				url=f"https://open.spotify.com/artist/{data['uri'].split(':')[2]}",
-				image=data["images"][0]["url"],
+				image=self.image_url(data["images"][0]["url"]),
+				image_dominant_color=self._known_color(session, data["images"]),
 			)
 
 			artists.append(artist)
 
 		return artists
+
+	async def get_recently_played(
+		self, session: ClientSession, *, after: int | None = None, limit: int = _TOP_ITEMS_LIMIT
+	) -> tuple[list[Play], int | None]:
+		"""Retrieve a page of the user's recently played tracks, played after `after`.
+
+		Not cached, this is meant for syncing the listening history. Spotify only keeps
+		the last 50 plays, anything older can't be fetched.
+
+		Args:
+			session (ClientSession): aiohttp client session for making requests
+			after (int | None): unix ms, only plays after this are returned,
+				`None` for the most recent ones
+			limit (int): the most plays returned, 1 <= limit <= 50, Default: 50
+
+		Returns:
+			tuple[list[Play], int | None]: the plays, newest first, and the cursor to pass
+				as `after` for the next page (`None` if there are no plays). Plays of local
+				files are skipped, so the list can be empty while the cursor isn't
+
+		Raises:
+			SpotifyError: if response status code is anything except `200 (OK)`
+
+		"""
+		url = self.BASE_URL + "/me/player/recently-played"
+
+		url_params: dict[str, str | int] = {"limit": limit}
+
+		if after is not None:
+			url_params["after"] = after
+
+		response = await self._get(session, url, url_params)
+
+		if response.status not in [204, 200]:
+			raise SpotifyError({"status_code": response.status, "message": response.text()})
+		if response.status == _STATUS_NO_CONTENT:
+			return [], None
+
+		json_data = response.json()
+
+		plays: list[Play] = []
+		last_played_at: int | None = None
+
+		for item in json_data["items"]:
+			played_at = int(datetime.fromisoformat(item["played_at"]).timestamp() * 1000)
+			last_played_at = max(played_at, last_played_at or 0)
+			track = item["track"]
+
+			# local files ("spotify:local:...") have no track id and usually no album images,
+			# they're left out of the history but still move the cursor past them
+			if not track["uri"].startswith("spotify:track:") or not track["album"]["images"]:
+				continue
+
+			plays.append(
+				Play(
+					played_at=played_at,
+					track_id=track["uri"].split(":")[2],
+					name=track["name"],
+					artists=list(map(_format_artists, track["artists"])),
+					album_name=track["album"]["name"],
+					album_image=track["album"]["images"][0]["url"],
+					duration_ms=track["duration_ms"],
+				)
+			)
+
+		cursor = (json_data.get("cursors") or {}).get("after")
+
+		if cursor is None:
+			cursor = last_played_at
+
+		return plays, int(cursor) if cursor is not None else None
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from ..util.broadcast import Broadcaster
+from ..util.cache import fresh
+from ..util.config import StreamConfig
+from ..util.encoding import encode
+from .spotify_api import SpotifyApi, SpotifyError, Track
+
+
+class CurrentlyPlayingPoller:
+	"""A single background poller of the currently playing track, fanned out to every stream subscriber.
+
+	The poller only publishes when something a client can't work out on its own changes:
+	a different track, play/pause, or a jump in the progress (a seek). Every event carries
+	the time it was observed at (`observed_at`, unix ms), clients interpolate `progress_ms`
+	locally from there while `is_playing` is true.
+
+	Nothing is polled while there are no subscribers.
+	"""
+
+	def __init__(self, api: SpotifyApi, config: StreamConfig) -> None:
+		self._api = api
+		self._config = config
+
+		self.broadcaster = Broadcaster(
+			queue_size=config.subscriber_queue_size,
+			max_subscribers=config.max_subscribers,
+		)
+
+		self._task: asyncio.Task | None = None
+
+		# state of the last published event, used to tell changes apart from normal playback
+		self._last_track: Track | None = None
+		self._last_observed: float = 0.0
+		self._published_once = False
+
+	def start(self, session: ClientSession) -> None:
+		if self._task is None:
+			self._task = asyncio.create_task(self._run(session))
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+			self._task = None
+
+	async def _run(self, session: ClientSession) -> None:
+		while True:
+			await self.broadcaster.wait_for_subscribers()
+
+			try:
+				# a cached track would have a stale progress, but the poll still keeps the cache warm
+				with fresh():
+					track = await self._api.get_currently_playing(session)
+
+				self._observe(track, time.time())
+			except SpotifyError as e:
+				logger.warning(f"Currently playing poll failed: {e.args[0]}")
+			except Exception as e:
+				logger.exception(f"Currently playing poller crashed on a poll: {e!r}")
+
+			await asyncio.sleep(self._config.poll_interval)
+
+	def _observe(self, track: Track | None, now: float) -> None:
+		if self._published_once and not self._has_changed(track, now):
+			return
+
+		self._last_track = track
+		self._last_observed = now
+		self._published_once = True
+
+		event = {
+			"observed_at": int(now * 1000),
+			"track": track,
+		}
+
+		self.broadcaster.publish(encode(event))
+
+	def _has_changed(self, track: Track | None, now: float) -> bool:
+		last = self._last_track
+
+		if last is None or track is None:
+			return last is not track
+
+		if track.track_url != last.track_url or track.is_playing != last.is_playing:
+			return True
+
+		# progress the client would have interpolated since the last event
+		expected = last.progress_ms or 0
+
+		if last.is_playing:
+			expected += int((now - self._last_observed) * 1000)
+
+		return abs((track.progress_ms or 0) - expected) > self._config.seek_tolerance_ms
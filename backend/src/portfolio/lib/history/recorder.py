@@ -0,0 +1,128 @@
+import asyncio
+import time
+from datetime import date
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from ..api.spotify_api import SpotifyApi, SpotifyError
+from ..store.base import StoreBackend
+from ..util.config import HistoryConfig
+from .store import HistoryStore, MostPlayed, PlaysPerDay
+
+# plays per page of recently played, the most the api returns
+_PAGE_SIZE = 50
+
+_LOCK_NAME = "lock:history-sync"
+
+
+class HistoryRecorder:
+	"""Keeps a local copy of the listening history, synced from Spotify's recently played tracks.
+
+	A background task started in the lifespan fetches the plays after the saved cursor
+	every `sync_interval` seconds, page by page, and appends them to the `HistoryStore`
+	on a worker thread. The cursor is saved with the plays, so a restart picks up where
+	the last sync stopped. Only one worker syncs at a time, they take turns through a
+	lock in the shared store.
+
+	The queries only read the local database, Spotify is never called on the request path.
+	"""
+
+	def __init__(self, api: SpotifyApi, config: HistoryConfig, lock_store: StoreBackend | None = None) -> None:
+		self._api = api
+		self._config = config
+		self._lock_store = lock_store
+
+		self._store: HistoryStore | None = None
+		self._task: asyncio.Task | None = None
+
+		self.synced = 0
+		self.last_sync: float | None = None
+
+	@property
+	def running(self) -> bool:
+		return self._store is not None
+
+	async def start(self, session: ClientSession) -> None:
+		self._store = await asyncio.to_thread(HistoryStore, self._config.database)
+		self._task = asyncio.create_task(self._run(session))
+
+	async def stop(self) -> None:
+		if self._task is not None:
+			self._task.cancel()
+			await asyncio.gather(self._task, return_exceptions=True)
+			self._task = None
+
+		if self._store is not None:
+			await asyncio.to_thread(self._store.close)
+			self._store = None
+
+	async def sync(self, session: ClientSession) -> int:
+		"""Fetch the plays after the saved cursor, returns the number of new plays.
+
+		Spotify only keeps the last 50 plays, plays older than that which weren't synced
+		in time are lost.
+		"""
+		assert self._store is not None
+
+		cursor = await asyncio.to_thread(self._store.cursor)
+		inserted = 0
+
+		for _ in range(self._config.max_pages):
+			plays, next_cursor = await self._api.get_recently_played(session, after=cursor, limit=_PAGE_SIZE)
+
+			if next_cursor is None:
+				break
+
+			# saved even if every play of the page was skipped, or the sync would stop at them for good
+			inserted += await asyncio.to_thread(self._store.insert, plays, next_cursor)
+			cursor = next_cursor
+
+			if len(plays) < _PAGE_SIZE:
+				break
+
+		self.synced += inserted
+		self.last_sync = time.time()
+
+		return inserted
+
+	async def count(self) -> int:
+		assert self._store is not None
+		return await asyncio.to_thread(self._store.count)
+
+	async def plays_per_day(self, start: date, end: date, utc_offset: int = 0) -> PlaysPerDay:
+		"""See `HistoryStore.plays_per_day`."""
+		assert self._store is not None
+		return await asyncio.to_thread(self._store.plays_per_day, start, end, utc_offset)
+
+	async def most_played(self, start: int, end: int, limit: int) -> MostPlayed:
+		"""See `HistoryStore.most_played`, the album images point at the image proxy if it's enabled."""
+		assert self._store is not None
+
+		result = await asyncio.to_thread(self._store.most_played, start, end, limit)
+
+		for track in result.tracks:
+			track.album_image = self._api.image_url(track.album_image)
+
+		return result
+
+	async def _run(self, session: ClientSession) -> None:
+		while True:
+			lock = None
+
+			try:
+				if self._lock_store is not None:
+					# held until the next sync is due, so the other workers skip this round
+					lock = await self._lock_store.acquire_lock(_LOCK_NAME, ttl=self._config.sync_interval * 0.9)
+
+				if self._lock_store is None or lock is not None:
+					inserted = await self.sync(session)
+
+					if inserted:
+						logger.info(f"Synced {inserted} new plays into the listening history")
+			except SpotifyError as e:
+				logger.warning(f"Listening history sync failed: {e.args[0]}")
+			except Exception as e:
+				logger.exception(f"Listening history sync crashed: {e!r}")
+
+			await asyncio.sleep(self._config.sync_interval)
@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import threading
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from pydantic import BaseModel
+
+from ..api.spotify_api import Play
+
+_DAY_MS = 24 * 60 * 60 * 1000
+_EPOCH = date(1970, 1, 1)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+	-- unix ms, the table is ordered by it so time ranges are a single range scan
+	played_at INTEGER PRIMARY KEY,
+	track_id TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS tracks (
+	id TEXT PRIMARY KEY,
+	name TEXT NOT NULL,
+	-- JSON array of the artist names
+	artists TEXT NOT NULL,
+	album_name TEXT NOT NULL,
+	album_image TEXT NOT NULL,
+	duration_ms INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- the sync cursor and the like
+CREATE TABLE IF NOT EXISTS state (
+	key TEXT PRIMARY KEY,
+	value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class DayPlays(BaseModel):
+	date: date
+	plays: int
+	# distinct tracks played
+	tracks: int
+	# the summed up lengths of the played tracks
+	duration_ms: int
+
+
+class PlaysPerDay(BaseModel):
+	start: date
+	end: date
+	plays: int
+	days: list[DayPlays]
+
+
+class TrackPlays(BaseModel):
+	name: str
+	artists: list[str]
+	album_name: str
+	album_image: str
+	track_url: str
+	plays: int
+	# unix ms of the last play in the window
+	last_played_at: int
+
+
+class MostPlayed(BaseModel):
+	# unix ms
+	start: int
+	end: int
+	plays: int
+	tracks: list[TrackPlays]
+
+
+class HistoryStore:
+	"""The SQLite database of the listening history, in WAL mode.
+
+	Plays are keyed by the time they were played at, so inserting a play twice (an
+	overlapping page, two workers syncing at once) is a no-op. The sync cursor is
+	saved in the same transaction as the plays it was read with.
+
+	All the methods are blocking, call them with e.g. `asyncio.to_thread`. `insert`
+	is meant to be called one at a time, the queries use their own connection and
+	can run alongside it.
+	"""
+
+	def __init__(self, path: str) -> None:
+		# not tied to the thread that opened it, the recorder's inserts each run on another
+		# `to_thread` worker, never two at once
+		self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._connection.execute("PRAGMA journal_mode = WAL")
+		# with WAL, NORMAL only risks the last transactions on power loss, never corruption
+		self._connection.execute("PRAGMA synchronous = NORMAL")
+		self._connection.executescript(_SCHEMA)
+
+		# in WAL mode readers don't block the writer, the queries get a connection of their own
+		self._reader = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self._reader_lock = threading.Lock()
+
+	def cursor(self) -> int | None:
+		"""The `after` cursor of the next sync, `None` before the first one."""
+		row = self._connection.execute("SELECT value FROM state WHERE key = 'cursor'").fetchone()
+
+		return int(row[0]) if row is not None else None
+
+	def insert(self, plays: Sequence[Play], cursor: int) -> int:
+		"""Insert the plays that aren't known yet and save the cursor, returns the number of new plays."""
+		with self._transaction():
+			self._connection.executemany(
+				"INSERT OR REPLACE INTO tracks (id, name, artists, album_name, album_image, duration_ms)"
+				" VALUES (?, ?, ?, ?, ?, ?)",
+				(
+					(
+						play.track_id,
+						play.name,
+						json.dumps(play.artists),
+						play.album_name,
+						play.album_image,
+						play.duration_ms,
+					)
+					for play in plays
+				),
+			)
+			inserted = self._connection.executemany(
+				"INSERT OR IGNORE INTO plays (played_at, track_id) VALUES (?, ?)",
+				((play.played_at, play.track_id) for play in plays),
+			).rowcount
+			self._connection.execute(
+				"INSERT OR REPLACE INTO state (key, value) VALUES ('cursor', ?)",
+				# the cursor never moves back, e.g. when another worker synced further
+				(str(max(cursor, self.cursor() or 0)),),
+			)
+
+		return inserted
+
+	def count(self) -> int:
+		with self._reader_lock:
+			return self._reader.execute("SELECT COUNT(*) FROM plays").fetchone()[0]
+
+	def plays_per_day(self, start: date, end: date, utc_offset: int = 0) -> PlaysPerDay:
+		"""Plays of every day from `start` to `end` (inclusive), days without plays included.
+
+		Args:
+			start (date): the first day
+			end (date): the last day
+			utc_offset (int): minutes the days are shifted from UTC by, e.g. 120 for UTC+2
+
+		Returns:
+			PlaysPerDay: the plays per day
+
+		"""
+		offset = utc_offset * 60 * 1000
+		first = (start - _EPOCH).days
+		last = (end - _EPOCH).days
+
+		with self._reader_lock:
+			rows = self._reader.execute(
+				"SELECT (plays.played_at + ?) / ? AS day, COUNT(*), COUNT(DISTINCT plays.track_id),"
+				" SUM(tracks.duration_ms)"
+				" FROM plays JOIN tracks ON tracks.id = plays.track_id"
+				" WHERE plays.played_at >= ? AND plays.played_at < ?"
+				" GROUP BY day",
+				(offset, _DAY_MS, first * _DAY_MS - offset, (last + 1) * _DAY_MS - offset),
+			).fetchall()
+
+		counts = {day: (plays, tracks, duration) for day, plays, tracks, duration in rows}
+		days = [
+			DayPlays(date=_EPOCH + timedelta(days=day), plays=plays, tracks=tracks, duration_ms=duration)
+			for day in range(first, last + 1)
+			for plays, tracks, duration in [counts.get(day, (0, 0, 0))]
+		]
+
+		return PlaysPerDay(start=start, end=end, plays=sum(day.plays for day in days), days=days)
+
+	def most_played(self, start: int, end: int, limit: int) -> MostPlayed:
+		"""The tracks played the most in `[start, end)` (unix ms), ties broken by the last play."""
+		with self._reader_lock:
+			total = self._reader.execute(
+				"SELECT COUNT(*) FROM plays WHERE played_at >= ? AND played_at < ?", (start, end)
+			).fetchone()[0]
+			rows = self._reader.execute(
+				"SELECT tracks.id, tracks.name, tracks.artists, tracks.album_name, tracks.album_image,"
+				" top.plays, top.last_played_at"
+				" FROM ("
+				"  SELECT track_id, COUNT(*) AS plays, MAX(played_at) AS last_played_at FROM plays"
+				"  WHERE played_at >= ? AND played_at < ?"
+				"  GROUP BY track_id ORDER BY plays DESC, last_played_at DESC LIMIT ?"
+				" ) AS top JOIN tracks ON tracks.id = top.track_id"
+				" ORDER BY top.plays DESC, top.last_played_at DESC",
+				(start, end, limit),
+			).fetchall()
+
+		tracks = [
+			TrackPlays(
+				name=name,
+				artists=json.loads(artists),
+				album_name=album_name,
+				album_image=album_image,
+				track_url=f"https://open.spotify.com/track/{track_id}",
+				plays=plays,
+				last_played_at=last_played_at,
+			)
+			for track_id, name, artists, album_name, album_image, plays, last_played_at in rows
+		]
+
+		return MostPlayed(start=start, end=end, plays=total, tracks=tracks)
+
+	@contextmanager
+	def _transaction(self) -> Iterator[sqlite3.Connection]:
+		"""`BEGIN` ... `COMMIT`, or `ROLLBACK` on error, the connection is in autocommit mode."""
+		self._connection.execute("BEGIN IMMEDIATE")
+
+		try:
+			yield self._connection
+		except BaseException:
+			self._connection.execute("ROLLBACK")
+			raise
+
+		self._connection.execute("COMMIT")
+
+	def close(self) -> None:
+		self._reader.close()
+		self._connection.close()
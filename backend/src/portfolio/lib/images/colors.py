@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from functools import partial
+
+from aiohttp import ClientError, ClientSession
+from loguru import logger
+
+from ..util.config import ColorsConfig
+from ..util.http import ResponseTooLarge, fetch
+from ..util.singleflight import SingleFlight
+from .palette import dominant_color
+
+_STATUS_OK = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS colors (
+	url TEXT PRIMARY KEY,
+	color TEXT NOT NULL,
+	analyzed_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(slots=True)
+class ColorStats:
+	# served from memory
+	hits: int = 0
+	# found in the database, analyzed by another worker or before a restart
+	loaded: int = 0
+	analyzed: int = 0
+	errors: int = 0
+	# not known yet when peeked at, analyzed in the background
+	deferred: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class DominantColors:
+	"""The dominant colors of images, analyzed once per url and kept in SQLite.
+
+	A color is looked up in memory, then in the database (another worker or an
+	earlier run might have analyzed the image), and only then is the image fetched
+	and analyzed with `dominant_color` in a process pool. Concurrent lookups of an
+	image share one analysis. Images that couldn't be fetched or analyzed get `None`
+	and are tried again after `retry_after` seconds.
+
+	`peek` doesn't wait for any of that, it returns what's in memory and leaves the
+	rest to a background task.
+	"""
+
+	def __init__(self, config: ColorsConfig) -> None:
+		self._config = config
+
+		# the connection is created on the event loop but used from worker threads, one call at a time
+		self._connection = sqlite3.connect(config.database, check_same_thread=False, isolation_level=None)
+		self._connection.execute("PRAGMA journal_mode = WAL")
+		self._connection.execute("PRAGMA synchronous = NORMAL")
+		self._connection.executescript(_SCHEMA)
+		self._lock = threading.Lock()
+
+		self._colors: dict[str, str] = dict(self._connection.execute("SELECT url, color FROM colors"))
+		# monotonic time until which an image isn't tried again
+		self._failed: dict[str, float] = {}
+		self._inflight = SingleFlight()
+		self._pool: ProcessPoolExecutor | None = None
+		# background lookups started by `peek`, by url
+		self._background: dict[str, asyncio.Task] = {}
+
+		self.stats = ColorStats()
+
+	def __len__(self) -> int:
+		return len(self._colors)
+
+	async def color(self, session: ClientSession, url: str) -> str | None:
+		"""Get the dominant color of the image at `url` as "#rrggbb".
+
+		Args:
+			session (ClientSession): used to fetch the image
+			url (str): url of the image, prefer a small variant, it's scaled down anyway
+
+		Returns:
+			str | None: the color, `None` if the image couldn't be fetched or analyzed
+
+		"""
+		color = self._colors.get(url)
+
+		if color is not None:
+			self.stats.hits += 1
+			return color
+
+		if self._failed.get(url, 0) > time.monotonic():
+			return None
+
+		return await self._inflight.do(url, lambda: self._analyze(session, url))
+
+	def peek(self, session: ClientSession, url: str) -> str | None:
+		"""Get the dominant color of the image at `url` if it's known, without waiting.
+
+		An unknown color is looked up (and the image analyzed if needed) in the background,
+		a later call returns it.
+
+		Args:
+			session (ClientSession): used to fetch the image
+			url (str): url of the image, prefer a small variant, it's scaled down anyway
+
+		Returns:
+			str | None: the color, `None` if it isn't known yet or the image couldn't be analyzed
+
+		"""
+		color = self._colors.get(url)
+
+		if color is not None:
+			self.stats.hits += 1
+			return color
+
+		if url not in self._background and self._failed.get(url, 0) <= time.monotonic():
+			self.stats.deferred += 1
+			task = asyncio.create_task(self.color(session, url))
+			self._background[url] = task
+			task.add_done_callback(lambda _: self._background.pop(url, None))
+
+		return None
+
+	async def _analyze(self, session: ClientSession, url: str) -> str | None:
+		color = await asyncio.to_thread(self._load, url)
+
+		if color is not None:
+			self.stats.loaded += 1
+			self._colors[url] = color
+			return color
+
+		try:
+			color = await self._compute(session, url)
+		except Exception as e:
+			self.stats.errors += 1
+			self._failed[url] = time.monotonic() + self._config.retry_after
+			logger.warning(f"Analyzing the color of {url} failed: {e!r}")
+			return None
+
+		self.stats.analyzed += 1
+		self._colors[url] = color
+		self._failed.pop(url, None)
+
+		try:
+			await asyncio.to_thread(self._save, url, color)
+		except sqlite3.Error as e:
+			# still kept in memory, it's analyzed again after a restart
+			logger.warning(f"Saving the color of {url} failed: {e!r}")
+
+		return color
+
+	async def _compute(self, session: ClientSession, url: str) -> str:
+		try:
+			response = await fetch(session, "GET", url, max_size=self._config.max_source_size)
+		except (ClientError, TimeoutError) as e:
+			raise ValueError(f"fetching failed: {e!r}") from e
+		except ResponseTooLarge:
+			raise ValueError(f"bigger than {self._config.max_source_size} bytes") from None
+
+		if response.status != _STATUS_OK:
+			raise ValueError(f"fetching failed with status {response.status}")
+
+		if self._pool is None:
+			# spawned, forking a process with an event loop and threads isn't safe
+			self._pool = ProcessPoolExecutor(self._config.workers, mp_context=multiprocessing.get_context("spawn"))
+
+		try:
+			return await asyncio.get_running_loop().run_in_executor(
+				self._pool, partial(dominant_color, response.body, self._config.sample_size)
+			)
+		except BrokenProcessPool:
+			# a worker died, the pool takes no more work
+			self._pool.shutdown(wait=False)
+			self._pool = None
+			raise
+
+	def _load(self, url: str) -> str | None:
+		with self._lock:
+			row = self._connection.execute("SELECT color FROM colors WHERE url = ?", (url,)).fetchone()
+
+		return row[0] if row is not None else None
+
+	def _save(self, url: str, color: str) -> None:
+		with self._lock:
+			self._connection.execute(
+				"INSERT OR REPLACE INTO colors (url, color, analyzed_at) VALUES (?, ?, ?)", (url, color, time.time())
+			)
+
+	async def close(self) -> None:
+		background = list(self._background.values())
+
+		for task in background:
+			task.cancel()
+
+		await asyncio.gather(*background, return_exceptions=True)
+
+		if self._pool is not None:
+			self._pool.shutdown(cancel_futures=True)
+			self._pool = None
+
+		await asyncio.to_thread(self._connection.close)
@@ -0,0 +1,50 @@
+import io
+
+# bits kept per channel when quantizing, 4 bits make 16³ = 4096 colors
+_BITS = 4
+_SHIFT = 8 - _BITS
+
+# weight of a pixel without any chroma, so grey and black images still get their own color,
+# a fully saturated color outweighs ~50 times its area of grey
+_MIN_WEIGHT = 0.02
+
+
+def dominant_color(data: bytes, sample_size: int = 64) -> str:
+	"""The dominant color of an image, as "#rrggbb".
+
+	The image is scaled down to fit `sample_size`, its pixels are quantized to
+	4096 colors and counted, weighted by their chroma so a small saturated area
+	wins over a big grey one (an accent color rather than the average). The color
+	is the mean of the pixels of the biggest bucket.
+
+	Args:
+		data (bytes): the encoded image
+		sample_size (int): the image is scaled down to fit this many pixels wide and high
+
+	Returns:
+		str: the color as "#rrggbb"
+
+	Raises:
+		PIL.UnidentifiedImageError: if `data` isn't an image Pillow can read
+
+	"""
+	# Pillow and NumPy are optional dependencies (the `colors` extra), only import them when analyzing
+	import numpy as np
+	from PIL import Image
+
+	with Image.open(io.BytesIO(data)) as image:
+		# JPEGs are decoded at 1/2 to 1/8 of their size right away
+		image.draft("RGB", (sample_size, sample_size))
+		image = image.convert("RGB")
+		image.thumbnail((sample_size, sample_size), Image.Resampling.BILINEAR)
+		pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 3)
+
+	quantized = (pixels >> _SHIFT).astype(np.uint16)
+	buckets = (quantized[:, 0] << (2 * _BITS)) | (quantized[:, 1] << _BITS) | quantized[:, 2]
+
+	chroma = (pixels.max(axis=1) - pixels.min(axis=1)).astype(np.float32) / 255
+	weights = np.bincount(buckets, weights=chroma + _MIN_WEIGHT, minlength=1 << (3 * _BITS))
+
+	red, green, blue = pixels[buckets == weights.argmax()].mean(axis=0).round().astype(int)
+
+	return f"#{red:02x}{green:02x}{blue:02x}"
@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from functools import partial
+from pathlib import Path
+
+from aiohttp import ClientError, ClientSession
+from loguru import logger
+
+from ..util.config import ImagesConfig
+from ..util.http import ResponseTooLarge, fetch
+from ..util.singleflight import SingleFlight
+from .render import render_variant
+
+_STATUS_OK = 200
+
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+# evict down to this share of `max_size`, so not every new file triggers an eviction
+_EVICT_TO = 0.9
+
+
+class ImageNotFound(Exception):
+	"""The key isn't one of a proxied image."""
+
+
+class ImageError(Exception):
+	"""The source image couldn't be fetched or rendered."""
+
+
+@dataclass(slots=True)
+class ImageStats:
+	hits: int = 0
+	fetches: int = 0
+	renders: int = 0
+	evictions: int = 0
+	errors: int = 0
+	# bytes of the files in the cache, as far as this worker knows
+	size: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+@dataclass(slots=True, frozen=True)
+class Variant:
+	path: Path
+	media_type: str
+	etag: str
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+	partial_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+	partial_path.write_bytes(data)
+	os.replace(partial_path, path)
+
+
+def _touch(path: Path) -> bool:
+	"""Mark a cached file as just served, returns whether it's (still) there."""
+	try:
+		# the eviction order
+		os.utime(path)
+	except FileNotFoundError:
+		return False
+
+	return True
+
+
+class ImageProxy:
+	"""Proxies the album art and book covers and serves resized variants from a disk cache.
+
+	The api clients turn every image url into a proxy url with `url`, which records the
+	source url under its hash (the key) in `refs/`. The first request for a key fetches
+	the source into `blobs/`, addressed by the hash of its content so an image behind
+	two urls is stored once, and every variant (width and format) is rendered lazily in
+	a process pool into `variants/`. Files are written whole and then moved in place,
+	so the cache can be shared by every worker of the machine.
+
+	The cache is capped at `max_size` bytes. Serving a file updates its modification
+	time, once the cache is full the least recently served files are deleted.
+	"""
+
+	def __init__(self, config: ImagesConfig) -> None:
+		self._config = config
+		self._public_url = str(config.public_url).rstrip("/") if config.public_url is not None else None
+		self._widths = sorted(config.widths)
+
+		self._root = Path(config.directory)
+		self._refs = self._root / "refs"
+		self._blobs = self._root / "blobs"
+		self._variants = self._root / "variants"
+
+		for directory in (self._refs, self._blobs, self._variants):
+			directory.mkdir(parents=True, exist_ok=True)
+
+		# keys whose ref is known to be on disk
+		self._registered: set[str] = set()
+		self._fetches = SingleFlight()
+		self._renders = SingleFlight()
+		self._pool: ProcessPoolExecutor | None = None
+		self._size: int | None = None
+		self._evicting: asyncio.Task | None = None
+
+		self.stats = ImageStats()
+
+	@staticmethod
+	def key(source: str) -> str:
+		return hashlib.blake2b(source.encode(), digest_size=16).hexdigest()
+
+	def url(self, source: str) -> str:
+		"""The proxy url of the image at `source`, or `source` itself if no `public_url` is set."""
+		if self._public_url is None:
+			return source
+
+		key = self.key(source)
+
+		if key not in self._registered:
+			ref = self._refs / key
+
+			if not ref.exists():
+				_write_atomic(ref, source.encode())
+
+			self._registered.add(key)
+
+		return f"{self._public_url}/{key}"
+
+	def width(self, requested: int | None) -> int:
+		"""The variant width for a requested one, the next bigger configured width or the biggest."""
+		if requested is None:
+			return self._config.default_width
+
+		for width in self._widths:
+			if width >= requested:
+				return width
+
+		return self._widths[-1]
+
+	def negotiate(self, accept: str | None) -> str:
+		"""The preferred format the `Accept` header allows, "jpeg" if none."""
+		accept = accept or ""
+
+		for format in self._config.formats:
+			if MEDIA_TYPES[format] in accept:
+				return format
+
+		return "jpeg"
+
+	async def variant(self, session: ClientSession, key: str, width: int, format: str) -> Variant:
+		"""Get the variant of an image, fetching and rendering it if it's not cached.
+
+		Args:
+			session (ClientSession): used to fetch the source image
+			key (str): hash of the source url, from `url`
+			width (int): one of the configured widths
+			format (str): "avif", "webp" or "jpeg"
+
+		Returns:
+			Variant: the file of the variant
+
+		Raises:
+			ImageNotFound: if `key` isn't the key of a proxied image
+			ImageError: if the source image couldn't be fetched or rendered
+
+		"""
+		source_url, path = await asyncio.to_thread(self._lookup, key, width, format)
+
+		if path is not None:
+			self.stats.hits += 1
+		else:
+			blob = await self._fetches.do(key, lambda: self._source(session, key, source_url))
+			path = self._variant_path(blob.name, width, format)
+
+			if not await asyncio.to_thread(_touch, path):
+				await self._renders.do(path.name, lambda: self._render(blob, path, width, format))
+
+		return Variant(path, MEDIA_TYPES[format], f'"{path.name[:32]}-{width}.{format}"')
+
+	def _lookup(self, key: str, width: int, format: str) -> tuple[str, Path | None]:
+		"""The source url of `key` and its cached variant, touched, if there is one.
+
+		Touching it first makes it the most recently served file, so a file the eviction
+		deleted in between is a miss and a touched one isn't evicted before it's sent.
+		"""
+		try:
+			source_url = (self._refs / key).read_text()
+		except FileNotFoundError:
+			raise ImageNotFound(key) from None
+
+		# the variant might still be there when its source was evicted
+		digest = self._digest(key)
+
+		if digest is not None and _touch(path := self._variant_path(digest, width, format)):
+			return source_url, path
+
+		return source_url, None
+
+	def _digest(self, key: str) -> str | None:
+		# `refs/<key>.blob` has the content hash of the source once it's fetched
+		try:
+			return (self._refs / f"{key}.blob").read_text()
+		except FileNotFoundError:
+			return None
+
+	def _variant_path(self, digest: str, width: int, format: str) -> Path:
+		name = f"{digest}-{width}.{format}"
+		return self._variants / name[:2] / name
+
+	def _cached_blob(self, key: str) -> Path | None:
+		digest = self._digest(key)
+
+		if digest is not None and _touch(blob := self._blobs / digest[:2] / digest):
+			return blob
+
+		return None
+
+	async def _source(self, session: ClientSession, key: str, source_url: str) -> Path:
+		blob = await asyncio.to_thread(self._cached_blob, key)
+
+		if blob is not None:
+			return blob
+
+		self.stats.fetches += 1
+
+		try:
+			response = await fetch(session, "GET", source_url, max_size=self._config.max_source_size)
+		except (ClientError, TimeoutError) as e:
+			self.stats.errors += 1
+			raise ImageError(f"fetching {source_url} failed: {e!r}") from e
+		except ResponseTooLarge:
+			self.stats.errors += 1
+			raise ImageError(f"{source_url} is bigger than {self._config.max_source_size} bytes") from None
+
+		if response.status != _STATUS_OK:
+			self.stats.errors += 1
+			raise ImageError(f"fetching {source_url} failed with status {response.status}")
+
+		digest = hashlib.sha256(response.body).hexdigest()
+		blob = self._blobs / digest[:2] / digest
+
+		await asyncio.to_thread(self._write_blob, blob, response.body, self._refs / f"{key}.blob")
+		await self._added(len(response.body))
+
+		return blob
+
+	@staticmethod
+	def _write_blob(blob: Path, data: bytes, pointer: Path) -> None:
+		blob.parent.mkdir(exist_ok=True)
+
+		if not blob.exists():
+			_write_atomic(blob, data)
+
+		_write_atomic(pointer, blob.name.encode())
+
+	async def _render(self, blob: Path, path: Path, width: int, format: str) -> None:
+		if self._pool is None:
+			# spawned, forking a process with an event loop and threads isn't safe
+			self._pool = ProcessPoolExecutor(self._config.workers, mp_context=multiprocessing.get_context("spawn"))
+
+		path.parent.mkdir(exist_ok=True)
+		self.stats.renders += 1
+
+		try:
+			size = await asyncio.get_running_loop().run_in_executor(
+				self._pool,
+				partial(render_variant, str(blob), str(path), width, format, self._config.quality),
+			)
+		except Exception as e:
+			if isinstance(e, BrokenProcessPool):
+				# a worker died (e.g. killed for its memory), the pool takes no more work
+				self._pool.shutdown(wait=False)
+				self._pool = None
+
+			self.stats.errors += 1
+			raise ImageError(f"rendering {path.name} failed: {e!r}") from e
+
+		await self._added(size)
+
+	async def _added(self, size: int) -> None:
+		if self._size is None:
+			self._size = await asyncio.to_thread(self._disk_usage)
+
+		self._size += size
+		self.stats.size = self._size
+
+		if self._size > self._config.max_size and (self._evicting is None or self._evicting.done()):
+			self._evicting = asyncio.create_task(self._evict())
+
+	def _files(self) -> list[tuple[float, int, Path]]:
+		files = []
+
+		for directory in (self._blobs, self._variants):
+			for path in directory.glob("*/*"):
+				try:
+					stat = path.stat()
+				except FileNotFoundError:
+					# deleted by another worker
+					continue
+
+				files.append((stat.st_mtime, stat.st_size, path))
+
+		return files
+
+	def _disk_usage(self) -> int:
+		return sum(size for _, size, _ in self._files())
+
+	def _delete_oldest(self) -> tuple[int, int]:
+		files = sorted(self._files())
+		size = sum(size for _, size, _ in files)
+		target = self._config.max_size * _EVICT_TO
+		deleted = 0
+
+		for mtime, file_size, path in files:
+			if size <= target:
+				break
+
+			try:
+				# served since the listing, it's not among the least recently served anymore
+				if path.stat().st_mtime != mtime:
+					continue
+			except FileNotFoundError:
+				# deleted by another worker
+				size -= file_size
+				continue
+
+			# a deleted blob is fetched again the next time one of its variants is missing
+			path.unlink(missing_ok=True)
+			size -= file_size
+			deleted += 1
+
+		return size, deleted
+
+	async def _evict(self) -> None:
+		try:
+			self._size, deleted = await asyncio.to_thread(self._delete_oldest)
+		except OSError as e:
+			logger.warning(f"Evicting from the image cache failed: {e!r}")
+			return
+
+		self.stats.evictions += deleted
+		self.stats.size = self._size
+
+	async def close(self) -> None:
+		if self._evicting is not None:
+			await asyncio.gather(self._evicting, return_exceptions=True)
+
+		if self._pool is not None:
+			self._pool.shutdown(cancel_futures=True)
+			self._pool = None
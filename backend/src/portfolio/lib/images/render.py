@@ -0,0 +1,51 @@
+import os
+
+# Pillow's format names
+_PIL_FORMATS = {"avif": "AVIF", "webp": "WEBP", "jpeg": "JPEG"}
+
+
+def render_variant(source: str, destination: str, width: int, format: str, quality: int) -> int:
+	"""Write `source` scaled down to `width` (never up) in `format` to `destination`.
+
+	The file is written next to `destination` and moved there once complete, so
+	readers never see a partial file.
+
+	Args:
+		source (str): path of the source image
+		destination (str): path of the variant
+		width (int): width of the variant, the height keeps the aspect ratio
+		format (str): "avif", "webp" or "jpeg"
+		quality (int): encoder quality, 1 to 100
+
+	Returns:
+		int: size of the variant in bytes
+
+	Raises:
+		PIL.UnidentifiedImageError: if the source isn't an image Pillow can read
+
+	"""
+	# Pillow is an optional dependency (the `images` extra), only import it when rendering
+	from PIL import Image, ImageOps
+
+	with Image.open(source) as opened:
+		image = ImageOps.exif_transpose(opened)
+
+		if image.width > width:
+			height = max(round(image.height * width / image.width), 1)
+			image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+		has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+		image = image.convert("RGBA" if has_alpha and format != "jpeg" else "RGB")
+
+		partial = f"{destination}.{os.getpid()}.tmp"
+
+		try:
+			image.save(partial, format=_PIL_FORMATS[format], quality=quality)
+			os.replace(partial, destination)
+		except BaseException:
+			if os.path.exists(partial):
+				os.remove(partial)
+
+			raise
+
+	return os.path.getsize(destination)
@@ -0,0 +1,71 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..analytics.enrich import Enricher
+from ..analytics.events import VisitEvent
+from ..analytics.pipeline import AnalyticsPipeline
+from .request import route_path
+
+
+class AnalyticsMiddleware:
+	"""Records a `VisitEvent` for every request to the tracked routes.
+
+	Recording only pushes a small tuple into the pipeline's in-memory buffer once the
+	response has started, the database write happens later in the background.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		pipeline: AnalyticsPipeline,
+		enricher: Enricher,
+		paths: list[str],
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			pipeline (AnalyticsPipeline): receives the events
+			enricher (Enricher): the IP, country and platform of the clients
+			paths (list[str]): path prefixes of the tracked routes
+
+		"""
+		self.app = app
+		self._pipeline = pipeline
+		self._enricher = enricher
+		self._paths = tuple(paths)
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		path = route_path(scope)
+
+		if not path.startswith(self._paths):
+			await self.app(scope, receive, send)
+			return
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				self._record(scope, path, message["status"])
+
+			await send(message)
+
+		await self.app(scope, receive, send_wrapper)
+
+	def _record(self, scope: Scope, path: str, status: int) -> None:
+		client = self._enricher.client(scope)
+
+		self._pipeline.record(
+			VisitEvent(
+				ts=time.time(),
+				visitor=self._pipeline.visitor_id(client.ip, client.user_agent),
+				path=path,
+				status=status,
+				country=client.country,
+				platform=client.platform,
+			)
+		)
@@ -0,0 +1,52 @@
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..util.blocklist import Blocklist
+from .request import client_ip
+
+_STATUS_FORBIDDEN = 403
+
+# 1008 Policy Violation
+_WS_CLOSE_POLICY_VIOLATION = 1008
+
+# seconds between two purges of the expired entries
+_PURGE_INTERVAL = 60.0
+
+
+class BlocklistMiddleware:
+	"""Rejects requests of blocked client IPs before anything else runs.
+
+	This should be the outermost middleware, a blocked client gets a bare `403` without
+	going through CORS, rate limiting or the router.
+	"""
+
+	def __init__(self, app: ASGIApp, *, blocklist: Blocklist, forwarded_header: str | None = None) -> None:
+		self.app = app
+		self._blocklist = blocklist
+		self._forwarded_header = forwarded_header.lower().encode() if forwarded_header else None
+		self._next_purge = 0.0
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] not in ("http", "websocket"):
+			await self.app(scope, receive, send)
+			return
+
+		now = time.time()
+
+		if now >= self._next_purge:
+			self._blocklist.purge(now)
+			self._next_purge = now + _PURGE_INTERVAL
+
+		if not self._blocklist.is_blocked(client_ip(scope, self._forwarded_header), now):
+			await self.app(scope, receive, send)
+			return
+
+		self._blocklist.stats.blocked_requests += 1
+
+		if scope["type"] == "websocket":
+			await send({"type": "websocket.close", "code": _WS_CLOSE_POLICY_VIOLATION})
+			return
+
+		await send({"type": "http.response.start", "status": _STATUS_FORBIDDEN, "headers": [(b"content-length", b"0")]})
+		await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,114 @@
+import json
+import time
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from ..util.challenge import ProofOfWork
+from .request import client_ip, route_path
+
+_STATUS_UNAUTHORIZED = 401
+
+# 1008 Policy Violation
+_WS_CLOSE_POLICY_VIOLATION = 1008
+
+
+class ProofOfWorkMiddleware:
+	"""Lets only clients with a proof of work pass through to the protected routes.
+
+	A pass is sent in the `header` or the `cookie_name` cookie, getting one is up to
+	the client: it solves a challenge from `GET /challenge` and redeems it with
+	`POST /challenge`. Requests without a valid pass get a `401` with a fresh
+	challenge, so a scraper can't reach the routes that call Spotify or Hardcover
+	without paying for every pass. CORS preflights always pass.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		proof_of_work: ProofOfWork,
+		paths: list[str],
+		header: str = "X-PoW-Pass",
+		cookie_name: str = "pow_pass",
+		bind_ip: bool = True,
+		forwarded_header: str | None = None,
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			proof_of_work (ProofOfWork): checks the passes and makes the challenges
+			paths (list[str]): path prefixes of the protected routes
+			header (str): request header with the pass
+			cookie_name (str): cookie with the pass, for browsers
+			bind_ip (bool): passes are only valid from the IP they were issued to
+			forwarded_header (str | None): header with the client IP set by the reverse proxy
+
+		"""
+		self.app = app
+		self._proof_of_work = proof_of_work
+		self._paths = tuple(paths)
+		self._header = header.lower().encode()
+		self._cookie_prefix = cookie_name.encode() + b"="
+		self._bind_ip = bind_ip
+		self._forwarded_header = forwarded_header.lower().encode() if forwarded_header else None
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if (
+			scope["type"] not in ("http", "websocket")
+			or scope.get("method") == "OPTIONS"
+			or not route_path(scope).startswith(self._paths)
+		):
+			await self.app(scope, receive, send)
+			return
+
+		now = time.time()
+		token = self._token(scope)
+		client = client_ip(scope, self._forwarded_header) if self._bind_ip else ""
+
+		if token is not None and self._proof_of_work.check_pass(token, client, now):
+			self._proof_of_work.stats.passed += 1
+			await self.app(scope, receive, send)
+			return
+
+		self._proof_of_work.stats.challenged += 1
+
+		if scope["type"] == "websocket":
+			await send({"type": "websocket.close", "code": _WS_CLOSE_POLICY_VIOLATION})
+			return
+
+		body = json.dumps(
+			{
+				"error": "ChallengeRequired",
+				"message": "Solve the proof of work challenge and send the pass from POST /challenge",
+				"challenge": self._proof_of_work.challenge(now),
+				"difficulty": self._proof_of_work.difficulty,
+			}
+		).encode()
+
+		await send(
+			{
+				"type": "http.response.start",
+				"status": _STATUS_UNAUTHORIZED,
+				"headers": [
+					(b"content-type", b"application/json"),
+					(b"content-length", str(len(body)).encode()),
+					(b"cache-control", b"no-store"),
+				],
+			}
+		)
+		await send({"type": "http.response.body", "body": body})
+
+	def _token(self, scope: Scope) -> bytes | None:
+		for name, value in scope["headers"]:
+			if name == self._header:
+				return value
+
+			if name == b"cookie":
+				for pair in value.split(b";"):
+					pair = pair.strip()
+
+					if pair.startswith(self._cookie_prefix):
+						return pair[len(self._cookie_prefix) :]
+
+		return None
@@ -0,0 +1,167 @@
+import hashlib
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .request import route_path
+
+_STATUS_OK = 200
+_STATUS_NOT_MODIFIED = 304
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+	if if_none_match.strip() == "*":
+		return True
+
+	# If-None-Match uses the weak comparison, so `W/"x"` matches `"x"`
+	return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+class ETagMiddleware:
+	"""Adds a strong `ETag` and a per route `Cache-Control` to successful GET responses.
+
+	Requests whose `If-None-Match` matches the ETag are answered with `304 Not Modified`
+	and no body. The ETag of the last body of every url is kept, so a body that didn't
+	change is only compared with the previous one and isn't hashed again. The urls are
+	keyed by their sorted query parameters, and the kept bodies are bounded by
+	`max_cached_bytes` in total as well as by `max_entries`, so junk query strings can
+	cycle the entries but can't pile up memory.
+
+	Only responses with a `Content-Length` up to `max_body_size` are buffered,
+	streaming responses (e.g. Server-Sent Events) and responses that already have
+	an ETag (e.g. files) pass through untouched.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		cache_control: dict[str, str],
+		max_entries: int = 256,
+		max_body_size: int = 1 << 20,
+		max_cached_bytes: int = 4 << 20,
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			cache_control (dict[str, str]): `Cache-Control` value per path prefix, the longest prefix wins
+			max_entries (int): how many urls' last body and ETag are kept
+			max_body_size (int): bigger responses aren't buffered
+			max_cached_bytes (int): total size of the kept bodies, the least recently used
+				ones are dropped beyond it
+
+		"""
+		self.app = app
+		self._cache_control = sorted(cache_control.items(), key=lambda item: len(item[0]), reverse=True)
+		self._max_entries = max_entries
+		self._max_body_size = max_body_size
+		self._max_cached_bytes = max_cached_bytes
+		self._etags: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+		self._cached_bytes = 0
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http" or scope["method"] != "GET":
+			await self.app(scope, receive, send)
+			return
+
+		path = route_path(scope)
+		key = _url_key(path, scope["query_string"])
+		cache_control = self._cache_control_for(path)
+		if_none_match = Headers(scope=scope).get("if-none-match")
+
+		start: Message | None = None
+		chunks: list[bytes] = []
+		passthrough = False
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal start, passthrough
+
+			if passthrough:
+				await send(message)
+				return
+
+			if message["type"] == "http.response.start":
+				headers = Headers(raw=message["headers"])
+				content_length = headers.get("content-length")
+
+				if (
+					message["status"] != _STATUS_OK
+					or content_length is None
+					or int(content_length) > self._max_body_size
+					or "etag" in headers
+				):
+					passthrough = True
+					await send(message)
+					return
+
+				start = message
+				return
+
+			chunks.append(message.get("body", b""))
+
+			if message.get("more_body", False):
+				return
+
+			assert start is not None
+			body = b"".join(chunks)
+			etag = self._etag(key, body)
+
+			headers = MutableHeaders(raw=start["headers"])
+			headers["etag"] = etag
+
+			if cache_control and "cache-control" not in headers:
+				headers["cache-control"] = cache_control
+
+			if if_none_match is not None and etag_matches(if_none_match, etag):
+				del headers["content-length"]
+				del headers["content-type"]
+
+				await send({**start, "status": _STATUS_NOT_MODIFIED})
+				await send({"type": "http.response.body", "body": b""})
+				return
+
+			await send(start)
+			await send({"type": "http.response.body", "body": body})
+
+		await self.app(scope, receive, send_wrapper)
+
+	def _cache_control_for(self, path: str) -> str | None:
+		for prefix, value in self._cache_control:
+			if path.startswith(prefix):
+				return value
+
+		return None
+
+	def _etag(self, key: str, body: bytes) -> str:
+		cached = self._etags.get(key)
+
+		if cached is not None and cached[0] == body:
+			self._etags.move_to_end(key)
+			return cached[1]
+
+		etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+		if cached is not None:
+			del self._etags[key]
+			self._cached_bytes -= len(cached[0])
+
+		if len(body) <= self._max_cached_bytes:
+			self._etags[key] = (body, etag)
+			self._cached_bytes += len(body)
+
+		while len(self._etags) > self._max_entries or self._cached_bytes > self._max_cached_bytes:
+			_, (evicted, _) = self._etags.popitem(last=False)
+			self._cached_bytes -= len(evicted)
+
+		return etag
+
+
+def _url_key(path: str, query_string: bytes) -> str:
+	"""The path with its query parameters sorted, so their order doesn't make another entry."""
+	if not query_string:
+		return path
+
+	return path + "?" + urlencode(sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)))
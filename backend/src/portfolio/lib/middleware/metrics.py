@@ -0,0 +1,58 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..util.metrics import REGISTRY
+
+IN_FLIGHT = REGISTRY.gauge(
+	"portfolio_http_requests_in_flight",
+	"Requests being handled right now",
+)
+# its `_count` is the number of requests
+LATENCY = REGISTRY.histogram(
+	"portfolio_http_request_duration_seconds",
+	"Time until the response was fully sent, by route template, method and status",
+	("route", "method", "status"),
+)
+
+# label of the requests that matched no route, so scanners can't create new label values
+_UNMATCHED = "unmatched"
+
+
+class MetricsMiddleware:
+	"""Records the number of requests in flight and the latency (and so the count) of the requests by route.
+
+	Requests are labelled with the template of the route that handled them
+	(`/spotify/top-{type}`) instead of the path, so the number of label values stays
+	bounded. The router puts the route in the scope, it's only known once the request
+	was routed, so the in-flight gauge has no route label.
+	"""
+
+	def __init__(self, app: ASGIApp) -> None:
+		self.app = app
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		status = 500
+		start = time.perf_counter()
+
+		async def send_wrapper(message: Message) -> None:
+			nonlocal status
+
+			if message["type"] == "http.response.start":
+				status = message["status"]
+
+			await send(message)
+
+		IN_FLIGHT.inc()
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			IN_FLIGHT.dec()
+
+			route = getattr(scope.get("route"), "path", _UNMATCHED)
+			LATENCY.observe((route, scope["method"], str(status)), time.perf_counter() - start)
@@ -0,0 +1,78 @@
+import random
+import secrets
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..util.profiler import RequestProfiler
+from .request import route_path
+
+
+class ProfilingMiddleware:
+	"""Profiles the requests that ask for it with the token in a header, and a sample of the others.
+
+	A request that isn't profiled only costs the header lookup (and a random number
+	with a `sample_rate`), the sampling thread only runs for profiled ones. The id of
+	the profile is sent back in the `X-Profile-Id` header.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		profiler: RequestProfiler,
+		header: str,
+		token: str | None = None,
+		sample_rate: float = 0.0,
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			profiler (RequestProfiler): profiles the requests and keeps the profiles
+			header (str): request header that asks for a profile
+			token (str | None): value `header` must have, `None` ignores the header
+			sample_rate (float): share of the requests profiled without asking
+
+		"""
+		self.app = app
+		self._profiler = profiler
+		self._header = header.lower().encode()
+		self._token = token.encode() if token else None
+		self._sample_rate = sample_rate
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http" or not self._wants_profile(scope):
+			await self.app(scope, receive, send)
+			return
+
+		started = self._profiler.start(scope["method"], route_path(scope))
+
+		# enough requests are being profiled already
+		if started is None:
+			await self.app(scope, receive, send)
+			return
+
+		profile, sampler = started
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile.id.encode())]
+
+			await send(message)
+
+		try:
+			await self.app(scope, receive, send_wrapper)
+		finally:
+			self._profiler.finish(profile, sampler)
+
+	def _wants_profile(self, scope: Scope) -> bool:
+		if self._token is not None:
+			for name, value in scope["headers"]:
+				if name == self._header:
+					if secrets.compare_digest(value, self._token):
+						return True
+
+					# a wrong token is sampled like any other request
+					break
+
+		return self._sample_rate > 0 and random.random() < self._sample_rate
@@ -0,0 +1,129 @@
+import json
+import math
+import time
+from collections.abc import Callable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..util.config import RateLimitRule
+from ..util.ratelimit import RateLimitResult, SlidingWindowLog, TokenBucket, retry_after_header
+from .request import client_ip, route_path
+
+_STATUS_TOO_MANY_REQUESTS = 429
+
+# 1008 Policy Violation, a websocket can't be answered with a 429
+_WS_CLOSE_POLICY_VIOLATION = 1008
+
+_LIMITED_BODY = json.dumps({"error": "RateLimited", "message": "too many requests, slow down"}).encode()
+
+
+class RateLimitMiddleware:
+	"""Limits the requests of every client IP per route, before they reach the routers.
+
+	Each rule covers the routes under its path prefix (the longest matching prefix wins)
+	and has its own limiter, either a token bucket or a sliding window log. Responses of
+	limited routes carry the `RateLimit-*` headers, and rejected requests get a `429`
+	with `Retry-After`.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		rules: list[RateLimitRule],
+		max_keys: int,
+		exempt: list[str] | None = None,
+		forwarded_header: str | None = None,
+		on_limited: Callable[[str], None] | None = None,
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			rules (list[RateLimitRule]): limits per path prefix
+			max_keys (int): clients kept per rule, the least recently seen are evicted first
+			exempt (list[str] | None): client IPs that are never limited
+			forwarded_header (str | None): header with the client IP set by the reverse proxy
+			on_limited (Callable[[str], None] | None): called with the client IP of every rejected request
+
+		"""
+		self.app = app
+		self._exempt = frozenset(exempt or ())
+		self._forwarded_header = forwarded_header.lower().encode() if forwarded_header else None
+		self._on_limited = on_limited
+
+		self._rules: list[tuple[str, TokenBucket | SlidingWindowLog, bytes]] = []
+
+		for rule in sorted(rules, key=lambda rule: len(rule.prefix), reverse=True):
+			limiter_class = TokenBucket if rule.algorithm == "token_bucket" else SlidingWindowLog
+			limiter = limiter_class(rule.limit, rule.window, max_keys)
+			policy = f"{rule.limit};w={rule.window:g}".encode()
+
+			self._rules.append((rule.prefix, limiter, policy))
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] not in ("http", "websocket"):
+			await self.app(scope, receive, send)
+			return
+
+		path = route_path(scope)
+
+		for prefix, limiter, policy in self._rules:
+			if path.startswith(prefix):
+				break
+		else:
+			await self.app(scope, receive, send)
+			return
+
+		ip = client_ip(scope, self._forwarded_header)
+
+		if ip in self._exempt:
+			await self.app(scope, receive, send)
+			return
+
+		result = limiter.hit(ip, time.monotonic())
+
+		if not result.allowed:
+			if self._on_limited is not None:
+				self._on_limited(ip)
+
+			await self._reject(scope, send, result, policy)
+			return
+
+		if scope["type"] == "websocket":
+			await self.app(scope, receive, send)
+			return
+
+		headers = _headers(result, policy)
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				message["headers"] = [*message.get("headers", ()), *headers]
+
+			await send(message)
+
+		await self.app(scope, receive, send_wrapper)
+
+	async def _reject(self, scope: Scope, send: Send, result: RateLimitResult, policy: bytes) -> None:
+		if scope["type"] == "websocket":
+			await send({"type": "websocket.close", "code": _WS_CLOSE_POLICY_VIOLATION})
+			return
+
+		headers = [
+			(b"content-type", b"application/json"),
+			(b"content-length", str(len(_LIMITED_BODY)).encode()),
+			(b"retry-after", retry_after_header(result.retry_after).encode()),
+			*_headers(result, policy),
+		]
+
+		await send({"type": "http.response.start", "status": _STATUS_TOO_MANY_REQUESTS, "headers": headers})
+		await send({"type": "http.response.body", "body": _LIMITED_BODY})
+
+
+def _headers(result: RateLimitResult, policy: bytes) -> list[tuple[bytes, bytes]]:
+	return [
+		(b"ratelimit-limit", str(result.limit).encode()),
+		(b"ratelimit-remaining", str(result.remaining).encode()),
+		(b"ratelimit-reset", str(math.ceil(result.reset)).encode()),
+		(b"ratelimit-policy", policy),
+	]
@@ -0,0 +1,33 @@
+from starlette.types import Scope
+
+
+def route_path(scope: Scope) -> str:
+	"""Path of the request without the app's `root_path`, the way the router sees it."""
+	path: str = scope["path"]
+	root_path: str = scope.get("root_path", "")
+
+	if root_path and path.startswith(root_path):
+		return path[len(root_path) :] or "/"
+
+	return path
+
+
+def client_ip(scope: Scope, forwarded_header: bytes | None) -> str:
+	"""IP address of the client that sent the request.
+
+	Behind the reverse proxy the peer is the proxy itself, so the last address of
+	`forwarded_header` (the one the proxy appended) is used when it's present.
+
+	Args:
+		scope (Scope): the ASGI scope of the request
+		forwarded_header (bytes | None): lowercase name of the header, e.g. `b"x-forwarded-for"`
+
+	"""
+	if forwarded_header is not None:
+		for name, value in scope["headers"]:
+			if name == forwarded_header:
+				return value.decode("latin-1").rsplit(",", 1)[-1].strip()
+
+	client = scope.get("client")
+
+	return client[0] if client else ""
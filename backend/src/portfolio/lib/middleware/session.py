@@ -0,0 +1,144 @@
+import time
+from typing import Literal
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..analytics.enrich import Enricher
+from ..sessions.session import Session, SessionSigner
+from ..sessions.store import SessionStore
+from .request import route_path
+
+# a returning session gets a fresh cookie if it was last seen this long ago (seconds),
+# so the cookie outlives the server side session as long as it's in use
+_COOKIE_REFRESH = 24 * 60 * 60
+
+# seconds between two expiries of the store
+_EXPIRE_INTERVAL = 60
+
+
+def _cookie(header: bytes, name: bytes) -> bytes | None:
+	"""The value of the cookie `name` in a `Cookie` header."""
+	for pair in header.split(b";"):
+		key, _, value = pair.strip().partition(b"=")
+
+		if key == name:
+			return value
+
+	return None
+
+
+class SessionMiddleware:
+	"""Gives every browser a session, identified by a signed cookie.
+
+	A request with a valid cookie gets its session updated (last seen, request count)
+	and put into `request.state.session`. Requests without one get a new session and
+	the cookie, except bots (by user agent), which would only fill the store. The
+	cookie holds nothing but the signed session id.
+
+	Responses that set the cookie are made `private`, so a shared cache never hands
+	one visitor's cookie to another.
+	"""
+
+	def __init__(
+		self,
+		app: ASGIApp,
+		*,
+		store: SessionStore,
+		signer: SessionSigner,
+		enricher: Enricher,
+		paths: list[str],
+		cookie_name: str = "session",
+		secure: bool = True,
+		same_site: Literal["lax", "strict", "none"] = "lax",
+	) -> None:
+		"""Initialize the middleware.
+
+		Args:
+			app (ASGIApp): the wrapped application
+			store (SessionStore): where the sessions are kept
+			signer (SessionSigner): signs and checks the cookies
+			enricher (Enricher): the IP, country and platform of new sessions
+			paths (list[str]): path prefixes of the routes that take part in sessions
+			cookie_name (str): name of the session cookie
+			secure (bool): only send the cookie over HTTPS
+			same_site (str): the cookie's `SameSite` attribute
+
+		"""
+		self.app = app
+		self._store = store
+		self._signer = signer
+		self._enricher = enricher
+		self._paths = tuple(paths)
+		self._cookie_name = cookie_name.encode()
+		self._cookie_attributes = f"; Path=/; Max-Age={store.ttl}; HttpOnly; SameSite={same_site.capitalize()}" + (
+			"; Secure" if secure else ""
+		)
+		self._next_expire = 0
+
+	async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+		if scope["type"] != "http" or not route_path(scope).startswith(self._paths):
+			await self.app(scope, receive, send)
+			return
+
+		now = int(time.time())
+
+		if now >= self._next_expire:
+			self._next_expire = now + _EXPIRE_INTERVAL
+			await self._store.expire(now)
+
+		cookie = None
+
+		for name, value in scope["headers"]:
+			if name == b"cookie":
+				cookie = _cookie(value, self._cookie_name)
+
+		session = await self._session(cookie, now)
+		set_cookie = session is None or now - session.last_seen >= _COOKIE_REFRESH
+
+		if session is not None:
+			session.last_seen = now
+			session.requests += 1
+			await self._store.save(session)
+		else:
+			client = self._enricher.client(scope)
+
+			if client.platform == "bot":
+				await self.app(scope, receive, send)
+				return
+
+			session = Session.new(now, client.ip, client.platform, client.country)
+
+			if not await self._store.save(session):
+				await self.app(scope, receive, send)
+				return
+
+		scope.setdefault("state", {})["session"] = session
+
+		if not set_cookie:
+			await self.app(scope, receive, send)
+			return
+
+		header = (self._cookie_name.decode() + "=" + self._signer.sign(session.id) + self._cookie_attributes).encode()
+
+		async def send_wrapper(message: Message) -> None:
+			if message["type"] == "http.response.start":
+				headers = [(name, value) for name, value in message["headers"] if name != b"cache-control"]
+				headers.append((b"set-cookie", header))
+				headers.append((b"cache-control", b"private, no-store"))
+				message["headers"] = headers
+
+			await send(message)
+
+		await self.app(scope, receive, send_wrapper)
+
+	async def _session(self, cookie: bytes | None, now: int) -> Session | None:
+		if cookie is None:
+			return None
+
+		id = self._signer.verify(cookie)
+		session = await self._store.get(id, now) if id is not None else None
+
+		if session is None:
+			self._store.stats.invalid += 1
+
+		return session
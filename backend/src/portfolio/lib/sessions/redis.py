@@ -0,0 +1,53 @@
+from typing import Any
+
+from .session import Session
+from .store import SessionStore
+
+
+class RedisSessionStore(SessionStore):
+	"""A `SessionStore` on Redis, shared by every worker that connects to the same server.
+
+	Every session is a key holding its packed record, Redis expires it `ttl` seconds
+	after it was last saved.
+	"""
+
+	def __init__(self, client: Any, ttl: int, *, key_prefix: str = "") -> None:
+		"""Initialize the store.
+
+		Args:
+			client (Any): a `redis.asyncio.Redis` client, or a compatible fake in tests
+			ttl (int): seconds a session lives after it was last seen
+			key_prefix (str): prepended to every key, to share a server with other applications
+
+		"""
+		super().__init__(ttl)
+		self._client = client
+		self._prefix = key_prefix.encode() + b"session:"
+
+	@classmethod
+	def from_url(cls, url: str, ttl: int, *, key_prefix: str = "") -> "RedisSessionStore":
+		"""Connect to the Redis server at `url`, e.g. `redis://localhost:6379/0`.
+
+		Raises:
+			ImportError: if the `redis` package isn't installed
+
+		"""
+		from redis.asyncio import Redis
+
+		return cls(Redis.from_url(url), ttl, key_prefix=key_prefix)
+
+	async def get(self, id: bytes, now: int) -> Session | None:
+		record = await self._client.get(self._prefix + id)
+
+		return Session.unpack(id, record) if record is not None else None
+
+	async def save(self, session: Session) -> bool:
+		await self._client.set(self._prefix + session.id, session.pack(), ex=self.ttl)
+
+		if session.requests == 1:
+			self.stats.created += 1
+
+		return True
+
+	async def close(self) -> None:
+		await self._client.aclose()
@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+
+from ..util.wheel import TimingWheel
+from .session import Session
+
+# buckets of the timing wheel per `ttl`, sessions expire at most `ttl / _WHEEL_BUCKETS` late
+_WHEEL_BUCKETS = 256
+
+
+@dataclass(slots=True)
+class SessionStats:
+	created: int = 0
+	expired: int = 0
+	# not created because the store was full
+	rejected: int = 0
+	# cookies that failed the signature check or named an unknown session
+	invalid: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class SessionStore(ABC):
+	"""Where the sessions live, they expire `ttl` seconds after they were last seen."""
+
+	def __init__(self, ttl: int) -> None:
+		self.ttl = ttl
+		self.stats = SessionStats()
+
+	@abstractmethod
+	async def get(self, id: bytes, now: int) -> Session | None:
+		"""Return the session `id`, `None` if it doesn't exist or has expired."""
+
+	@abstractmethod
+	async def save(self, session: Session) -> bool:
+		"""Store a new or updated session, returns `False` if a new one didn't fit."""
+
+	async def expire(self, now: int) -> int:
+		"""Remove the expired sessions, returns how many were removed."""
+		return 0
+
+	async def count(self) -> int | None:
+		"""The number of stored sessions, `None` if the store can't tell cheaply."""
+		return None
+
+	async def close(self) -> None:
+		"""Release the resources of the store."""
+
+
+class MemorySessionStore(SessionStore):
+	"""A `SessionStore` in the memory of a single process.
+
+	Sessions are packed records in a dict keyed by their id, and a `TimingWheel` of
+	their ids hands out the ones that may have expired, so expiring costs O(expired
+	sessions). A session that's used again isn't moved on the wheel, it's checked and
+	scheduled again when its old deadline comes. At most `max_sessions` are kept, new
+	sessions are rejected while it's full.
+	"""
+
+	def __init__(self, ttl: int, *, max_sessions: int, now: int) -> None:
+		super().__init__(ttl)
+		self._max_sessions = max_sessions
+		self._records: dict[bytes, bytes] = {}
+		self._wheel: TimingWheel[bytes] = TimingWheel(ttl, max(ttl / _WHEEL_BUCKETS, 1), now)
+
+	async def get(self, id: bytes, now: int) -> Session | None:
+		record = self._records.get(id)
+
+		if record is None:
+			return None
+
+		session = Session.unpack(id, record)
+
+		# expired, the wheel will remove it
+		if session.last_seen + self.ttl <= now:
+			return None
+
+		return session
+
+	async def save(self, session: Session) -> bool:
+		is_new = session.id not in self._records
+
+		if is_new and len(self._records) >= self._max_sessions:
+			self.stats.rejected += 1
+			return False
+
+		self._records[session.id] = session.pack()
+
+		if is_new:
+			self._wheel.schedule(session.id, session.last_seen + self.ttl)
+			self.stats.created += 1
+
+		return True
+
+	async def expire(self, now: int) -> int:
+		expired = 0
+
+		for id in self._wheel.advance(now):
+			record = self._records.get(id)
+
+			if record is None:
+				continue
+
+			deadline = Session.unpack(id, record).last_seen + self.ttl
+
+			if deadline <= now:
+				del self._records[id]
+				expired += 1
+			else:
+				self._wheel.schedule(id, deadline)
+
+		self.stats.expired += expired
+
+		return expired
+
+	async def count(self) -> int:
+		return len(self._records)
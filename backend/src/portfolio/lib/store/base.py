@@ -0,0 +1,41 @@
+from abc import ABC, abstractmethod
+
+
+class StoreBackend(ABC):
+	"""A key/value store shared by every worker, used for cached responses and tokens.
+
+	Values are opaque bytes, keys are namespaced by the caller. Locks are advisory,
+	they expire after `ttl` seconds so a crashed worker can't hold one forever.
+	"""
+
+	@abstractmethod
+	async def get(self, key: str) -> bytes | None:
+		"""Return the value of `key`, or `None` if it doesn't exist or has expired."""
+
+	@abstractmethod
+	async def set(self, key: str, value: bytes, *, ttl: float | None = None) -> None:
+		"""Store `value` under `key`, removed after `ttl` seconds if given."""
+
+	@abstractmethod
+	async def set_if_absent(self, key: str, value: bytes, *, ttl: float) -> bool:
+		"""Store `value` under `key` for `ttl` seconds unless the key exists, returns whether it was stored."""
+
+	@abstractmethod
+	async def delete(self, key: str) -> None:
+		"""Remove `key` if it exists."""
+
+	@abstractmethod
+	async def acquire_lock(self, name: str, *, ttl: float) -> str | None:
+		"""Try to take the lock `name` without waiting.
+
+		Returns:
+			str | None: a token to release the lock with, `None` if somebody else holds it
+
+		"""
+
+	@abstractmethod
+	async def release_lock(self, name: str, token: str) -> None:
+		"""Release the lock `name` if it's still held with `token`."""
+
+	async def close(self) -> None:
+		"""Release the resources of the backend."""
@@ -0,0 +1,84 @@
+import heapq
+import secrets
+import time
+
+from .base import StoreBackend
+
+
+class MemoryBackend(StoreBackend):
+	"""A `StoreBackend` that lives in the memory of a single process.
+
+	This is the default when only one worker is running, it doesn't share anything
+	between processes. Expired keys are removed when they are read, and on writes,
+	so keys that are never read again (e.g. redeemed challenges) don't pile up.
+	"""
+
+	def __init__(self) -> None:
+		self._values: dict[str, tuple[bytes, float | None]] = {}
+		self._locks: dict[str, tuple[str, float]] = {}
+		# (expiry, key) of the keys with a ttl, a key that was set again has a newer entry too
+		self._expiries: list[tuple[float, str]] = []
+
+	async def get(self, key: str) -> bytes | None:
+		item = self._values.get(key)
+
+		if item is None:
+			return None
+
+		value, expires_at = item
+
+		if expires_at is not None and expires_at <= time.monotonic():
+			del self._values[key]
+			return None
+
+		return value
+
+	async def set(self, key: str, value: bytes, *, ttl: float | None = None) -> None:
+		self._set(key, value, ttl, time.monotonic())
+
+	async def set_if_absent(self, key: str, value: bytes, *, ttl: float) -> bool:
+		now = time.monotonic()
+		item = self._values.get(key)
+
+		if item is not None and (item[1] is None or item[1] > now):
+			return False
+
+		self._set(key, value, ttl, now)
+
+		return True
+
+	async def delete(self, key: str) -> None:
+		self._values.pop(key, None)
+
+	async def acquire_lock(self, name: str, *, ttl: float) -> str | None:
+		now = time.monotonic()
+		held = self._locks.get(name)
+
+		if held is not None and held[1] > now:
+			return None
+
+		token = secrets.token_hex(16)
+		self._locks[name] = (token, now + ttl)
+
+		return token
+
+	async def release_lock(self, name: str, token: str) -> None:
+		held = self._locks.get(name)
+
+		if held is not None and held[0] == token:
+			del self._locks[name]
+
+	def _set(self, key: str, value: bytes, ttl: float | None, now: float) -> None:
+		while self._expiries and self._expiries[0][0] <= now:
+			expires_at, expired = heapq.heappop(self._expiries)
+			item = self._values.get(expired)
+
+			# only if it wasn't set again since
+			if item is not None and item[1] == expires_at:
+				del self._values[expired]
+
+		expires_at = now + ttl if ttl is not None else None
+		self._values[key] = (value, expires_at)
+
+		if expires_at is not None:
+			heapq.heappush(self._expiries, (expires_at, key))
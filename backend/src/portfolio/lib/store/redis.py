@@ -0,0 +1,67 @@
+import secrets
+from typing import Any
+
+from .base import StoreBackend
+
+# delete the lock only if it's still ours, in a single atomic step
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+	return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackend(StoreBackend):
+	"""A `StoreBackend` on Redis, shared by every worker that connects to the same server.
+
+	Locks are `SET NX PX` keys holding a random token, released with a compare-and-delete script.
+	"""
+
+	def __init__(self, client: Any, *, key_prefix: str = "") -> None:
+		"""Initialize the backend.
+
+		Args:
+			client (Any): a `redis.asyncio.Redis` client, or a compatible fake in tests
+			key_prefix (str): prepended to every key, to share a server with other applications
+
+		"""
+		self._client = client
+		self._prefix = key_prefix
+		self._release_lock = client.register_script(_RELEASE_LOCK)
+
+	@classmethod
+	def from_url(cls, url: str, *, key_prefix: str = "") -> "RedisBackend":
+		"""Connect to the Redis server at `url`, e.g. `redis://localhost:6379/0`.
+
+		Raises:
+			ImportError: if the `redis` package isn't installed
+
+		"""
+		from redis.asyncio import Redis
+
+		return cls(Redis.from_url(url), key_prefix=key_prefix)
+
+	async def get(self, key: str) -> bytes | None:
+		return await self._client.get(self._prefix + key)
+
+	async def set(self, key: str, value: bytes, *, ttl: float | None = None) -> None:
+		await self._client.set(self._prefix + key, value, px=max(int(ttl * 1000), 1) if ttl is not None else None)
+
+	async def set_if_absent(self, key: str, value: bytes, *, ttl: float) -> bool:
+		return bool(await self._client.set(self._prefix + key, value, nx=True, px=max(int(ttl * 1000), 1)))
+
+	async def delete(self, key: str) -> None:
+		await self._client.delete(self._prefix + key)
+
+	async def acquire_lock(self, name: str, *, ttl: float) -> str | None:
+		token = secrets.token_hex(16)
+		acquired = await self._client.set(self._prefix + "lock:" + name, token, nx=True, px=max(int(ttl * 1000), 1))
+
+		return token if acquired else None
+
+	async def release_lock(self, name: str, token: str) -> None:
+		await self._release_lock(keys=[self._prefix + "lock:" + name], args=[token])
+
+	async def close(self) -> None:
+		await self._client.aclose()
@@ -0,0 +1,286 @@
+import heapq
+import math
+import socket
+import time
+from dataclasses import asdict, dataclass
+
+from loguru import logger
+
+from .ratelimit import SlidingWindowLog
+
+_IPV4_BITS = 32
+_IPV6_BITS = 128
+
+# ::ffff:0:0/96, IPv4 addresses written as IPv6
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+
+class _Node:
+	__slots__ = ("key", "length", "children", "expires_at")
+
+	def __init__(self, key: int, length: int, expires_at: float | None = None) -> None:
+		# the first `length` bits of the network, as an integer
+		self.key = key
+		self.length = length
+		self.children: list[_Node | None] = [None, None]
+		# `None` if the node only joins two branches, `math.inf` for entries that never expire
+		self.expires_at = expires_at
+
+
+class PrefixTrie:
+	"""A path compressed binary trie of network prefixes of a fixed address width.
+
+	Every node stores the prefix bits it covers, so chains of single children are
+	collapsed into one node and the trie has at most two nodes per network. A lookup
+	walks from the root towards the address, checking every entry on the way, which
+	is O(prefix length) no matter how many networks are stored.
+	"""
+
+	def __init__(self, width: int) -> None:
+		self._width = width
+		self._root = _Node(0, 0)
+
+	def add(self, network: int, length: int, expires_at: float) -> None:
+		"""Add the network of the first `length` bits of `network`, until `expires_at`."""
+		width = self._width
+		key = network >> (width - length)
+		node = self._root
+
+		while True:
+			if node.length == length:
+				node.expires_at = expires_at
+				return
+
+			bit = (network >> (width - node.length - 1)) & 1
+			child = node.children[bit]
+
+			if child is None:
+				node.children[bit] = _Node(key, length, expires_at)
+				return
+
+			shared = min(child.length, length)
+			diff = (child.key >> (child.length - shared)) ^ (network >> (width - shared))
+
+			if diff == 0 and child.length <= length:
+				node = child
+				continue
+
+			if diff == 0:
+				# the new network contains the child, it goes between the node and the child
+				parent = _Node(key, length, expires_at)
+			else:
+				# the paths split somewhere inside the child's prefix
+				common = shared - diff.bit_length()
+				parent = _Node(network >> (width - common), common)
+				parent.children[(network >> (width - common - 1)) & 1] = _Node(key, length, expires_at)
+
+			parent.children[(child.key >> (child.length - parent.length - 1)) & 1] = child
+			node.children[bit] = parent
+			return
+
+	def remove(self, network: int, length: int) -> bool:
+		"""Remove the exact network, returns whether it was stored."""
+		width = self._width
+		node = self._root
+		path: list[tuple[_Node, int]] = []
+
+		while node.length < length:
+			bit = (network >> (width - node.length - 1)) & 1
+			child = node.children[bit]
+
+			if child is None or child.length > length or child.key != network >> (width - child.length):
+				return False
+
+			path.append((node, bit))
+			node = child
+
+		if node.length != length or node.expires_at is None:
+			return False
+
+		node.expires_at = None
+
+		# drop the branch if nothing is left under it
+		while path and node.expires_at is None and node.children == [None, None]:
+			parent, bit = path.pop()
+			parent.children[bit] = None
+			node = parent
+
+		return True
+
+	def lookup(self, address: int, now: float) -> float | None:
+		"""Return the expiry of an unexpired network containing `address`, `None` if there is none."""
+		width = self._width
+		node: _Node | None = self._root
+
+		# the common case, nothing of this address family is blocked
+		if node.children == [None, None] and node.expires_at is None:
+			return None
+
+		while node is not None:
+			if node.key != address >> (width - node.length):
+				return None
+
+			if node.expires_at is not None and node.expires_at > now:
+				return node.expires_at
+
+			if node.length == width:
+				return None
+
+			node = node.children[(address >> (width - node.length - 1)) & 1]
+
+		return None
+
+
+def parse_address(address: str) -> tuple[int, int]:
+	"""Parse an IPv4 or IPv6 address into `(integer, width)`, IPv4-mapped IPv6 is treated as IPv4.
+
+	Raises:
+		ValueError: if it isn't an IP address
+
+	"""
+	try:
+		# only IPv6 addresses have colons, trying the wrong family first costs an exception
+		if ":" not in address:
+			return int.from_bytes(socket.inet_pton(socket.AF_INET, address)), _IPV4_BITS
+
+		value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address))
+	except OSError:
+		raise ValueError(f"{address!r} is not an IP address") from None
+
+	if value >> 32 == _IPV4_MAPPED_PREFIX >> 32:
+		return value & 0xFFFFFFFF, _IPV4_BITS
+
+	return value, _IPV6_BITS
+
+
+def parse_network(network: str) -> tuple[int, int, int]:
+	"""Parse `address[/prefix]` into `(integer, prefix length, width)`, host bits are cleared.
+
+	Raises:
+		ValueError: if it isn't a network
+
+	"""
+	address, _, prefix = network.partition("/")
+	value, width = parse_address(address.strip())
+	length = int(prefix) if prefix else width
+
+	if not 0 <= length <= width:
+		raise ValueError(f"{network!r} has an invalid prefix length")
+
+	# clear the host bits, `10.0.0.1/8` means `10.0.0.0/8`
+	value &= ((1 << length) - 1) << (width - length)
+
+	return value, length, width
+
+
+@dataclass(slots=True)
+class BlocklistStats:
+	entries: int = 0
+	blocked_requests: int = 0
+	auto_bans: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class Blocklist:
+	"""Blocked IPv4 and IPv6 addresses and networks, each with an optional time to live."""
+
+	def __init__(self) -> None:
+		self._tries = {_IPV4_BITS: PrefixTrie(_IPV4_BITS), _IPV6_BITS: PrefixTrie(_IPV6_BITS)}
+		# (expires_at, value, length, width) of every entry with a ttl, to purge them
+		self._expiries: list[tuple[float, int, int, int]] = []
+		# expiry of every entry by (value, length, width)
+		self._entries: dict[tuple[int, int, int], float] = {}
+
+		self.stats = BlocklistStats()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def add(self, network: str, ttl: float | None = None) -> None:
+		"""Block `network` (an address or CIDR range) for `ttl` seconds, or forever.
+
+		A network that is blocked already stays blocked until the later of both expiries,
+		an auto-ban doesn't turn a permanent block into a temporary one. `remove` it first
+		to shorten a block.
+
+		Raises:
+			ValueError: if it isn't a network
+
+		"""
+		value, length, width = parse_network(network)
+		now = time.time()
+		expires_at = now + ttl if ttl is not None else math.inf
+		existing = self._entries.get((value, length, width))
+
+		if existing is not None and existing > now and existing >= expires_at:
+			return
+
+		self._tries[width].add(value, length, expires_at)
+		self._entries[(value, length, width)] = expires_at
+		self.stats.entries = len(self._entries)
+
+		if ttl is not None:
+			heapq.heappush(self._expiries, (expires_at, value, length, width))
+
+	def remove(self, network: str) -> bool:
+		value, length, width = parse_network(network)
+		self._entries.pop((value, length, width), None)
+		self.stats.entries = len(self._entries)
+
+		return self._tries[width].remove(value, length)
+
+	def is_blocked(self, address: str, now: float | None = None) -> bool:
+		"""Whether `address` is inside an unexpired blocked network, invalid addresses aren't blocked."""
+		try:
+			value, width = parse_address(address)
+		except ValueError:
+			return False
+
+		return self._tries[width].lookup(value, now if now is not None else time.time()) is not None
+
+	def purge(self, now: float | None = None) -> int:
+		"""Remove the entries that have expired, returns how many were removed."""
+		now = now if now is not None else time.time()
+		removed = 0
+
+		while self._expiries and self._expiries[0][0] <= now:
+			expires_at, value, length, width = heapq.heappop(self._expiries)
+
+			# the entry might have been removed, or added again with another expiry since
+			if self._entries.get((value, length, width)) != expires_at:
+				continue
+
+			del self._entries[(value, length, width)]
+			self._tries[width].remove(value, length)
+			removed += 1
+
+		self.stats.entries = len(self._entries)
+
+		return removed
+
+
+class AutoBan:
+	"""Promotes clients that keep hitting the rate limits into the blocklist.
+
+	Use it as the `on_limited` callback of the rate limiting middleware: a client
+	rejected more than `limit` times in `window` seconds is blocked for `ban_ttl` seconds.
+	"""
+
+	def __init__(self, blocklist: Blocklist, *, limit: int, window: float, ban_ttl: float, max_keys: int) -> None:
+		self._blocklist = blocklist
+		self._ban_ttl = ban_ttl
+		self._violations = SlidingWindowLog(limit, window, max_keys)
+
+	def __call__(self, ip: str) -> None:
+		if self._violations.hit(ip, time.monotonic()).allowed:
+			return
+
+		try:
+			self._blocklist.add(ip, self._ban_ttl)
+		except ValueError:
+			return
+
+		self._blocklist.stats.auto_bans += 1
+		logger.warning(f"Blocked {ip} for {self._ban_ttl:g}s after repeated rate limit violations")
@@ -0,0 +1,209 @@
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Literal
+
+from aiohttp import ClientError
+from loguru import logger
+
+from .config import BreakerConfig
+from .http import UpstreamResponse
+
+BreakerState = Literal["closed", "open", "half_open"]
+
+_STATUS_TOO_MANY_REQUESTS = 429
+_STATUS_SERVER_ERROR = 500
+
+
+class CircuitOpen(Exception):
+	"""Raised instead of calling an upstream whose circuit is open."""
+
+	def __init__(self, name: str, retry_after: float) -> None:
+		super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+		self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class BreakerStats:
+	state: BreakerState = "closed"
+	# consecutive failures while closed
+	failures: int = 0
+	# times the circuit opened
+	trips: int = 0
+	# calls failed fast while open
+	rejected: int = 0
+	retries: int = 0
+	open_until: float | None = None
+
+	def as_dict(self) -> dict[str, str | int | float | None]:
+		return {
+			"state": self.state,
+			"failures": self.failures,
+			"trips": self.trips,
+			"rejected": self.rejected,
+			"retries": self.retries,
+			"retry_in_seconds": max(self.open_until - time.time(), 0.0) if self.open_until is not None else None,
+		}
+
+
+def parse_retry_after(value: str | None) -> float | None:
+	"""Seconds to wait from a `Retry-After` header, either delay seconds or an HTTP date."""
+	if not value:
+		return None
+
+	try:
+		return max(float(value), 0.0)
+	except ValueError:
+		pass
+
+	try:
+		return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+	except (TypeError, ValueError):
+		return None
+
+
+def _is_failure(response: UpstreamResponse) -> bool:
+	return response.status == _STATUS_TOO_MANY_REQUESTS or response.status >= _STATUS_SERVER_ERROR
+
+
+class CircuitBreaker:
+	"""A circuit breaker with retries for the calls to a single upstream.
+
+	While closed, calls go through and failed ones (connection errors, timeouts, 429
+	and 5xx responses) are retried with jittered exponential backoff, or after the
+	`Retry-After` the upstream asked for. After `failure_threshold` consecutive failures,
+	or right away on a response with a `Retry-After`, the circuit opens: calls fail fast
+	with `CircuitOpen` for `recovery_timeout` seconds, or as long as `Retry-After` said.
+	Then it's half open, a single probe call goes through, the rest still fail fast.
+	A successful probe closes the circuit, a failed one opens it again for twice as long,
+	up to `max_recovery_timeout`.
+	"""
+
+	def __init__(self, name: str, config: BreakerConfig) -> None:
+		self.name = name
+		self._config = config
+
+		self._open_until = 0.0
+		self._recovery_timeout = config.recovery_timeout
+		self._probing = False
+
+		self.stats = BreakerStats()
+
+	@property
+	def state(self) -> BreakerState:
+		return self.stats.state
+
+	async def call(self, fn: Callable[[], Awaitable[UpstreamResponse]], *, retry: bool = True) -> UpstreamResponse:
+		"""Call the upstream through the breaker.
+
+		Args:
+			fn (Callable[[], Awaitable[UpstreamResponse]]): sends the request
+			retry (bool): retry failed calls, only for idempotent requests
+
+		Returns:
+			UpstreamResponse: the response, a 429 or 5xx one once the retries are used up
+
+		Raises:
+			CircuitOpen: if the circuit is open
+			ClientError | TimeoutError: if the last attempt failed to get a response
+
+		"""
+		attempts = self._config.retries + 1 if retry else 1
+		attempt = 0
+
+		while True:
+			attempt += 1
+			self._before_call()
+
+			try:
+				response = await fn()
+			except (ClientError, TimeoutError) as e:
+				self._record_failure(None)
+
+				if attempt == attempts:
+					raise
+
+				delay = self._backoff(attempt)
+				logger.warning(f"{self.name} call failed ({e!r}), retrying in {delay:.2f}s")
+			except BaseException:
+				# e.g. cancelled, that says nothing about the upstream
+				self._probing = False
+				raise
+			else:
+				if not _is_failure(response):
+					self._record_success()
+					return response
+
+				retry_after = parse_retry_after(response.headers.get("Retry-After"))
+				self._record_failure(retry_after)
+
+				# don't keep the caller waiting for longer than a backoff would
+				if attempt == attempts or (retry_after is not None and retry_after > self._config.max_backoff):
+					return response
+
+				delay = retry_after if retry_after is not None else self._backoff(attempt)
+				logger.warning(f"{self.name} answered {response.status}, retrying in {delay:.2f}s")
+
+			self.stats.retries += 1
+			await asyncio.sleep(delay)
+
+	def _backoff(self, attempt: int) -> float:
+		# full jitter, so callers that failed together don't retry together
+		return random.uniform(0, min(self._config.max_backoff, self._config.base_backoff * 2 ** (attempt - 1)))
+
+	def _before_call(self) -> None:
+		state = self.stats.state
+
+		if state == "closed":
+			return
+
+		now = time.time()
+
+		if state == "open" and now >= self._open_until:
+			self.stats.state = "half_open"
+			self._probing = False
+
+		# half open, the first caller probes the upstream
+		if self.stats.state == "half_open" and not self._probing:
+			self._probing = True
+			return
+
+		self.stats.rejected += 1
+		raise CircuitOpen(self.name, max(self._open_until - now, 1.0))
+
+	def _record_success(self) -> None:
+		if self.stats.state != "closed":
+			logger.info(f"{self.name} recovered, closing the circuit")
+
+		self.stats.failures = 0
+		self._recovery_timeout = self._config.recovery_timeout
+		self._probing = False
+		self._open_until = 0.0
+		self.stats.open_until = None
+		self.stats.state = "closed"
+
+	def _record_failure(self, retry_after: float | None) -> None:
+		state = self.stats.state
+		self.stats.failures += 1
+
+		if state == "half_open":
+			# the upstream is still down, back off for longer
+			self._recovery_timeout = min(self._recovery_timeout * 2, self._config.max_recovery_timeout)
+			self._open(retry_after)
+		elif state == "closed" and (retry_after is not None or self.stats.failures >= self._config.failure_threshold):
+			self._open(retry_after)
+
+	def _open(self, retry_after: float | None) -> None:
+		# the upstream knows best when it's back
+		timeout = retry_after if retry_after is not None else self._recovery_timeout
+
+		self._open_until = time.time() + timeout
+		self._probing = False
+		self.stats.open_until = self._open_until
+		self.stats.trips += 1
+		self.stats.state = "open"
+
+		logger.warning(f"{self.name} is failing, opening the circuit for {timeout:g}s")
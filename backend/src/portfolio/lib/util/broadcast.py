@@ -0,0 +1,150 @@
+import asyncio
+from dataclasses import asdict, dataclass
+
+
+class BroadcastFull(Exception):
+	"""Raised when a new subscriber would exceed the subscriber limit of a `Broadcaster`."""
+
+
+class SubscriptionClosed(Exception):
+	"""Raised by `Subscription.next` once the subscriber was dropped."""
+
+
+@dataclass(slots=True)
+class BroadcastStats:
+	"""Counters describing the subscribers of a `Broadcaster`."""
+
+	subscribers: int = 0
+	published: int = 0
+	dropped: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class Subscription:
+	"""A single subscriber of a `Broadcaster`, iterate over it to receive the published messages.
+
+	Each subscription only buffers up to `queue_size` messages. A subscriber that falls
+	further behind is dropped, its iteration ends after the messages it already has.
+	"""
+
+	__slots__ = ("_queue", "_broadcaster", "dropped")
+
+	def __init__(self, broadcaster: "Broadcaster", queue_size: int) -> None:
+		self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize=queue_size)
+		self._broadcaster = broadcaster
+		self.dropped = False
+
+	def __aiter__(self) -> "Subscription":
+		return self
+
+	async def __anext__(self) -> bytes:
+		message = await self._queue.get()
+
+		if message is None:
+			raise StopAsyncIteration
+
+		return message
+
+	async def next(self, timeout: float) -> bytes | None:
+		"""Wait up to `timeout` seconds for a message, returns `None` if nothing was published.
+
+		Raises:
+			SubscriptionClosed: if the subscriber was dropped
+
+		"""
+		try:
+			message = await asyncio.wait_for(self._queue.get(), timeout)
+		except TimeoutError:
+			return None
+
+		if message is None:
+			raise SubscriptionClosed
+
+		return message
+
+	def _offer(self, message: bytes) -> bool:
+		try:
+			self._queue.put_nowait(message)
+		except asyncio.QueueFull:
+			self._drop()
+			return False
+
+		return True
+
+	def _drop(self) -> None:
+		# free the buffered messages right away, the slow consumer only gets the end of stream marker
+		while not self._queue.empty():
+			self._queue.get_nowait()
+
+		self._queue.put_nowait(None)
+		self.dropped = True
+
+	def close(self) -> None:
+		self._broadcaster._unsubscribe(self)
+
+
+class Broadcaster:
+	"""Fans out encoded messages to many subscribers with bounded memory per subscriber.
+
+	Messages are published as `bytes`, every subscriber gets a reference to the same
+	object so a message costs the same memory no matter how many subscribers there are.
+	New subscribers immediately receive the last published message.
+	"""
+
+	def __init__(self, *, queue_size: int, max_subscribers: int) -> None:
+		self._queue_size = queue_size
+		self._max_subscribers = max_subscribers
+		self._subscribers: set[Subscription] = set()
+		self._last: bytes | None = None
+		self._has_subscribers = asyncio.Event()
+
+		self.stats = BroadcastStats()
+
+	def __len__(self) -> int:
+		return len(self._subscribers)
+
+	@property
+	def last(self) -> bytes | None:
+		return self._last
+
+	def subscribe(self) -> Subscription:
+		"""Add a subscriber, close it with `Subscription.close()` once the client is gone.
+
+		Raises:
+			BroadcastFull: if there are already `max_subscribers` subscribers
+
+		"""
+		if len(self._subscribers) >= self._max_subscribers:
+			raise BroadcastFull
+
+		subscription = Subscription(self, self._queue_size)
+
+		if self._last is not None:
+			subscription._offer(self._last)
+
+		self._subscribers.add(subscription)
+		self._has_subscribers.set()
+		self.stats.subscribers = len(self._subscribers)
+
+		return subscription
+
+	def publish(self, message: bytes) -> None:
+		self._last = message
+		self.stats.published += 1
+
+		for subscription in list(self._subscribers):
+			if not subscription._offer(message):
+				self.stats.dropped += 1
+				self._unsubscribe(subscription)
+
+	async def wait_for_subscribers(self) -> None:
+		await self._has_subscribers.wait()
+
+	def _unsubscribe(self, subscription: Subscription) -> None:
+		self._subscribers.discard(subscription)
+		self.stats.subscribers = len(self._subscribers)
+
+		if not self._subscribers:
+			self._has_subscribers.clear()
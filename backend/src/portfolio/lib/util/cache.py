@@ -0,0 +1,471 @@
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Any, NamedTuple, TypeVar, get_type_hints
+
+from loguru import logger
+from pydantic import TypeAdapter
+
+from ..store.base import StoreBackend
+from .config import CacheConfig, CachePolicy
+
+T = TypeVar("T")
+
+# set by `fresh()`, makes `@cached` methods skip the cached value
+_bypass_cache: ContextVar[bool] = ContextVar("bypass_cache", default=False)
+
+# namespace of the cache entries in the shared backend
+_BACKEND_PREFIX = "cache:"
+
+# a worker that died while revalidating holds the lock at most this long (seconds)
+_REVALIDATION_LOCK_TTL = 30.0
+
+
+@dataclass(slots=True)
+class CacheStats:
+	"""Counters describing how a `SwrCache` has been serving its callers."""
+
+	hits: int = 0
+	misses: int = 0
+	stale_hits: int = 0
+	# expired entries served because the upstream failed
+	error_hits: int = 0
+	# entries found in the shared backend, stored by this or another worker
+	shared_hits: int = 0
+	# entries restored from the snapshot of the last run
+	snapshot_hits: int = 0
+	evictions: int = 0
+	revalidations: int = 0
+	revalidation_errors: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+# `__qualname__` of a `@cached` method and the arguments it was called with after the session
+Call = tuple[str, tuple[Any, ...], dict[str, Any]]
+
+
+class _Source(NamedTuple):
+	"""How an entry was fetched, so a snapshot can save it and fetch it again after a restart."""
+
+	policy: str
+	adapter: TypeAdapter[Any]
+	call: Call
+
+
+def _source(policy: str, adapter: TypeAdapter[Any] | None, call: Call | None) -> _Source | None:
+	return _Source(policy, adapter, call) if adapter is not None and call is not None else None
+
+
+class _Entry:
+	__slots__ = ("value", "fresh_until", "stale_until", "error_until", "source")
+
+	def __init__(
+		self, value: Any, fresh_until: float, stale_until: float, error_until: float, source: _Source | None = None
+	) -> None:
+		self.value = value
+		self.fresh_until = fresh_until
+		self.stale_until = stale_until
+		self.error_until = error_until
+		self.source = source
+
+
+class SwrCache:
+	"""A bounded, in-process stale-while-revalidate cache for upstream responses.
+
+	Entries are fresh for `ttl` seconds after they are stored. After that they are
+	served as stale for another `stale_ttl` seconds while a single background task
+	fetches a new value. Once the stale window is over the entry is treated as a miss
+	and the caller waits for the upstream again. If the upstream fails, the expired
+	value is still served as the last known good one for another `error_ttl` seconds.
+
+	The cache is bounded by `max_entries`, least recently used entries are evicted first.
+
+	With a shared `backend` the in-process entries are backed by entries every worker
+	can read: a miss looks in the backend before going upstream, and a background
+	revalidation first checks whether another worker already did it, then takes a lock
+	in the backend so only one worker refreshes an entry. Only values whose type is
+	known (an `adapter` is passed) are shared. Expiry times are wall clock times so
+	they mean the same in every worker.
+
+	Entries of `@cached` methods can be saved with `dump` and put back after a restart
+	with `restore`, see `Snapshot`.
+	"""
+
+	def __init__(
+		self,
+		max_entries: int,
+		policies: dict[str, CachePolicy],
+		backend: StoreBackend | None = None,
+	) -> None:
+		self._max_entries = max_entries
+		self._policies = policies
+		self._backend = backend
+		self._entries: OrderedDict[str, _Entry] = OrderedDict()
+		self._revalidating: dict[str, asyncio.Task] = {}
+		# records of a snapshot by key, decoded when the key is first asked for
+		self._restored: dict[str, dict[str, Any]] = {}
+
+		self.stats = CacheStats()
+
+	@classmethod
+	def from_config(cls, config: CacheConfig, backend: StoreBackend | None = None) -> "SwrCache":
+		policies = {
+			"currently_playing": config.currently_playing,
+			"last_played": config.last_played,
+			"top_items": config.top_items,
+			"currently_reading": config.currently_reading,
+		}
+		return cls(config.max_entries, policies, backend)
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	async def get_or_fetch(
+		self,
+		key: str,
+		fetch: Callable[[], Awaitable[T]],
+		*,
+		policy: str,
+		adapter: TypeAdapter[T] | None = None,
+		call: Call | None = None,
+	) -> T:
+		"""Return the cached value for `key`, calling `fetch` on a miss.
+
+		Args:
+			key (str): cache key, must be unique per upstream call and arguments
+			fetch (Callable[[], Awaitable[T]]): coroutine factory that loads a new value
+			policy (str): name of the `CachePolicy` that decides the ttl of the entry
+			adapter (TypeAdapter[T] | None): encodes the value for the shared backend and snapshots
+			call (Call | None): the `@cached` call behind `fetch`, entries without one aren't
+				saved in snapshots
+
+		Returns:
+			T: the cached or freshly fetched value
+
+		"""
+		entry = self._entries.get(key)
+
+		if entry is None and adapter is not None:
+			source = _source(policy, adapter, call)
+			entry = self._restore(key, adapter, source) or await self._load(key, adapter, source)
+
+		if entry is not None:
+			now = time.time()
+			self._entries.move_to_end(key)
+
+			if now < entry.fresh_until:
+				self.stats.hits += 1
+				return entry.value
+
+			if now < entry.stale_until:
+				self.stats.stale_hits += 1
+				self._revalidate(key, fetch, policy, adapter, _source(policy, adapter, call))
+				return entry.value
+
+		self.stats.misses += 1
+
+		try:
+			return await self._fetch_and_store(key, fetch, policy, adapter, _source(policy, adapter, call))
+		except Exception as e:
+			if entry is None or time.time() >= entry.error_until:
+				raise
+
+			self.stats.error_hits += 1
+			logger.warning(f"Serving the last known good {key}, the upstream failed: {e!r}")
+
+			return entry.value
+
+	async def refresh(
+		self,
+		key: str,
+		fetch: Callable[[], Awaitable[T]],
+		*,
+		policy: str,
+		adapter: TypeAdapter[T] | None = None,
+		call: Call | None = None,
+	) -> T:
+		"""Fetch a new value for `key` regardless of the cached one and store it."""
+		self.stats.misses += 1
+
+		return await self._fetch_and_store(key, fetch, policy, adapter, _source(policy, adapter, call))
+
+	def set(self, key: str, value: Any, *, policy: str, source: _Source | None = None) -> _Entry:
+		"""Store `value` under `key` in this process with the ttl of the given policy."""
+		cache_policy = self._policies[policy]
+		fresh_until = time.time() + cache_policy.ttl
+		stale_until = fresh_until + cache_policy.stale_ttl
+
+		entry = _Entry(value, fresh_until, stale_until, stale_until + cache_policy.error_ttl, source)
+		self._put(key, entry)
+
+		return entry
+
+	def invalidate(self, key: str) -> None:
+		self._entries.pop(key, None)
+		self._restored.pop(key, None)
+
+	def dump(self) -> list[dict[str, Any]]:
+		"""The entries of `@cached` calls that can still be served, as JSON-able records for a snapshot."""
+		now = time.time()
+		records = []
+
+		for key, entry in self._entries.items():
+			if entry.source is None or entry.error_until <= now:
+				continue
+
+			method, args, kwargs = entry.source.call
+			records.append(
+				{
+					"key": key,
+					"method": method,
+					"args": args,
+					"kwargs": kwargs,
+					"fresh_until": entry.fresh_until,
+					"stale_until": entry.stale_until,
+					"error_until": entry.error_until,
+					"value": entry.source.adapter.dump_python(entry.value, mode="json"),
+				}
+			)
+
+		return records
+
+	def restore(self, records: list[dict[str, Any]]) -> None:
+		"""Put back the records of `dump`, each is decoded the first time its key is asked for."""
+		self._restored = {record["key"]: record for record in records}
+
+	def restored_calls(self) -> list[Call]:
+		"""The `@cached` calls of the restored records that weren't asked for yet."""
+		return [(record["method"], tuple(record["args"]), record["kwargs"]) for record in self._restored.values()]
+
+	def _put(self, key: str, entry: _Entry) -> None:
+		self._entries[key] = entry
+		self._entries.move_to_end(key)
+
+		while len(self._entries) > self._max_entries:
+			self._entries.popitem(last=False)
+			self.stats.evictions += 1
+
+	async def _fetch_and_store(
+		self,
+		key: str,
+		fetch: Callable[[], Awaitable[T]],
+		policy: str,
+		adapter: TypeAdapter[T] | None,
+		source: _Source | None,
+	) -> T:
+		value = await fetch()
+		entry = self.set(key, value, policy=policy, source=source)
+
+		if self._backend is not None and adapter is not None:
+			# the shared copy is only an optimization, a broken backend mustn't fail the request
+			try:
+				await self._backend.set(
+					_BACKEND_PREFIX + key, _encode(entry, adapter), ttl=entry.error_until - time.time()
+				)
+			except Exception as e:
+				logger.warning(f"Storing {key} in the shared cache failed: {e!r}")
+
+		return value
+
+	def _restore(self, key: str, adapter: TypeAdapter[Any], source: _Source | None) -> _Entry | None:
+		"""Decode the entry of a restored snapshot record into this process."""
+		record = self._restored.pop(key, None) if self._restored else None
+
+		if record is None or record["error_until"] <= time.time():
+			return None
+
+		try:
+			value = adapter.validate_python(record["value"])
+		except ValueError as e:
+			# the model changed since the snapshot was saved
+			logger.warning(f"Restoring {key} from the snapshot failed: {e!r}")
+			return None
+
+		entry = _Entry(value, record["fresh_until"], record["stale_until"], record["error_until"], source)
+		self.stats.snapshot_hits += 1
+		self._put(key, entry)
+
+		return entry
+
+	async def _load(self, key: str, adapter: TypeAdapter[Any], source: _Source | None = None) -> _Entry | None:
+		"""Load an entry stored by any worker from the shared backend into this process."""
+		if self._backend is None:
+			return None
+
+		try:
+			data = await self._backend.get(_BACKEND_PREFIX + key)
+		except Exception as e:
+			logger.warning(f"Reading {key} from the shared cache failed: {e!r}")
+			return None
+
+		if data is None:
+			return None
+
+		entry = _decode(data, adapter)
+		entry.source = source
+
+		if entry.error_until <= time.time():
+			return None
+
+		self.stats.shared_hits += 1
+		self._put(key, entry)
+
+		return entry
+
+	def _revalidate(
+		self,
+		key: str,
+		fetch: Callable[[], Awaitable[Any]],
+		policy: str,
+		adapter: TypeAdapter[Any] | None,
+		source: _Source | None,
+	) -> None:
+		# only one background refresh per key, other stale readers just get the old value
+		if key in self._revalidating:
+			return
+
+		task = asyncio.create_task(self._run_revalidation(key, fetch, policy, adapter, source))
+		self._revalidating[key] = task
+
+	async def _run_revalidation(
+		self,
+		key: str,
+		fetch: Callable[[], Awaitable[Any]],
+		policy: str,
+		adapter: TypeAdapter[Any] | None,
+		source: _Source | None,
+	) -> None:
+		try:
+			if self._backend is None or adapter is None:
+				self.stats.revalidations += 1
+				await self._fetch_and_store(key, fetch, policy, adapter, source)
+				return
+
+			# another worker might have refreshed it already
+			shared = await self._load(key, adapter, source)
+			if shared is not None and time.time() < shared.fresh_until:
+				return
+
+			lock = await self._backend.acquire_lock(_BACKEND_PREFIX + key, ttl=_REVALIDATION_LOCK_TTL)
+
+			# another worker is refreshing it right now
+			if lock is None:
+				return
+
+			try:
+				self.stats.revalidations += 1
+				await self._fetch_and_store(key, fetch, policy, adapter, source)
+			finally:
+				await self._backend.release_lock(_BACKEND_PREFIX + key, lock)
+		except Exception as e:
+			self.stats.revalidation_errors += 1
+			logger.warning(f"Background revalidation of {key} failed: {e!r}")
+		finally:
+			self._revalidating.pop(key, None)
+
+	async def close(self) -> None:
+		"""Cancel every background revalidation that is still running."""
+		tasks = list(self._revalidating.values())
+
+		for task in tasks:
+			task.cancel()
+
+		await asyncio.gather(*tasks, return_exceptions=True)
+		self._revalidating.clear()
+
+
+def _encode(entry: _Entry, adapter: TypeAdapter[Any]) -> bytes:
+	# a small header line with the expiry times, then the value's json
+	header = f"{entry.fresh_until} {entry.stale_until} {entry.error_until}\n".encode()
+
+	return header + adapter.dump_json(entry.value)
+
+
+def _decode(data: bytes, adapter: TypeAdapter[Any]) -> _Entry:
+	header, _, value = data.partition(b"\n")
+	fresh_until, stale_until, *error_until = map(float, header.split())
+
+	# entries stored before the last known good window existed only have two times
+	return _Entry(
+		adapter.validate_json(value), fresh_until, stale_until, error_until[0] if error_until else stale_until
+	)
+
+
+@contextmanager
+def fresh() -> Iterator[None]:
+	"""Make `@cached` methods called in this context fetch from upstream and update the cache.
+
+	Example:
+		```python
+	        with fresh():
+	            track = await api.get_currently_playing(session)
+		```
+
+	"""
+	token = _bypass_cache.set(True)
+
+	try:
+		yield
+	finally:
+		_bypass_cache.reset(token)
+
+
+def cached(policy: str):
+	"""Cache the result of an api method in the instance's `SwrCache`.
+
+	The decorated method must take the client session as its first argument,
+	every other argument becomes part of the cache key. If the instance has no
+	cache (`self.cache is None`) the method is called directly. Inside a `fresh()`
+	context the cached value is skipped, but the new one is still stored.
+
+	Args:
+		policy (str): name of the `CachePolicy` to use for the entries of this method
+
+	"""
+
+	def decorator(func):
+		adapter: TypeAdapter[Any] | None = None
+
+		@wraps(func)
+		async def wrapper(self, session, *args, **kwargs):
+			nonlocal adapter
+
+			cache: SwrCache | None = self.cache
+
+			if cache is None:
+				return await func(self, session, *args, **kwargs)
+
+			# the return annotation tells the shared backend how to encode and decode the value
+			if adapter is None:
+				adapter = TypeAdapter(get_type_hints(func)["return"])
+
+			key = f"{policy}:{func.__qualname__}:{args!r}:{sorted(kwargs.items())!r}"
+			call = (func.__qualname__, args, kwargs)
+
+			if _bypass_cache.get():
+				return await cache.refresh(
+					key,
+					lambda: func(self, session, *args, **kwargs),
+					policy=policy,
+					adapter=adapter,
+					call=call,
+				)
+
+			return await cache.get_or_fetch(
+				key,
+				lambda: func(self, session, *args, **kwargs),
+				policy=policy,
+				adapter=adapter,
+				call=call,
+			)
+
+		return wrapper
+
+	return decorator
@@ -0,0 +1,177 @@
+import hashlib
+import heapq
+import hmac
+import secrets
+from dataclasses import asdict, dataclass
+
+from loguru import logger
+
+from ..store.base import StoreBackend
+
+_DIGEST_BITS = 256
+
+# namespace of the redeemed challenges in the store
+_STORE_PREFIX = "challenge:"
+
+
+@dataclass(slots=True)
+class ChallengeStats:
+	issued: int = 0
+	solved: int = 0
+	# wrong, expired, forged or replayed solutions
+	failed: int = 0
+	# right solutions turned down, `max_solved` unexpired challenges were redeemed here or the store failed
+	refused: int = 0
+	# requests sent a challenge instead of being let through
+	challenged: int = 0
+	passed: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+def leading_zero_bits(digest: bytes) -> int:
+	return _DIGEST_BITS - int.from_bytes(digest, "big").bit_length()
+
+
+def solve(challenge: str, difficulty: int) -> str:
+	"""Find a solution of `challenge`, what the clients do (in JavaScript) before they get a pass."""
+	counter = 0
+	prefix = challenge.encode() + b":"
+
+	while leading_zero_bits(hashlib.sha256(prefix + str(counter).encode()).digest()) < difficulty:
+		counter += 1
+
+	return str(counter)
+
+
+class ProofOfWork:
+	"""SHA-256 proof of work challenges and the pass tokens they're exchanged for.
+
+	A challenge is `<difficulty>.<expires>.<nonce>.<mac>`, signed so the server
+	doesn't keep it. A solution is a string that makes `sha256("<challenge>:<solution>")`
+	start with `difficulty` zero bits, about 2^difficulty hashes for the client and a
+	single one for the server. Each challenge can be redeemed once: its nonce is
+	recorded in the shared `store` until the challenge expires, with a set-if-absent,
+	so a solution can't be redeemed again in another worker or replica either.
+
+	A solved challenge is exchanged for a pass, `<expires>.<mac>`, bound to the client
+	(its IP) it was issued to. Checking a pass costs one HMAC.
+	"""
+
+	def __init__(
+		self,
+		secret: bytes,
+		store: StoreBackend,
+		*,
+		difficulty: int,
+		challenge_ttl: float,
+		pass_ttl: float,
+		max_solved: int = 100_000,
+	) -> None:
+		"""Initialize the proof of work.
+
+		Args:
+			secret (bytes): signs the challenges and the passes, the same in every worker
+			store (StoreBackend): where the redeemed challenges are recorded, shared by every worker
+			difficulty (int): leading zero bits a solution needs
+			challenge_ttl (float): seconds a challenge can be redeemed for
+			pass_ttl (float): seconds a pass is valid for
+			max_solved (int): unexpired challenges this worker records at most, more
+				solutions are refused until some expire, so the store can't be flooded
+
+		"""
+		self._secret = secret
+		self._store = store
+		self.difficulty = difficulty
+		self.challenge_ttl = challenge_ttl
+		self.pass_ttl = pass_ttl
+		self._max_solved = max_solved
+		# expiries of the challenges redeemed here, the earliest first (not the order they were redeemed in)
+		self._solved: list[int] = []
+
+		self.stats = ChallengeStats()
+
+	def _mac(self, message: bytes) -> str:
+		return hmac.digest(self._secret, message, "sha256")[:16].hex()
+
+	def challenge(self, now: float) -> str:
+		self.stats.issued += 1
+		body = f"{self.difficulty}.{int(now + self.challenge_ttl)}.{secrets.token_hex(16)}"
+
+		return f"{body}.{self._mac(b'challenge|' + body.encode())}"
+
+	async def redeem(self, challenge: str, solution: str, client: str, now: float) -> str | None:
+		"""Exchange a solved challenge for a pass.
+
+		Args:
+			challenge (str): a challenge from `challenge`
+			solution (str): the client's solution
+			client (str): what the pass is bound to, the client IP
+			now (float): the current unix time
+
+		Returns:
+			str | None: the pass, `None` if the solution is wrong or the challenge
+				expired, was forged or was already redeemed, or `max_solved` challenges are
+				redeemed and unexpired
+
+		"""
+		body, _, mac = challenge.rpartition(".")
+		parts = body.split(".")
+
+		valid = (
+			len(parts) == 3
+			and hmac.compare_digest(mac.encode(), self._mac(b"challenge|" + body.encode()).encode())
+			and parts[0].isdigit()
+			and parts[1].isdigit()
+			and int(parts[1]) > now
+			and len(solution) <= 32
+			and leading_zero_bits(hashlib.sha256(f"{challenge}:{solution}".encode()).digest()) >= int(parts[0])
+		)
+
+		if not valid:
+			self.stats.failed += 1
+			return None
+
+		expires = int(parts[1])
+
+		while self._solved and self._solved[0] <= now:
+			heapq.heappop(self._solved)
+
+		# turned down rather than forgetting unexpired ones, which could then be redeemed again
+		if len(self._solved) >= self._max_solved:
+			self.stats.refused += 1
+			return None
+
+		try:
+			first = await self._store.set_if_absent(_STORE_PREFIX + parts[2], b"1", ttl=expires - now)
+		except Exception as e:
+			# without the record the solution could be replayed, refuse it
+			self.stats.refused += 1
+			logger.warning(f"Recording a redeemed challenge failed: {e!r}")
+			return None
+
+		if not first:
+			self.stats.failed += 1
+			return None
+
+		heapq.heappush(self._solved, expires)
+		self.stats.solved += 1
+
+		return self.issue_pass(client, now)
+
+	def issue_pass(self, client: str, now: float) -> str:
+		expires = int(now + self.pass_ttl)
+
+		return f"{expires}.{self._mac(f'pass|{expires}|{client}'.encode())}"
+
+	def check_pass(self, token: bytes, client: str, now: float) -> bool:
+		"""Whether `token` is an unexpired pass of `client`, in constant time for a given length."""
+		expires, _, mac = token.partition(b".")
+
+		if not expires.isdigit() or int(expires) <= now:
+			return False
+
+		expected = self._mac(b"pass|" + expires + b"|" + client.encode())
+
+		return hmac.compare_digest(mac, expected.encode())
@@ -1,7 +1,7 @@
 import tomllib
 from typing import Literal
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl
 
 
 class SpotifyConfig(BaseModel):
@@ -9,6 +9,9 @@ class SpotifyConfig(BaseModel):
 	client_secret: str
 	refresh_token: str
 
+	# refresh the access token this many seconds before it expires
+	token_refresh_margin: float = Field(default=300, ge=0)
+
 
 class HardcoverConfig(BaseModel):
 	user_id: str
@@ -17,12 +20,401 @@ class HardcoverConfig(BaseModel):
 
 class ApiConfig(BaseModel):
 	allowed_origins: tuple[str]
+	# header the reverse proxy puts the client IP in, `None` uses the peer address
+	forwarded_ip_header: str | None = "X-Forwarded-For"
+
+
+class CachePolicy(BaseModel):
+	"""Time to live (in seconds) of a cached upstream response.
+
+	`ttl` is how long the response is served as fresh, `stale_ttl` is how long
+	it's served as stale while being revalidated in the background afterwards,
+	and `error_ttl` how long after that it's served when the upstream fails.
+	"""
+
+	ttl: float = Field(ge=0)
+	stale_ttl: float = Field(default=0, ge=0)
+	# how long after that the response is still served if the upstream fails (last known good)
+	error_ttl: float = Field(default=24 * 60 * 60, ge=0)
+
+
+class CacheConfig(BaseModel):
+	max_entries: int = Field(default=256, ge=1)
+
+	currently_playing: CachePolicy = CachePolicy(ttl=5, stale_ttl=25, error_ttl=5 * 60)
+	last_played: CachePolicy = CachePolicy(ttl=30, stale_ttl=300)
+	top_items: CachePolicy = CachePolicy(ttl=3 * 60 * 60, stale_ttl=24 * 60 * 60)
+	currently_reading: CachePolicy = CachePolicy(ttl=30 * 60, stale_ttl=24 * 60 * 60)
+
+
+class BreakerConfig(BaseModel):
+	"""Settings of the circuit breaker in front of every upstream api."""
+
+	# consecutive failed calls (errors, timeouts, 429s and 5xxs) that open the circuit
+	failure_threshold: int = Field(default=5, ge=1)
+	# seconds the circuit stays open before a probe call, doubled after every failed probe
+	recovery_timeout: float = Field(default=10, gt=0)
+	max_recovery_timeout: float = Field(default=5 * 60, gt=0)
+
+	# extra attempts of a failed idempotent call while the circuit is closed
+	retries: int = Field(default=2, ge=0)
+	# seconds of the first backoff, doubled every attempt and jittered
+	base_backoff: float = Field(default=0.2, gt=0)
+	# longest wait between attempts, a longer `Retry-After` fails the call instead
+	max_backoff: float = Field(default=2, gt=0)
+
+
+class StreamConfig(BaseModel):
+	"""Settings of the currently playing stream (`/spotify/currently-playing/stream`)."""
+
+	# seconds between two polls of spotify while there is at least one subscriber
+	poll_interval: float = Field(default=5, gt=0)
+	# how far (ms) the progress may drift from the interpolated one before it counts as a seek
+	seek_tolerance_ms: int = Field(default=3000, ge=0)
+	# seconds between keep-alive comments on idle connections
+	heartbeat_interval: float = Field(default=15, gt=0)
+	# messages buffered per subscriber before it's dropped as a slow consumer
+	subscriber_queue_size: int = Field(default=4, ge=1)
+	max_subscribers: int = Field(default=5000, ge=1)
+
+
+class TimeoutConfig(BaseModel):
+	"""Connect and read timeouts (in seconds) of a single upstream connection."""
+
+	connect: float | None = Field(default=None, gt=0)
+	read: float | None = Field(default=None, gt=0)
+
+
+class HttpConfig(BaseModel):
+	"""Settings of the shared aiohttp client session used for every upstream call."""
+
+	# connector limits, 0 means unlimited
+	limit: int = Field(default=100, ge=0)
+	limit_per_host: int = Field(default=20, ge=0)
+	# seconds an idle connection is kept open for reuse
+	keepalive_timeout: float = Field(default=30, ge=0)
+	# seconds resolved addresses are cached, `None` caches them forever
+	ttl_dns_cache: int | None = Field(default=300, ge=0)
+
+	# timeouts of a whole request, and of a connection to any host
+	total_timeout: float | None = Field(default=10, gt=0)
+	timeouts: TimeoutConfig = TimeoutConfig(connect=3, read=8)
+	# per host overrides of `timeouts`, e.g. `[http.host_timeouts."accounts.spotify.com"]`
+	host_timeouts: dict[str, TimeoutConfig] = Field(default_factory=dict)
+
+
+class HttpCacheConfig(BaseModel):
+	"""Settings of the ETag / Cache-Control layer on the GET routes."""
+
+	# Cache-Control value per path prefix, the longest matching prefix wins
+	cache_control: dict[str, str] = {
+		"/spotify/currently-playing": "public, max-age=5, stale-while-revalidate=25",
+		"/spotify/last-played": "public, max-age=30, stale-while-revalidate=300",
+		"/spotify/top-": "public, max-age=3600, stale-while-revalidate=86400",
+		"/books/currently-reading": "public, max-age=1800, stale-while-revalidate=86400",
+		"/dashboard": "public, max-age=5, stale-while-revalidate=25",
+		"/status": "no-store",
+		"/metrics": "no-store",
+		"/analytics/summary": "private, max-age=60",
+		"/admin/": "no-store",
+	}
+	# how many urls' last body and ETag are kept
+	max_entries: int = Field(default=256, ge=1)
+	# responses bigger than this (bytes) get no ETag
+	max_body_size: int = Field(default=1 << 20, ge=0)
+	# total size (bytes) of the kept bodies, the least recently used are dropped beyond it
+	max_cached_bytes: int = Field(default=4 << 20, ge=0)
+
+
+class StoreConfig(BaseModel):
+	"""Backend shared by every worker for cached responses and the access token."""
+
+	backend: Literal["memory", "redis"] = "memory"
+	# only used by the redis backend
+	redis_url: str = "redis://localhost:6379/0"
+	key_prefix: str = "portfolio:"
+
+
+class RateLimitRule(BaseModel):
+	"""Limit of the requests of a single client IP to the routes under `prefix`.
+
+	`token_bucket` allows bursts of `limit` requests refilled over `window` seconds,
+	`sliding_window` allows exactly `limit` requests in any `window` seconds.
+	"""
+
+	prefix: str
+	algorithm: Literal["token_bucket", "sliding_window"] = "token_bucket"
+	limit: int = Field(ge=1)
+	window: float = Field(gt=0)
+
+
+class RateLimitConfig(BaseModel):
+	enabled: bool = True
+	# clients kept per rule, idle ones are evicted first
+	max_keys: int = Field(default=100_000, ge=1)
+	# client IPs that are never limited
+	exempt: list[str] = Field(default_factory=list)
+	rules: list[RateLimitRule] = [
+		RateLimitRule(prefix="/spotify/", limit=60, window=60),
+		RateLimitRule(prefix="/spotify/currently-playing/", algorithm="sliding_window", limit=10, window=60),
+		RateLimitRule(prefix="/books/", limit=30, window=60),
+		RateLimitRule(prefix="/status/", limit=30, window=60),
+		RateLimitRule(prefix="/dashboard", limit=60, window=60),
+		RateLimitRule(prefix="/analytics/", limit=30, window=60),
+		RateLimitRule(prefix="/admin/", limit=30, window=60),
+		# a page shows a few dozen images
+		RateLimitRule(prefix="/images/", limit=300, window=60),
+		# every pass takes a solved challenge, a few a minute is plenty
+		RateLimitRule(prefix="/challenge", limit=10, window=60),
+	]
+
+
+class BlocklistConfig(BaseModel):
+	enabled: bool = True
+	# addresses and CIDR ranges blocked for good, e.g. "203.0.113.0/24"
+	networks: list[str] = Field(default_factory=list)
+	# a file with one address or CIDR range per line, for long lists
+	file: str | None = None
+
+	# block clients rejected by the rate limits more than `violation_limit` times in `violation_window` seconds
+	auto_ban: bool = True
+	violation_limit: int = Field(default=20, ge=1)
+	violation_window: float = Field(default=60, gt=0)
+	# seconds an auto banned client stays blocked
+	ban_ttl: float = Field(default=60 * 60, gt=0)
+
+
+class DashboardConfig(BaseModel):
+	"""Settings of the `/dashboard` aggregate."""
+
+	# number of top tracks and artists
+	top_limit: int = Field(default=10, ge=1, le=50)
+	# seconds a section may take before the response goes out without it,
+	# sections without an entry get `default_deadline`
+	deadlines: dict[str, float] = {
+		"currently_playing": 2.0,
+		"last_played": 3.0,
+	}
+	default_deadline: float = Field(default=4.0, gt=0)
+
+
+class MetricsConfig(BaseModel):
+	# off unless asked for, without a `token` the metrics are public
+	enabled: bool = False
+	# bearer token `/metrics` requires, `None` leaves it open (only if the proxy doesn't expose it)
+	token: str | None = None
+
+
+class StatusConfig(BaseModel):
+	"""The `/status/*` counters of the caches, breakers and background tasks."""
+
+	# off unless asked for, without a `token` the counters are public
+	enabled: bool = False
+	# bearer token every `/status` endpoint requires, `None` leaves them open
+	token: str | None = None
+
+
+class ImagesConfig(BaseModel):
+	"""The `/images` proxy of the album art and book covers, it needs the `images` extra (Pillow)."""
+
+	enabled: bool = False
+	# url of `/images` as clients reach it, e.g. "https://example.com/api/images",
+	# the api responses point at the proxy instead of the CDNs when it's set
+	public_url: HttpUrl | None = None
+	# on disk cache of the source images and their variants
+	directory: str = "image-cache"
+	# bytes the cache may take, the least recently served files are deleted first
+	max_size: int = Field(default=512 << 20, ge=1 << 20)
+	# source images bigger than this (bytes) aren't proxied
+	max_source_size: int = Field(default=10 << 20, ge=1)
+
+	# widths of the variants, a requested width is rounded up to the next one
+	widths: list[int] = [64, 160, 300, 640]
+	default_width: int = Field(default=300, ge=1)
+	# formats by preference, the first one the client's `Accept` allows is served, "jpeg" for the others
+	formats: list[Literal["avif", "webp", "jpeg"]] = ["avif", "webp"]
+	quality: int = Field(default=75, ge=1, le=100)
+	# processes the variants are rendered in
+	workers: int = Field(default=2, ge=1)
+
+	# path prefix of an nginx `internal` location aliased to `directory`, files are then
+	# sent by nginx (with sendfile) through `X-Accel-Redirect` instead of by the app
+	accel_redirect: str | None = None
+
+
+class ChallengeConfig(BaseModel):
+	"""Proof of work challenges in front of the routes that call Spotify and Hardcover."""
+
+	enabled: bool = False
+	# key of the challenge and pass signatures, a random one per process if not set
+	# (passes then don't survive a restart and aren't valid on the other workers)
+	secret: str | None = None
+	# leading zero bits of the solution hash, every bit doubles the work (16 is ~65k hashes)
+	difficulty: int = Field(default=16, ge=1, le=32)
+	# seconds a challenge can be redeemed in
+	challenge_ttl: float = Field(default=5 * 60, gt=0)
+	# seconds a pass is valid for
+	pass_ttl: float = Field(default=24 * 60 * 60, gt=0)
+	# path prefixes of the protected routes
+	paths: list[str] = ["/spotify/", "/books/", "/dashboard"]
+	header: str = "X-PoW-Pass"
+	cookie_name: str = "pow_pass"
+	# passes are only valid from the IP they were issued to
+	bind_ip: bool = True
+	# only send the cookie over HTTPS
+	secure: bool = True
+
+
+class SessionsConfig(BaseModel):
+	"""Browser sessions, identified by a signed cookie."""
+
+	enabled: bool = False
+	# "redis" shares the sessions between workers, through `[store] redis_url`
+	backend: Literal["memory", "redis"] = "memory"
+	# key of the cookie signatures, a random one per process if not set (sessions
+	# then don't survive a restart and aren't shared between workers)
+	secret: str | None = None
+	cookie_name: str = "session"
+	# seconds a session lives after it was last seen
+	ttl: int = Field(default=30 * 24 * 60 * 60, ge=60)
+	# sessions the memory backend keeps at most, new ones are rejected while it's full
+	max_sessions: int = Field(default=1_000_000, ge=1)
+	# path prefixes of the routes that take part in sessions
+	paths: list[str] = ["/spotify/", "/books/", "/dashboard"]
+	# only send the cookie over HTTPS
+	secure: bool = True
+	same_site: Literal["lax", "strict", "none"] = "lax"
+
+
+class HistoryConfig(BaseModel):
+	"""The listening history, recently played tracks synced into SQLite and served at `/spotify/history`."""
+
+	enabled: bool = False
+	# SQLite database file, opened in WAL mode
+	database: str = "history.db"
+	# seconds between two syncs, Spotify only keeps the last 50 plays so this must be
+	# shorter than 50 tracks take to play
+	sync_interval: float = Field(default=10 * 60, gt=0)
+	# pages of 50 plays fetched per sync at most
+	max_pages: int = Field(default=10, ge=1)
+
+
+class ColorsConfig(BaseModel):
+	"""Dominant colors of the Spotify album art and artist images, they need the `colors` extra (Pillow, NumPy)."""
+
+	enabled: bool = False
+	# SQLite database the colors are kept in by image url, so every image is analyzed once
+	database: str = "colors.db"
+	# images are scaled down to fit this many pixels wide and high before they're analyzed
+	sample_size: int = Field(default=64, ge=8, le=512)
+	# images bigger than this (bytes) aren't analyzed
+	max_source_size: int = Field(default=10 << 20, ge=1)
+	# processes the images are analyzed in
+	workers: int = Field(default=1, ge=1)
+	# seconds until an image that couldn't be fetched or analyzed is tried again
+	retry_after: float = Field(default=60 * 60, ge=0)
+
+
+class GeoIPConfig(BaseModel):
+	"""Countries of the client IPs when there's no country header, from a table built by `lib.util.geoip`."""
+
+	enabled: bool = False
+	# the table file, memory mapped and shared by the workers
+	database: str = "geoip.bin"
+
+
+class SnapshotConfig(BaseModel):
+	"""Encrypted snapshot of the cached upstream data and the access token, so a restart starts warm.
+
+	It needs the `snapshot` extra (cryptography).
+	"""
+
+	enabled: bool = False
+	path: str = "snapshot.bin"
+	# the encryption key is derived from it, required since the snapshot holds the access token
+	secret: str | None = None
+	# seconds between two saves, it's saved on shutdown as well
+	save_interval: float = Field(default=5 * 60, gt=0)
+
+
+class ProfilingConfig(BaseModel):
+	"""On demand wall clock profiles of single requests, served at `/admin/profiles`."""
+
+	enabled: bool = False
+	# bearer token of the admin endpoints, also the value of `header` that profiles a request,
+	# `None` turns both off (requests are then only profiled at `sample_rate`)
+	token: str | None = None
+	# request header that asks for a profile
+	header: str = "X-Profile"
+	# share of the requests that are profiled without asking
+	sample_rate: float = Field(default=0.0, ge=0, le=1)
+	# seconds between two samples of a profiled request's stack
+	interval: float = Field(default=0.001, gt=0)
+	# profiles kept, the oldest are dropped first
+	max_profiles: int = Field(default=50, ge=1)
+	# requests profiled at once (one sampling thread each), more aren't profiled
+	max_concurrent: int = Field(default=4, ge=1)
+
+
+class AnalyticsConfig(BaseModel):
+	enabled: bool = True
+	# SQLite database file, opened in WAL mode
+	database: str = "analytics.db"
+	# path prefixes of the requests that are recorded
+	paths: list[str] = ["/spotify/", "/books/", "/dashboard"]
+
+	# events held in memory while waiting for the writer
+	buffer_size: int = Field(default=10_000, ge=1)
+	# what happens when the writer falls behind: "drop" new events once the buffer is full,
+	# or "sample" them at `sample_rate` once it's 3/4 full
+	overflow_policy: Literal["drop", "sample"] = "sample"
+	sample_rate: float = Field(default=0.1, ge=0, le=1)
+	# events written per transaction, a full batch is written right away
+	batch_size: int = Field(default=500, ge=1)
+	# seconds between writes of whatever is buffered
+	flush_interval: float = Field(default=5, gt=0)
+
+	# key of the visitor hash, a random one per process if unset (visitors then can't be matched across restarts)
+	salt: str | None = None
+	# header with the client's country code, set by a proxy or CDN (e.g. "CF-IPCountry")
+	country_header: str | None = None
+	# seconds of inactivity after which a visitor's next request starts a new visit
+	visit_gap: float = Field(default=30 * 60, gt=0)
+	# visitors whose last request time is remembered to compute the interaction interval
+	max_visitors: int = Field(default=100_000, ge=1)
+
+	# seconds raw events are kept, the statistics live on in the rollups
+	raw_retention: float = Field(default=30 * 24 * 60 * 60, gt=0)
+	# seconds hourly rollups are kept, daily rollups are kept for good
+	hourly_retention: float = Field(default=90 * 24 * 60 * 60, gt=0)
+	# seconds between compactions of the database
+	compact_interval: float = Field(default=60 * 60, gt=0)
 
 
 class Config(BaseModel):
 	spotify: SpotifyConfig
 	hardcover: HardcoverConfig
 	api: ApiConfig
+	cache: CacheConfig = Field(default_factory=CacheConfig)
+	breaker: BreakerConfig = Field(default_factory=BreakerConfig)
+	stream: StreamConfig = Field(default_factory=StreamConfig)
+	http: HttpConfig = Field(default_factory=HttpConfig)
+	http_cache: HttpCacheConfig = Field(default_factory=HttpCacheConfig)
+	store: StoreConfig = Field(default_factory=StoreConfig)
+	rate_limit: RateLimitConfig = Field(default_factory=RateLimitConfig)
+	blocklist: BlocklistConfig = Field(default_factory=BlocklistConfig)
+	dashboard: DashboardConfig = Field(default_factory=DashboardConfig)
+	metrics: MetricsConfig = Field(default_factory=MetricsConfig)
+	status: StatusConfig = Field(default_factory=StatusConfig)
+	analytics: AnalyticsConfig = Field(default_factory=AnalyticsConfig)
+	profiling: ProfilingConfig = Field(default_factory=ProfilingConfig)
+	images: ImagesConfig = Field(default_factory=ImagesConfig)
+	colors: ColorsConfig = Field(default_factory=ColorsConfig)
+	history: HistoryConfig = Field(default_factory=HistoryConfig)
+	sessions: SessionsConfig = Field(default_factory=SessionsConfig)
+	challenge: ChallengeConfig = Field(default_factory=ChallengeConfig)
+	geoip: GeoIPConfig = Field(default_factory=GeoIPConfig)
+	snapshot: SnapshotConfig = Field(default_factory=SnapshotConfig)
 
 	model_config = ConfigDict(frozen=True)
 
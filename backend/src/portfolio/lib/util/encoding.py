@@ -0,0 +1,80 @@
+import json
+from typing import Any
+
+from pydantic import BaseModel, PrivateAttr
+from starlette.responses import Response
+
+try:
+	# optional dependency (the `orjson` extra), a few times faster than the json module
+	import orjson
+except ImportError:  # pragma: no cover
+	orjson = None
+
+
+class CachedJsonModel(BaseModel):
+	"""A model that encodes itself to JSON once and reuses the bytes.
+
+	The api clients build their models once per upstream fetch and the cache hands
+	the same instances to every request, so the JSON of a model is the same every
+	time. Returning it as is skips FastAPI validating the model against the route's
+	response model and serializing it again on each request. The models must not be
+	modified after they're built, or the cached JSON goes stale.
+	"""
+
+	_json: bytes | None = PrivateAttr(default=None)
+
+	def plain(self) -> dict[str, Any]:
+		"""The fields as a dict, values that aren't JSON types (`HttpUrl`s) are encoded with `str`."""
+		return {name: getattr(self, name) for name in type(self).model_fields}
+
+	def json_bytes(self) -> bytes:
+		# going through pydantic's `__getattr__` for `self._json` costs more than the rest of this
+		private = self.__pydantic_private__
+		encoded = private.get("_json")
+
+		if encoded is None:
+			encoded = private["_json"] = dumps(self.plain())
+
+		return encoded
+
+
+def _default(value: Any) -> Any:
+	if isinstance(value, CachedJsonModel):
+		return value.plain()
+
+	if isinstance(value, BaseModel):
+		return value.model_dump(mode="json")
+
+	# HttpUrl and the like
+	return str(value)
+
+
+def dumps(value: Any) -> bytes:
+	"""Encode `value` as compact UTF-8 JSON, with orjson if it's installed."""
+	if orjson is not None:
+		return orjson.dumps(value, default=_default)
+
+	return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def encode(value: Any) -> bytes:
+	"""Like `dumps`, but reuses the cached JSON of the `CachedJsonModel`s in `value`."""
+	if isinstance(value, CachedJsonModel):
+		return value.json_bytes()
+
+	if isinstance(value, dict):
+		return b"{" + b",".join(dumps(str(key)) + b":" + encode(item) for key, item in value.items()) + b"}"
+
+	if isinstance(value, list | tuple):
+		return b"[" + b",".join(encode(item) for item in value) + b"]"
+
+	return dumps(value)
+
+
+def json_response(value: Any, status_code: int = 200, headers: dict[str, str] | None = None) -> Response:
+	"""A JSON response of `value`, encoded with `encode`.
+
+	FastAPI passes responses through as they are, so returning one skips validating
+	the value against the route's response model and serializing it again.
+	"""
+	return Response(encode(value), status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,289 @@
+"""Country of an IP address from a memory mapped table of address ranges.
+
+The table is built once from a range CSV (`start,end,country` per line, the format
+of DB-IP's free "IP to Country Lite" database):
+
+	python -m portfolio.lib.util.geoip dbip-country-lite.csv.gz geoip.bin
+"""
+
+import argparse
+import csv
+import gzip
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+
+from .blocklist import parse_address
+
+_MAGIC = b"GEO1"
+# magic, countries, IPv4 ranges, IPv6 ranges
+_HEADER = struct.Struct("<4sHII")
+
+_IPV4_BITS = 32
+# IPv6 ranges are stored by their first 64 bits, nothing is allocated in smaller blocks than a /64
+_IPV6_SHIFT = 64
+
+# the first bits of an address that index where its binary search starts and ends
+_INDEX_BITS = 16
+# one entry more than there are prefixes, where the search of the last one ends
+_INDEX_SIZE = (1 << _INDEX_BITS) + 1
+
+_ALIGNMENT = 8
+
+# codes of unassigned or unknown space, left out of the table
+_UNKNOWN = frozenset(("ZZ", "XX"))
+
+
+def _pad(size: int) -> int:
+	return -size % _ALIGNMENT
+
+
+def _size(countries: int, ipv4: int, ipv6: int) -> int:
+	"""Size of a table file with this many countries and ranges."""
+	size = _HEADER.size + 2 * countries
+
+	for count, item_size in ((ipv4, 4), (ipv6, 8)):
+		for column_count, column_size in ((_INDEX_SIZE, 4), (count, item_size), (count, item_size), (count, 2)):
+			size += _pad(size) + column_count * column_size
+
+	return size
+
+
+@dataclass(slots=True)
+class GeoIPStats:
+	lookups: int = 0
+	# addresses that aren't in any range (private, reserved or unallocated)
+	misses: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class GeoIP:
+	"""Looks up the country of IPv4 and IPv6 addresses in a table file.
+
+	The file is memory mapped and its sorted range starts, range ends and country
+	indexes are used in place as typed views, so opening it costs nothing and the
+	pages are shared between the workers. A lookup is a binary search over the
+	starts, narrowed down to the ranges of the address's first 16 bits by an index,
+	it doesn't copy or decode anything but the address itself.
+
+	File layout (little-endian, every array 8 byte aligned):
+		header: magic, number of countries, of IPv4 ranges and of IPv6 ranges
+		countries: 2 ASCII letters each
+		IPv4: index (2^16 + 1 uint32, the first range starting at or after each
+			16 bit prefix), starts and ends (uint32), country indexes (uint16)
+		IPv6: the same, with starts and ends of the first 64 bits (uint64)
+	"""
+
+	def __init__(self, path: str) -> None:
+		"""Map the table file at `path`.
+
+		Raises:
+			ValueError: if it isn't a table written by `write_database`
+
+		"""
+		if sys.byteorder != "little":
+			raise ValueError("GeoIP tables can only be mapped on little-endian machines")
+
+		with open(path, "rb") as f:
+			self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		view = memoryview(self._mmap)
+
+		try:
+			magic, countries, ipv4, ipv6 = _HEADER.unpack_from(view)
+		except struct.error:
+			magic = None
+
+		if magic != _MAGIC or len(view) != _size(countries, ipv4, ipv6):
+			view.release()
+			self._mmap.close()
+			raise ValueError(f"{path} is not a GeoIP table")
+
+		offset = _HEADER.size
+		self._countries = tuple(
+			bytes(view[offset + 2 * i : offset + 2 * i + 2]).decode("ascii") for i in range(countries)
+		)
+		offset += 2 * countries
+		self._views = [view]
+
+		def section(count: int, format: str, size: int) -> memoryview:
+			nonlocal offset
+			offset += _pad(offset)
+			section = view[offset : offset + count * size].cast(format)
+			offset += count * size
+			self._views.append(section)
+			return section
+
+		self._ipv4 = (
+			section(_INDEX_SIZE, "I", 4),
+			section(ipv4, "I", 4),
+			section(ipv4, "I", 4),
+			section(ipv4, "H", 2),
+		)
+		self._ipv6 = (
+			section(_INDEX_SIZE, "I", 4),
+			section(ipv6, "Q", 8),
+			section(ipv6, "Q", 8),
+			section(ipv6, "H", 2),
+		)
+
+		self.stats = GeoIPStats()
+
+	def __len__(self) -> int:
+		return len(self._ipv4[1]) + len(self._ipv6[1])
+
+	def country(self, ip: str) -> str | None:
+		"""ISO 3166-1 alpha-2 code of the country of `ip`, `None` if it's unknown or not an address."""
+		self.stats.lookups += 1
+
+		try:
+			value, width = parse_address(ip)
+		except ValueError:
+			self.stats.misses += 1
+			return None
+
+		if width == _IPV4_BITS:
+			prefixes, starts, ends, countries = self._ipv4
+			prefix = value >> (_IPV4_BITS - _INDEX_BITS)
+		else:
+			prefixes, starts, ends, countries = self._ipv6
+			value >>= _IPV6_SHIFT
+			prefix = value >> (_IPV6_SHIFT - _INDEX_BITS)
+
+		# the range is either one starting with the same prefix or the last one before them
+		index = bisect_right(starts, value, prefixes[prefix], prefixes[prefix + 1]) - 1
+
+		if index < 0 or value > ends[index]:
+			self.stats.misses += 1
+			return None
+
+		return self._countries[countries[index]]
+
+	def close(self) -> None:
+		for view in reversed(self._views):
+			view.release()
+
+		self._mmap.close()
+
+
+def _ranges(
+	rows: Iterable[tuple[str, str, str]], countries: dict[str, int]
+) -> tuple[list[tuple[int, int, int]], list[tuple[int, int, int]]]:
+	"""Parse and sort the rows into non overlapping `(start, end, country index)` ranges per family."""
+	families: dict[bool, list[tuple[int, int, int]]] = {True: [], False: []}
+
+	for start, end, country in rows:
+		start_value, width = parse_address(start)
+		end_value, end_width = parse_address(end)
+
+		if width != end_width:
+			raise ValueError(f"{start} - {end} mixes IPv4 and IPv6")
+
+		if width != _IPV4_BITS:
+			start_value >>= _IPV6_SHIFT
+			end_value >>= _IPV6_SHIFT
+
+		code = country.strip().upper()
+
+		if len(code) != 2 or not code.isascii() or not code.isalpha() or code in _UNKNOWN:
+			continue
+
+		index = countries.setdefault(code, len(countries))
+		families[width == _IPV4_BITS].append((start_value, end_value, index))
+
+	merged: dict[bool, list[tuple[int, int, int]]] = {True: [], False: []}
+
+	for ipv4, ranges in families.items():
+		ranges.sort()
+		result = merged[ipv4]
+
+		for start, end, index in ranges:
+			if result and start <= result[-1][1] + 1:
+				last_start, last_end, last_index = result[-1]
+
+				if last_index == index:
+					result[-1] = (last_start, max(last_end, end), index)
+					continue
+
+				# overlaps (IPv6 ranges cut down to 64 bits can) go to the first range
+				start = last_end + 1
+
+				if start > end:
+					continue
+
+			result.append((start, end, index))
+
+	return merged[True], merged[False]
+
+
+def write_database(rows: Iterable[tuple[str, str, str]], path: str) -> tuple[int, int]:
+	"""Write the table file of `(first address, last address, country code)` rows.
+
+	The file is replaced atomically, workers that still map the old one keep reading it
+	until they reopen it.
+
+	Returns:
+		tuple[int, int]: the number of IPv4 and IPv6 ranges written, adjacent ranges
+			of the same country are merged
+
+	"""
+	countries: dict[str, int] = {}
+	ipv4, ipv6 = _ranges(rows, countries)
+
+	parts = [_HEADER.pack(_MAGIC, len(countries), len(ipv4), len(ipv6)), "".join(countries).encode("ascii")]
+
+	for ranges, format, bits in ((ipv4, "I", _IPV4_BITS), (ipv6, "Q", _IPV6_SHIFT)):
+		starts = [start for start, _, _ in ranges]
+		shift = bits - _INDEX_BITS
+		columns = (
+			array("I", (bisect_left(starts, prefix << shift) for prefix in range(_INDEX_SIZE))),
+			array(format, starts),
+			array(format, (end for _, end, _ in ranges)),
+			array("H", (index for _, _, index in ranges)),
+		)
+
+		for values in columns:
+			parts.append(b"\0" * _pad(sum(map(len, parts))))
+
+			if sys.byteorder != "little":
+				values.byteswap()
+
+			parts.append(values.tobytes())
+
+	temporary = f"{path}.tmp"
+
+	with open(temporary, "wb") as f:
+		f.writelines(parts)
+
+	os.replace(temporary, path)
+
+	return len(ipv4), len(ipv6)
+
+
+def read_csv(path: str) -> Iterator[tuple[str, str, str]]:
+	"""The `(start, end, country)` rows of a range CSV, gzipped if it ends in `.gz`."""
+	with (gzip.open if path.endswith(".gz") else open)(path, "rt", newline="") as f:
+		for row in csv.reader(f):
+			if len(row) >= 3:
+				yield row[0], row[1], row[2]
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description="Build the GeoIP table from a range CSV")
+	parser.add_argument("csv", help="CSV of start,end,country rows, optionally gzipped")
+	parser.add_argument("output", help="the table file, the [geoip] database")
+	args = parser.parse_args()
+
+	ipv4, ipv6 = write_database(read_csv(args.csv), args.output)
+	print(f"{args.output}: {ipv4} IPv4 and {ipv6} IPv6 ranges")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,253 @@
+import json
+import time
+from collections.abc import Hashable, Mapping
+from dataclasses import asdict, dataclass, field
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import urlsplit
+
+from aiohttp import (
+	ClientResponse,
+	ClientSession,
+	ClientTimeout,
+	TCPConnector,
+	TraceConfig,
+	TraceConnectionCreateEndParams,
+	TraceConnectionQueuedEndParams,
+	TraceConnectionQueuedStartParams,
+	TraceConnectionReuseconnParams,
+	TraceRequestEndParams,
+	TraceRequestExceptionParams,
+	TraceRequestStartParams,
+)
+
+from .config import HttpConfig, TimeoutConfig
+from .metrics import REGISTRY
+
+UPSTREAM_LATENCY = REGISTRY.histogram(
+	"portfolio_upstream_request_duration_seconds",
+	"Time spent on upstream api requests, including reading the body",
+	("host", "method", "status"),
+)
+
+# per host overrides of the session's connect/read timeouts, set by `create_session`
+_host_timeouts: dict[str, ClientTimeout] = {}
+
+_CHUNK_SIZE = 1 << 16
+
+
+class ResponseTooLarge(Exception):
+	"""The upstream response body is bigger than the caller allows."""
+
+
+@dataclass(slots=True, frozen=True)
+class UpstreamResponse:
+	"""A fully read upstream response.
+
+	Unlike `aiohttp.ClientResponse` this can be shared between every caller that
+	joined the same in-flight request.
+	"""
+
+	status: int
+	body: bytes
+	headers: Mapping[str, str] = field(default_factory=dict)
+
+	def json(self) -> Any:
+		return json.loads(self.body)
+
+	def text(self) -> str:
+		return self.body.decode("utf-8", errors="replace")
+
+
+async def fetch(
+	session: ClientSession,
+	method: str,
+	url: str,
+	*,
+	params: Mapping[str, Any] | None = None,
+	headers: Mapping[str, str] | None = None,
+	json: Any = None,
+	data: Any = None,
+	max_size: int | None = None,
+) -> UpstreamResponse:
+	"""Send a request and read the whole body before releasing the connection back to the pool.
+
+	With a `max_size` a body announced or turning out bigger raises `ResponseTooLarge`,
+	it's never read further than that.
+	"""
+	host = urlsplit(url).hostname or ""
+	# only passed with a per host override, aiohttp takes `timeout=None` as no timeout at all
+	# rather than the session's
+	timeout = _host_timeouts.get(host) if _host_timeouts else None
+	extra: dict[str, Any] = {"timeout": timeout} if timeout is not None else {}
+	status = "error"
+	start = time.perf_counter()
+
+	try:
+		async with session.request(
+			method,
+			url,
+			params=params,
+			headers=headers,
+			json=json,
+			data=data,
+			**extra,
+		) as response:
+			status = str(response.status)
+			body = await response.read() if max_size is None else await _read_limited(response, max_size)
+
+			return UpstreamResponse(status=response.status, body=body, headers=response.headers)
+	finally:
+		UPSTREAM_LATENCY.observe((host, method, status), time.perf_counter() - start)
+
+
+async def _read_limited(response: ClientResponse, max_size: int) -> bytes:
+	if response.content_length is not None and response.content_length > max_size:
+		raise ResponseTooLarge(f"the body is {response.content_length} bytes, more than {max_size}")
+
+	# the length can be missing (chunked) or wrong, so the body is counted as it's read
+	body = bytearray()
+
+	async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+		body += chunk
+
+		if len(body) > max_size:
+			raise ResponseTooLarge(f"the body is bigger than {max_size} bytes")
+
+	return bytes(body)
+
+
+def request_key(method: str, url: str, params: Mapping[str, Any] | None = None, body: Any = None) -> Hashable:
+	"""Build the single-flight key of a request from its method, url, query parameters and body."""
+	frozen_params = tuple(sorted(params.items())) if params else ()
+	frozen_body = json.dumps(body, sort_keys=True) if body is not None else None
+
+	return (method, url, frozen_params, frozen_body)
+
+
+@dataclass(slots=True)
+class HostPoolStats:
+	"""Connection pool usage of a single upstream host."""
+
+	# requests sent that didn't get their response headers yet, those waiting for a
+	# connection included, aiohttp doesn't trace when a connection goes back to the pool
+	in_flight: int = 0
+	# requests waiting for a free connection right now (the pool limit was hit)
+	waiting: int = 0
+
+	requests: int = 0
+	queued: int = 0
+	queued_seconds: float = 0.0
+	connections_created: int = 0
+	connections_reused: int = 0
+
+	@property
+	def reuse_ratio(self) -> float | None:
+		total = self.connections_created + self.connections_reused
+		return self.connections_reused / total if total else None
+
+	def as_dict(self) -> dict[str, float | int | None]:
+		return {**asdict(self), "reuse_ratio": self.reuse_ratio}
+
+
+@dataclass(slots=True)
+class PoolStats:
+	"""Per host connection pool statistics, collected with aiohttp's request tracing."""
+
+	hosts: dict[str, HostPoolStats] = field(default_factory=dict)
+
+	def as_dict(self) -> dict[str, dict[str, float | int | None]]:
+		return {host: stats.as_dict() for host, stats in self.hosts.items()}
+
+	def trace_config(self) -> TraceConfig:
+		trace_config = TraceConfig()
+		trace_config.on_request_start.append(self._on_request_start)
+		trace_config.on_request_end.append(self._on_request_end)
+		trace_config.on_request_exception.append(self._on_request_end)
+		trace_config.on_connection_queued_start.append(self._on_queued_start)
+		trace_config.on_connection_queued_end.append(self._on_queued_end)
+		trace_config.on_connection_create_end.append(self._on_connection_created)
+		trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+		return trace_config
+
+	# connection events don't know the url, the host is kept on the per request trace context
+	def _host(self, ctx: SimpleNamespace) -> HostPoolStats:
+		return self.hosts[ctx.host]
+
+	async def _on_request_start(self, session, ctx: SimpleNamespace, params: TraceRequestStartParams) -> None:
+		ctx.host = params.url.host or ""
+
+		stats = self.hosts.get(ctx.host)
+		if stats is None:
+			stats = self.hosts[ctx.host] = HostPoolStats()
+
+		stats.requests += 1
+		stats.in_flight += 1
+
+	async def _on_request_end(
+		self,
+		session,
+		ctx: SimpleNamespace,
+		params: TraceRequestEndParams | TraceRequestExceptionParams,
+	) -> None:
+		self._host(ctx).in_flight -= 1
+
+	async def _on_queued_start(self, session, ctx: SimpleNamespace, params: TraceConnectionQueuedStartParams) -> None:
+		ctx.queued_at = time.perf_counter()
+
+		stats = self._host(ctx)
+		stats.waiting += 1
+		stats.queued += 1
+
+	async def _on_queued_end(self, session, ctx: SimpleNamespace, params: TraceConnectionQueuedEndParams) -> None:
+		stats = self._host(ctx)
+		stats.waiting -= 1
+		stats.queued_seconds += time.perf_counter() - ctx.queued_at
+
+	async def _on_connection_created(
+		self,
+		session,
+		ctx: SimpleNamespace,
+		params: TraceConnectionCreateEndParams,
+	) -> None:
+		self._host(ctx).connections_created += 1
+
+	async def _on_connection_reused(
+		self, session, ctx: SimpleNamespace, params: TraceConnectionReuseconnParams
+	) -> None:
+		self._host(ctx).connections_reused += 1
+
+
+def _client_timeout(timeouts: TimeoutConfig, total: float | None) -> ClientTimeout:
+	return ClientTimeout(total=total, sock_connect=timeouts.connect, sock_read=timeouts.read)
+
+
+def create_session(config: HttpConfig, stats: PoolStats | None = None) -> ClientSession:
+	"""Create the shared client session with the connector limits and timeouts from the config.
+
+	Args:
+		config (HttpConfig): pool limits, keep-alive, dns cache and timeouts
+		stats (PoolStats | None): if given, pool usage is recorded into it
+
+	Returns:
+		ClientSession: the configured session
+
+	"""
+	connector = TCPConnector(
+		limit=config.limit,
+		limit_per_host=config.limit_per_host,
+		keepalive_timeout=config.keepalive_timeout,
+		use_dns_cache=True,
+		ttl_dns_cache=config.ttl_dns_cache,
+	)
+
+	_host_timeouts.clear()
+	_host_timeouts.update(
+		{host: _client_timeout(timeouts, config.total_timeout) for host, timeouts in config.host_timeouts.items()}
+	)
+
+	return ClientSession(
+		connector=connector,
+		timeout=_client_timeout(config.timeouts, config.total_timeout),
+		trace_configs=[stats.trace_config()] if stats is not None else None,
+	)
@@ -0,0 +1,201 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Iterable, Sequence
+from typing import TypeVar
+
+# seconds, from a cache hit to a slow upstream
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+Sample = tuple[dict[str, str], float | None]
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+	pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)]
+
+	if extra:
+		pairs.append(extra)
+
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+	if value == float("inf"):
+		return "+Inf"
+
+	return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+	__slots__ = ("name", "help", "labelnames")
+
+	kind = ""
+
+	def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+		self.name = name
+		self.help = help
+		self.labelnames = tuple(labelnames)
+
+	def _header(self) -> list[str]:
+		return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+	@abstractmethod
+	def render(self) -> list[str]:
+		"""The lines of the metric in the Prometheus text format, its HELP and TYPE first."""
+
+
+class Counter(_Metric):
+	__slots__ = ("_values",)
+
+	kind = "counter"
+
+	def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+		super().__init__(name, help, labelnames)
+		self._values: dict[Labels, float] = {}
+
+	def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+		self._values[labels] = self._values.get(labels, 0.0) + amount
+
+	def render(self) -> list[str]:
+		lines = self._header()
+
+		for labels, value in self._values.items():
+			lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+
+		return lines
+
+
+class Gauge(Counter):
+	__slots__ = ()
+
+	kind = "gauge"
+
+	def dec(self, labels: Labels = (), amount: float = 1.0) -> None:
+		self._values[labels] = self._values.get(labels, 0.0) - amount
+
+	def set(self, labels: Labels, value: float) -> None:
+		self._values[labels] = value
+
+
+class _HistogramChild:
+	__slots__ = ("counts", "sum")
+
+	def __init__(self, buckets: int) -> None:
+		# one count per bucket plus +Inf, not cumulative, they're summed up when rendering
+		self.counts = [0] * (buckets + 1)
+		self.sum = 0.0
+
+
+class Histogram(_Metric):
+	__slots__ = ("_buckets", "_children")
+
+	kind = "histogram"
+
+	def __init__(
+		self,
+		name: str,
+		help: str,
+		labelnames: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS,
+	) -> None:
+		super().__init__(name, help, labelnames)
+		self._buckets = tuple(sorted(buckets))
+		self._children: dict[Labels, _HistogramChild] = {}
+
+	def observe(self, labels: Labels, value: float) -> None:
+		child = self._children.get(labels)
+
+		if child is None:
+			child = self._children[labels] = _HistogramChild(len(self._buckets))
+
+		# the first bucket whose upper bound is >= value
+		child.counts[bisect_left(self._buckets, value)] += 1
+		child.sum += value
+
+	def render(self) -> list[str]:
+		lines = self._header()
+		bounds = [*self._buckets, float("inf")]
+
+		for labels, child in self._children.items():
+			cumulative = 0
+
+			for bound, count in zip(bounds, child.counts, strict=True):
+				cumulative += count
+				bucket_labels = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+				lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+			labels_text = _format_labels(self.labelnames, labels)
+			lines.append(f"{self.name}_sum{labels_text} {_format_value(child.sum)}")
+			lines.append(f"{self.name}_count{labels_text} {cumulative}")
+
+		return lines
+
+
+M = TypeVar("M", bound=_Metric)
+
+
+class Registry:
+	"""The metrics of the process, rendered in the Prometheus text format.
+
+	Recording is a couple of dict and list operations without any locking: every
+	metric is only updated from the event loop thread. Values that already live in
+	a stats object somewhere (pool usage, cache counters, ...) aren't recorded twice,
+	they are read when rendering and passed as `snapshot` samples.
+	"""
+
+	def __init__(self) -> None:
+		self._metrics: dict[str, _Metric] = {}
+
+	def _add(self, metric: M) -> M:
+		if metric.name in self._metrics:
+			raise ValueError(f"metric {metric.name} is already registered")
+
+		self._metrics[metric.name] = metric
+
+		return metric
+
+	def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+		return self._add(Counter(name, help, labelnames))
+
+	def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+		return self._add(Gauge(name, help, labelnames))
+
+	def histogram(
+		self,
+		name: str,
+		help: str,
+		labelnames: Sequence[str] = (),
+		buckets: Sequence[float] = DEFAULT_BUCKETS,
+	) -> Histogram:
+		return self._add(Histogram(name, help, labelnames, buckets))
+
+	def render(self, snapshots: Iterable[str] = ()) -> str:
+		lines: list[str] = []
+
+		for metric in self._metrics.values():
+			lines.extend(metric.render())
+
+		lines.extend(snapshots)
+
+		return "\n".join(lines) + "\n"
+
+
+def snapshot(name: str, kind: str, help: str, samples: Iterable[Sample]) -> str:
+	"""Render a metric read from an existing stats object, `kind` is `gauge` or `counter`."""
+	lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+	for labels, value in samples:
+		if value is None:
+			continue
+
+		lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+
+	return "\n".join(lines)
+
+
+# the registry every module records into, served at `/metrics`
+REGISTRY = Registry()
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from types import CodeType, FrameType
+from typing import Any
+
+# leaf of a stack that's waiting on a future (the network, a lock, a sleep, ...)
+_AWAITING = "<await>"
+
+
+@dataclass(slots=True)
+class Profile:
+	"""A wall clock profile of a single request, as counts of sampled stacks."""
+
+	id: str
+	method: str
+	path: str
+	started_at: float
+	interval: float
+	duration: float = 0.0
+	stacks: Counter[tuple[str, ...]] = field(default_factory=Counter)
+
+	@property
+	def samples(self) -> int:
+		return sum(self.stacks.values())
+
+	def summary(self) -> dict[str, Any]:
+		return {
+			"id": self.id,
+			"method": self.method,
+			"path": self.path,
+			"started_at": self.started_at,
+			"duration_seconds": self.duration,
+			"samples": self.samples,
+		}
+
+	def collapsed(self) -> str:
+		"""The stacks in the collapsed format (`root;...;leaf count`) of flamegraph.pl, speedscope, etc."""
+		return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.items())
+
+
+class _Sampler(threading.Thread):
+	"""Samples the stack of a single task every `interval` seconds until stopped.
+
+	The task's stack is read from its chain of awaiting coroutines, so the time a
+	request spends suspended (waiting for an upstream, say) is attributed to the
+	`await` it's waiting in. While the task is running, the synchronous frames below
+	its innermost coroutine are taken from the event loop thread's stack.
+
+	When it's stopped, the thread hands the finished profile back to the profiler on
+	the event loop, so stopping it never waits for the thread.
+	"""
+
+	def __init__(self, profiler: "RequestProfiler", task: asyncio.Task, profile: Profile) -> None:
+		super().__init__(name=f"profiler-{profile.id}", daemon=True)
+		self._profiler = profiler
+		self._task = task
+		self._profile = profile
+		self._loop = asyncio.get_running_loop()
+		self._loop_thread = threading.get_ident()
+		self._stopped = threading.Event()
+
+	def run(self) -> None:
+		interval = self._profile.interval
+		stacks = self._profile.stacks
+
+		try:
+			while not self._stopped.wait(interval):
+				stack = self._sample()
+
+				if stack:
+					stacks[stack] += 1
+		finally:
+			try:
+				self._loop.call_soon_threadsafe(self._profiler._finished, self._profile)
+			except RuntimeError:
+				# the loop was closed in the meantime, on shutdown
+				pass
+
+	def stop(self) -> None:
+		self._stopped.set()
+
+	def _sample(self) -> tuple[str, ...]:
+		frames: list[FrameType] = []
+		awaitable: Any = self._task.get_coro()
+		running = False
+
+		while awaitable is not None:
+			frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+			frame = frame or getattr(awaitable, "ag_frame", None)
+
+			if frame is None:
+				break
+
+			frames.append(frame)
+			running = bool(getattr(awaitable, "cr_running", False) or getattr(awaitable, "gi_running", False))
+			awaitable = (
+				getattr(awaitable, "cr_await", None)
+				or getattr(awaitable, "gi_yieldfrom", None)
+				or getattr(awaitable, "ag_await", None)
+			)
+
+		if not frames:
+			return ()
+
+		stack = [self._profiler.frame_name(frame) for frame in frames]
+
+		if not running:
+			stack.append(_AWAITING)
+			return tuple(stack)
+
+		# the innermost coroutine is running, add the synchronous calls it made
+		innermost = frames[-1]
+		calls: list[str] = []
+		frame = sys._current_frames().get(self._loop_thread)
+
+		while frame is not None and frame is not innermost:
+			calls.append(self._profiler.frame_name(frame))
+			frame = frame.f_back
+
+		if frame is innermost:
+			stack.extend(reversed(calls))
+
+		return tuple(stack)
+
+
+class RequestProfiler:
+	"""Profiles single requests on demand and keeps the last `max_profiles` profiles.
+
+	Nothing runs unless a request is being profiled, then a thread samples that
+	request's task every `interval` seconds until it's done. At most `max_concurrent`
+	requests are profiled at once, the others aren't profiled, so a high sample rate
+	can't start a thread per request.
+	"""
+
+	def __init__(self, *, interval: float, max_profiles: int, max_concurrent: int = 4) -> None:
+		self._interval = interval
+		self._max_profiles = max_profiles
+		self._max_concurrent = max_concurrent
+		self._profiles: OrderedDict[str, Profile] = OrderedDict()
+		self._names: dict[tuple[CodeType, int | None], str] = {}
+		# sampling threads that haven't handed their profile back yet
+		self._active = 0
+
+	def __len__(self) -> int:
+		return len(self._profiles)
+
+	def start(self, method: str, path: str) -> tuple[Profile, _Sampler] | None:
+		"""Start sampling the current task, stop it with `finish`.
+
+		Returns:
+			tuple[Profile, _Sampler] | None: the profile being recorded, `None` if
+				`max_concurrent` requests are being profiled already
+
+		"""
+		if self._active >= self._max_concurrent:
+			return None
+
+		task = asyncio.current_task()
+		assert task is not None
+
+		profile = Profile(
+			id=secrets.token_hex(6),
+			method=method,
+			path=path,
+			started_at=time.time(),
+			interval=self._interval,
+		)
+		sampler = _Sampler(self, task, profile)
+		sampler.start()
+		self._active += 1
+
+		return profile, sampler
+
+	def finish(self, profile: Profile, sampler: _Sampler) -> None:
+		"""Stop sampling, the profile is listed once its thread took the last sample."""
+		profile.duration = time.time() - profile.started_at
+		sampler.stop()
+
+	def _finished(self, profile: Profile) -> None:
+		self._active -= 1
+		self._profiles[profile.id] = profile
+
+		while len(self._profiles) > self._max_profiles:
+			self._profiles.popitem(last=False)
+
+	def get(self, id: str) -> Profile | None:
+		return self._profiles.get(id)
+
+	def list(self) -> list[Profile]:
+		return list(reversed(self._profiles.values()))
+
+	def frame_name(self, frame: FrameType) -> str:
+		"""`function (package/file.py:line)`, with the line the frame is at, so it's clear which `await` waited."""
+		key = (frame.f_code, frame.f_lineno)
+		name = self._names.get(key)
+
+		if name is None:
+			code = frame.f_code
+			# the package (or site-packages module) and the file are enough to find it
+			directory, file = os.path.split(code.co_filename)
+			name = f"{code.co_qualname} ({os.path.basename(directory)}/{file}:{frame.f_lineno})"
+			self._names[key] = name
+
+		return name
@@ -0,0 +1,135 @@
+import math
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
+
+class RateLimitResult(NamedTuple):
+	"""Outcome of a single hit on a rate limiter."""
+
+	allowed: bool
+	limit: int
+	remaining: int
+	# seconds until the limit is fully available again
+	reset: float
+	# seconds until the next request would be allowed, 0 if this one was
+	retry_after: float
+
+
+class _KeyedLimiter:
+	"""Keeps the state of every key, evicting keys that were idle for a whole window.
+
+	A key that was idle for `window` seconds is indistinguishable from a new key, so
+	dropping it changes nothing. On top of that at most `max_keys` keys are kept, the
+	least recently seen ones are evicted first. The eviction only looks at the oldest
+	entries, so it's O(1) amortized per hit.
+	"""
+
+	__slots__ = ("limit", "window", "_max_keys", "_states")
+
+	def __init__(self, limit: int, window: float, max_keys: int) -> None:
+		self.limit = limit
+		self.window = window
+		self._max_keys = max_keys
+		self._states: OrderedDict[str, list] = OrderedDict()
+
+	def __len__(self) -> int:
+		return len(self._states)
+
+	def _evict(self, now: float) -> None:
+		states = self._states
+
+		while states:
+			key, state = next(iter(states.items()))
+
+			if len(states) <= self._max_keys and now - state[-1] < self.window:
+				break
+
+			del states[key]
+
+
+class TokenBucket(_KeyedLimiter):
+	"""Allows bursts of up to `limit` requests, refilled at `limit / window` requests per second.
+
+	The state of a key is `[tokens, last_seen]`.
+	"""
+
+	__slots__ = ("_rate",)
+
+	def __init__(self, limit: int, window: float, max_keys: int) -> None:
+		super().__init__(limit, window, max_keys)
+		self._rate = limit / window
+
+	def hit(self, key: str, now: float) -> RateLimitResult:
+		state = self._states.get(key)
+
+		if state is None:
+			state = self._states[key] = [float(self.limit), now]
+			self._evict(now)
+		else:
+			state[0] = min(self.limit, state[0] + (now - state[1]) * self._rate)
+			state[1] = now
+			self._states.move_to_end(key)
+
+		allowed = state[0] >= 1
+
+		if allowed:
+			state[0] -= 1
+
+		tokens = state[0]
+
+		return RateLimitResult(
+			allowed,
+			self.limit,
+			int(tokens),
+			(self.limit - tokens) / self._rate,
+			0.0 if allowed else (1 - tokens) / self._rate,
+		)
+
+
+class SlidingWindowLog(_KeyedLimiter):
+	"""Allows at most `limit` requests in any `window` seconds, exactly.
+
+	The state of a key is the log of the times of its allowed requests, which never
+	holds more than `limit` entries. Expired times are popped from the front, so each
+	time is added and removed once, O(1) amortized per hit.
+	"""
+
+	__slots__ = ()
+
+	def hit(self, key: str, now: float) -> RateLimitResult:
+		log = self._states.get(key)
+		is_new = log is None
+
+		if log is None:
+			log = self._states[key] = deque(maxlen=self.limit)
+		else:
+			self._states.move_to_end(key)
+
+		horizon = now - self.window
+
+		while log and log[0] <= horizon:
+			log.popleft()
+
+		allowed = len(log) < self.limit
+
+		# a denied request isn't logged, the log is full of requests inside the window anyway
+		if allowed:
+			log.append(now)
+
+		# only after the append, the eviction reads the last time of every log
+		if is_new:
+			self._evict(now)
+
+		oldest = log[0] if log else now
+
+		return RateLimitResult(
+			allowed,
+			self.limit,
+			self.limit - len(log),
+			(log[-1] + self.window - now) if log else 0.0,
+			0.0 if allowed else oldest + self.window - now,
+		)
+
+
+def retry_after_header(seconds: float) -> str:
+	return str(max(math.ceil(seconds), 1))
@@ -0,0 +1,66 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class SingleFlightStats:
+	"""Counters describing how many calls were started and how many joined one in flight."""
+
+	started: int = 0
+	shared: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class SingleFlight:
+	"""Coalesce concurrent calls with the same key into a single in-flight call.
+
+	The first caller for a key starts the call as a task, every caller that comes
+	in while the task is still running awaits the same task. The result, or the
+	exception, is delivered to every waiter. The task is shielded so a cancelled
+	caller (e.g. a client that disconnected) doesn't cancel the call for the rest.
+	"""
+
+	def __init__(self) -> None:
+		self._calls: dict[Hashable, asyncio.Task] = {}
+		self.stats = SingleFlightStats()
+
+	def __len__(self) -> int:
+		return len(self._calls)
+
+	async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+		"""Run `fn`, or join the call that is already running for `key`.
+
+		Args:
+			key (Hashable): identity of the call, e.g. `(method, url, params)`
+			fn (Callable[[], Awaitable[T]]): coroutine factory, only called if nothing is in flight
+
+		Returns:
+			T: the result of the shared call
+
+		"""
+		task = self._calls.get(key)
+
+		if task is None:
+			self.stats.started += 1
+			task = asyncio.ensure_future(fn())
+			self._calls[key] = task
+			task.add_done_callback(partial(self._forget, key))
+		else:
+			self.stats.shared += 1
+
+		return await asyncio.shield(task)
+
+	def _forget(self, key: Hashable, task: asyncio.Task[Any]) -> None:
+		if self._calls.get(key) is task:
+			del self._calls[key]
+
+		# mark the exception as retrieved, all the waiters might have been cancelled
+		if not task.cancelled():
+			task.exception()
@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import struct
+import time
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from ..store.base import StoreBackend
+from .cache import SwrCache
+from .encoding import dumps
+from .token import TokenManager
+
+_MAGIC = b"SNP1"
+# magic, scrypt salt, AES-GCM nonce
+_HEADER = struct.Struct("<4s16s12s")
+
+# cost of the key derivation, ~50ms once per process
+_SCRYPT_N = 1 << 14
+
+_LOCK_NAME = "lock:snapshot-save"
+
+
+@dataclass(slots=True)
+class SnapshotStats:
+	saves: int = 0
+	save_errors: int = 0
+	# cache entries and tokens found in the snapshot at the start
+	restored_entries: int = 0
+	restored_tokens: int = 0
+	# restored calls made again in the background
+	warmed: int = 0
+	warm_errors: int = 0
+
+	def as_dict(self) -> dict[str, int]:
+		return asdict(self)
+
+
+class Snapshot:
+	"""Saves the last good upstream data and the access tokens, so a restart starts warm.
+
+	The snapshot holds the `SwrCache` entries of the `@cached` api methods and the
+	access tokens, encrypted with AES-GCM under a key derived from `secret`. It's
+	written every `interval` seconds and on shutdown, and loaded before the first
+	request: the restored entries are served from memory right away, and every
+	restored call is made again in the background, so stale entries are revalidated
+	and expired ones fetched before a visitor asks for them.
+
+	Every worker restores the snapshot, but with a shared `lock_store` only one of them
+	saves it each round: the one that takes the save lock, held until the next save is
+	due like the listening history sync's.
+	"""
+
+	def __init__(
+		self,
+		path: str,
+		secret: bytes,
+		*,
+		cache: SwrCache,
+		tokens: dict[str, TokenManager],
+		owners: list[object],
+		interval: float,
+		lock_store: StoreBackend | None = None,
+	) -> None:
+		"""Initialize the snapshot.
+
+		Args:
+			path (str): the snapshot file
+			secret (bytes): the encryption key is derived from it
+			cache (SwrCache): whose entries are saved
+			tokens (dict[str, TokenManager]): the access tokens that are saved, by name
+			owners (list[object]): the api clients whose `@cached` methods made the entries,
+				they're called again to warm the restored entries
+			interval (float): seconds between two saves
+			lock_store (StoreBackend | None): makes one worker at a time save the snapshot
+
+		"""
+		self._path = path
+		self._secret = secret
+		self._cache = cache
+		self._tokens = tokens
+		self._owners = {type(owner).__name__: owner for owner in owners}
+		self._interval = interval
+		self._lock_store = lock_store
+		# until when (monotonic) this worker holds the save lock
+		self._lock_until = 0.0
+
+		# the salt of the key in use, a restored snapshot's salt is kept so the key is derived once
+		self._salt = secrets.token_bytes(16)
+		self._key: bytes | None = None
+
+		self._task: asyncio.Task | None = None
+		self._warming: asyncio.Task | None = None
+
+		self.stats = SnapshotStats()
+
+	async def start(self, session: ClientSession) -> None:
+		"""Restore the snapshot, warm it in the background and start saving it at intervals.
+
+		Call this before the tokens are started, a restored token doesn't need a refresh.
+		"""
+		await self.restore(session)
+
+		self._warming = asyncio.create_task(self._warm(session))
+		self._task = asyncio.create_task(self._run())
+
+	async def stop(self) -> None:
+		"""Stop the background tasks and save the snapshot one last time, if it's this worker's turn."""
+		tasks = [task for task in (self._task, self._warming) if task is not None]
+
+		for task in tasks:
+			task.cancel()
+
+		await asyncio.gather(*tasks, return_exceptions=True)
+		self._task = self._warming = None
+
+		# the lock is kept until it runs out, so workers stopping after this one don't save over it
+		if await self._owns_save():
+			await self.save()
+
+	async def restore(self, session: ClientSession) -> bool:
+		"""Put the entries and tokens of the snapshot back, returns whether there was one.
+
+		A missing, corrupt or undecryptable snapshot is skipped, the service then starts cold.
+		"""
+		try:
+			snapshot = await asyncio.to_thread(self._read)
+		except FileNotFoundError:
+			return False
+		except Exception as e:
+			logger.warning(f"Reading the snapshot {self._path} failed, starting cold: {e!r}")
+			return False
+
+		self._cache.restore(snapshot["cache"])
+		self.stats.restored_entries = len(snapshot["cache"])
+
+		for name, token in snapshot["tokens"].items():
+			manager = self._tokens.get(name)
+
+			if manager is not None and manager.restore(
+				session, token["token"], token["expires_at"], token["issued_at"]
+			):
+				self.stats.restored_tokens += 1
+
+		age = time.time() - snapshot["saved_at"]
+		logger.info(
+			f"Restored {self.stats.restored_entries} cache entries and {self.stats.restored_tokens} tokens "
+			f"from a snapshot saved {age:.0f}s ago"
+		)
+
+		return True
+
+	async def save(self) -> None:
+		"""Write the snapshot now, whether or not this worker holds the save lock."""
+		snapshot = {
+			"saved_at": time.time(),
+			"tokens": {
+				name: token for name, manager in self._tokens.items() if (token := manager.export()) is not None
+			},
+			"cache": self._cache.dump(),
+		}
+
+		try:
+			await asyncio.to_thread(self._write, dumps(snapshot))
+		except Exception as e:
+			self.stats.save_errors += 1
+			logger.warning(f"Saving the snapshot {self._path} failed: {e!r}")
+			return
+
+		self.stats.saves += 1
+
+	async def _run(self) -> None:
+		while True:
+			await asyncio.sleep(self._interval)
+
+			if await self._owns_save():
+				await self.save()
+
+	async def _owns_save(self) -> bool:
+		"""Whether this worker saves this round, taking the save lock if nobody holds it."""
+		if self._lock_store is None:
+			return True
+
+		now = time.monotonic()
+
+		if now < self._lock_until:
+			return True
+
+		ttl = self._interval * 0.9
+
+		try:
+			token = await self._lock_store.acquire_lock(_LOCK_NAME, ttl=ttl)
+		except Exception as e:
+			# the temporary files are per process, concurrent saves can't corrupt the snapshot
+			logger.warning(f"Taking the snapshot save lock failed, saving anyway: {e!r}")
+			return True
+
+		if token is None:
+			return False
+
+		self._lock_until = now + ttl
+
+		return True
+
+	async def _warm(self, session: ClientSession) -> None:
+		async def warm(method: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> None:
+			owner_name, _, name = method.rpartition(".")
+			owner = self._owners.get(owner_name)
+
+			# the method was renamed or removed since the snapshot was saved
+			if owner is None or not hasattr(owner, name):
+				return
+
+			try:
+				await getattr(owner, name)(session, *args, **kwargs)
+			except Exception as e:
+				self.stats.warm_errors += 1
+				logger.warning(f"Warming {method} from the snapshot failed: {e!r}")
+				return
+
+			self.stats.warmed += 1
+
+		await asyncio.gather(*(warm(*call) for call in self._cache.restored_calls()))
+
+	def _derive(self, salt: bytes) -> bytes:
+		if salt != self._salt or self._key is None:
+			self._salt = salt
+			self._key = hashlib.scrypt(self._secret, salt=salt, n=_SCRYPT_N, r=8, p=1, dklen=32)
+
+		return self._key
+
+	def _read(self) -> dict[str, Any]:
+		# cryptography is an optional dependency (the `snapshot` extra), only import it when it's enabled
+		from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+		with open(self._path, "rb") as f:
+			data = f.read()
+
+		magic, salt, nonce = _HEADER.unpack_from(data)
+
+		if magic != _MAGIC:
+			raise ValueError("not a snapshot")
+
+		plain = AESGCM(self._derive(salt)).decrypt(nonce, data[_HEADER.size :], data[: len(_MAGIC)])
+
+		return json.loads(plain)
+
+	def _write(self, data: bytes) -> None:
+		from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+		key = self._derive(self._salt)
+		nonce = secrets.token_bytes(12)
+		encrypted = AESGCM(key).encrypt(nonce, data, _MAGIC)
+
+		# written next to the old one and moved over it, a crash never leaves half a snapshot,
+		# under a name of its own so workers saving at the same time don't write into one file
+		temporary = f"{self._path}.{os.getpid()}.tmp"
+		fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+		with os.fdopen(fd, "wb") as f:
+			f.write(_HEADER.pack(_MAGIC, self._salt, nonce))
+			f.write(encrypted)
+
+		os.replace(temporary, self._path)
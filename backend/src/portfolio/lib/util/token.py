@@ -0,0 +1,312 @@
+import asyncio
+import json
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from aiohttp import ClientSession
+from loguru import logger
+
+from ..store.base import StoreBackend
+from .metrics import REGISTRY
+
+# a token this close to its expiry is treated as expired, so it can't run out while a request is in flight
+_EXPIRY_SKEW = 10.0
+
+# how long to wait before retrying a failed background refresh
+_RETRY_DELAY = 15.0
+
+# the margin is at most this share of a token's lifetime, a margin longer than the
+# lifetime (a short-lived token, a large configured margin) would refresh in a loop
+_MAX_MARGIN_SHARE = 0.5
+
+# least time between two scheduled refreshes (seconds)
+_MIN_REFRESH_DELAY = 1.0
+
+# a worker that died while refreshing holds the shared refresh lock at most this long (seconds)
+_LOCK_TTL = 15.0
+
+# how often a worker that didn't get the refresh lock looks for the new shared token (seconds)
+_SHARED_POLL_INTERVAL = 0.1
+
+TOKEN_REFRESH_LATENCY = REGISTRY.histogram(
+	"portfolio_token_refresh_duration_seconds",
+	"Time spent requesting a new access token",
+	("token", "outcome"),
+)
+
+
+@dataclass(slots=True)
+class TokenMetrics:
+	"""Timings of the access token and its refreshes."""
+
+	refreshes: int = 0
+	# tokens taken over from another worker through the shared store
+	adopted: int = 0
+	# tokens taken over from the snapshot of the last run
+	restored: int = 0
+	refresh_failures: int = 0
+	last_refresh_latency: float | None = None
+	max_refresh_latency: float | None = None
+	issued_at: float | None = None
+	expires_at: float | None = None
+
+	def as_dict(self) -> dict[str, float | int | None]:
+		now = time.time()
+
+		return {
+			"refreshes": self.refreshes,
+			"adopted": self.adopted,
+			"restored": self.restored,
+			"refresh_failures": self.refresh_failures,
+			"last_refresh_latency_seconds": self.last_refresh_latency,
+			"max_refresh_latency_seconds": self.max_refresh_latency,
+			"token_age_seconds": now - self.issued_at if self.issued_at is not None else None,
+			"token_expires_in_seconds": self.expires_at - now if self.expires_at is not None else None,
+		}
+
+
+class TokenManager:
+	"""Keeps an access token valid by refreshing it in the background before it expires.
+
+	A refresh is scheduled `margin` seconds (at most half the token's lifetime) before
+	the token expires, so in steady state `get` returns the current token without
+	waiting. Only the very first call, or a call after the token actually ran out (e.g.
+	the accounts endpoint was down), waits for a refresh. There is never more than one
+	refresh in flight, every caller that needs a new token awaits the same one.
+
+	With a shared `store` the token is shared between workers as well: before refreshing,
+	a worker takes over a token another worker stored if it's still good for longer than
+	the margin. Otherwise it takes the refresh lock in the store, and workers that don't
+	get the lock wait for the token of the one that did. Times are wall clock times so
+	they mean the same in every worker.
+	"""
+
+	def __init__(
+		self,
+		refresh: Callable[[ClientSession], Awaitable[tuple[str, float]]],
+		*,
+		margin: float,
+		store: StoreBackend | None = None,
+		store_key: str = "token",
+		name: str = "token",
+	) -> None:
+		"""Initialize the manager.
+
+		Args:
+			refresh (Callable[[ClientSession], Awaitable[tuple[str, float]]]):
+				requests a new token, returns the token and its lifetime in seconds
+			margin (float): how many seconds before the expiry the token is refreshed
+			store (StoreBackend | None): shares the token and the refresh lock between workers
+			store_key (str): key of the token in the store
+			name (str): label of the token in the metrics
+
+		"""
+		self._refresh_token = refresh
+		self._margin = margin
+		self._store = store
+		self._store_key = store_key
+		self._name = name
+
+		self._token: str | None = None
+		self._expires_at: float = 0.0
+		# the margin of the current token, capped by its lifetime
+		self._token_margin: float = margin
+
+		self._refreshing: asyncio.Task[str] | None = None
+		self._scheduled: asyncio.TimerHandle | None = None
+
+		self.metrics = TokenMetrics()
+
+	async def get(self, session: ClientSession) -> str:
+		"""Return a valid access token, refreshing it only if there is no usable one."""
+		now = time.time()
+
+		if self._token is not None and now < self._expires_at - _EXPIRY_SKEW:
+			# inside the margin the scheduled refresh should already be running,
+			# make sure it is (e.g. the timer was lost) but don't wait for it
+			if now >= self._expires_at - self._token_margin:
+				self._start_refresh(session)
+
+			return self._token
+
+		return await asyncio.shield(self._start_refresh(session))
+
+	def start(self, session: ClientSession) -> None:
+		"""Fetch the first token in the background, so the first request doesn't have to."""
+		if self._token is None:
+			self._start_refresh(session)
+
+	def export(self) -> dict[str, str | float] | None:
+		"""The current token with its times, `None` if there is no usable one."""
+		if self._token is None or time.time() >= self._expires_at - _EXPIRY_SKEW:
+			return None
+
+		return {"token": self._token, "expires_at": self._expires_at, "issued_at": self.metrics.issued_at or 0.0}
+
+	def restore(self, session: ClientSession, token: str, expires_at: float, issued_at: float) -> bool:
+		"""Take over a token of `export` from before a restart, returns whether it's still usable.
+
+		A restored token is refreshed `margin` seconds before it expires like any other,
+		right away in the background if it's already inside the margin.
+		"""
+		if self._token is not None or time.time() >= expires_at - _EXPIRY_SKEW:
+			return False
+
+		self.metrics.restored += 1
+		self._set(session, token, expires_at, issued_at)
+
+		return True
+
+	def close(self) -> None:
+		if self._scheduled is not None:
+			self._scheduled.cancel()
+			self._scheduled = None
+
+		if self._refreshing is not None:
+			self._refreshing.cancel()
+			self._refreshing = None
+
+	def _start_refresh(self, session: ClientSession) -> asyncio.Task[str]:
+		if self._refreshing is None:
+			self._refreshing = asyncio.create_task(self._refresh(session))
+			self._refreshing.add_done_callback(self._refresh_done)
+
+		return self._refreshing
+
+	def _refresh_done(self, task: asyncio.Task[str]) -> None:
+		if self._refreshing is task:
+			self._refreshing = None
+
+		# background refreshes have nobody awaiting them, retrieve the exception here
+		if not task.cancelled():
+			task.exception()
+
+	async def _refresh(self, session: ClientSession) -> str:
+		if self._store is None:
+			return await self._request(session)
+
+		shared = await self._load_shared()
+
+		if shared is not None and self._outside_margin(*shared):
+			return self._adopt(session, *shared)
+
+		try:
+			lock = await self._store.acquire_lock(self._store_key, ttl=_LOCK_TTL)
+		except Exception as e:
+			logger.warning(f"Taking the shared token refresh lock failed: {e!r}")
+			return await self._request(session)
+
+		if lock is None:
+			return await self._wait_for_shared(session)
+
+		try:
+			# the worker that held the lock before might have just stored a new token
+			shared = await self._load_shared()
+
+			if shared is not None and self._outside_margin(*shared):
+				return self._adopt(session, *shared)
+
+			return await self._request(session)
+		finally:
+			try:
+				await self._store.release_lock(self._store_key, lock)
+			except Exception as e:
+				logger.warning(f"Releasing the shared token refresh lock failed: {e!r}")
+
+	async def _request(self, session: ClientSession) -> str:
+		start = time.perf_counter()
+
+		try:
+			token, expires_in = await self._refresh_token(session)
+		except Exception as e:
+			TOKEN_REFRESH_LATENCY.observe((self._name, "failure"), time.perf_counter() - start)
+			self.metrics.refresh_failures += 1
+			logger.warning(f"Access token refresh failed: {e!r}")
+
+			# keep trying in the background while the current token is still usable
+			if self._token is not None:
+				self._schedule(session, _RETRY_DELAY)
+
+			raise
+
+		latency = time.perf_counter() - start
+		now = time.time()
+		TOKEN_REFRESH_LATENCY.observe((self._name, "success"), latency)
+
+		self.metrics.refreshes += 1
+		self.metrics.last_refresh_latency = latency
+		self.metrics.max_refresh_latency = max(latency, self.metrics.max_refresh_latency or 0.0)
+
+		self._set(session, token, now + expires_in, now)
+
+		if self._store is not None:
+			payload = json.dumps({"token": token, "expires_at": now + expires_in, "issued_at": now})
+
+			try:
+				await self._store.set(self._store_key, payload.encode(), ttl=expires_in)
+			except Exception as e:
+				logger.warning(f"Sharing the access token failed: {e!r}")
+
+		return token
+
+	async def _load_shared(self) -> tuple[str, float, float] | None:
+		assert self._store is not None
+
+		try:
+			data = await self._store.get(self._store_key)
+		except Exception as e:
+			logger.warning(f"Reading the shared access token failed: {e!r}")
+			return None
+
+		if data is None:
+			return None
+
+		shared = json.loads(data)
+
+		return shared["token"], shared["expires_at"], shared["issued_at"]
+
+	async def _wait_for_shared(self, session: ClientSession) -> str:
+		"""Wait for the worker holding the refresh lock to store its new token."""
+		deadline = time.time() + _LOCK_TTL
+
+		while time.time() < deadline:
+			await asyncio.sleep(_SHARED_POLL_INTERVAL)
+
+			shared = await self._load_shared()
+
+			if shared is not None and self._outside_margin(*shared):
+				return self._adopt(session, *shared)
+
+		# the other worker didn't deliver, get one ourselves
+		return await self._request(session)
+
+	def _adopt(self, session: ClientSession, token: str, expires_at: float, issued_at: float) -> str:
+		self.metrics.adopted += 1
+		self._set(session, token, expires_at, issued_at)
+
+		return token
+
+	def _margin_of(self, expires_at: float, issued_at: float) -> float:
+		return min(self._margin, (expires_at - issued_at) * _MAX_MARGIN_SHARE)
+
+	def _outside_margin(self, token: str, expires_at: float, issued_at: float) -> bool:
+		"""Whether a shared token is still good for longer than its margin."""
+		return expires_at - time.time() > self._margin_of(expires_at, issued_at)
+
+	def _set(self, session: ClientSession, token: str, expires_at: float, issued_at: float) -> None:
+		self._token = token
+		self._expires_at = expires_at
+		self._token_margin = self._margin_of(expires_at, issued_at)
+
+		self.metrics.issued_at = issued_at
+		self.metrics.expires_at = expires_at
+
+		self._schedule(session, max(expires_at - time.time() - self._token_margin, _MIN_REFRESH_DELAY))
+
+	def _schedule(self, session: ClientSession, delay: float) -> None:
+		if self._scheduled is not None:
+			self._scheduled.cancel()
+
+		loop = asyncio.get_running_loop()
+		self._scheduled = loop.call_later(delay, self._start_refresh, session)
@@ -0,0 +1,51 @@
+import math
+from collections.abc import Hashable, Iterator
+from typing import Generic, TypeVar
+
+T = TypeVar("T", bound=Hashable)
+
+
+class TimingWheel(Generic[T]):
+	"""Items bucketed by their deadline, `resolution` seconds per bucket.
+
+	Scheduling appends to a list and costs O(1), advancing the wheel only visits the
+	buckets that came due, so expiring costs O(due items) instead of a scan of
+	everything. Items are never moved once scheduled: an item whose deadline was
+	pushed back (a session that was used again) is handed out when its old deadline
+	comes, and the caller schedules it again. Deadlines further away than `horizon`
+	go into the last bucket and come back early the same way.
+	"""
+
+	def __init__(self, horizon: float, resolution: float, now: float) -> None:
+		self._resolution = resolution
+		# one more bucket than the horizon needs, so the current bucket is never reused before it's due
+		self._buckets: list[list[T]] = [[] for _ in range(math.ceil(horizon / resolution) + 1)]
+		# every bucket before this one has been handed out
+		self._tick = int(now // resolution)
+		self._size = 0
+
+	def __len__(self) -> int:
+		return self._size
+
+	def schedule(self, item: T, deadline: float) -> None:
+		"""Hand `item` out by the first `advance` at or after `deadline` (at most `resolution` late)."""
+		tick = min(max(int(deadline // self._resolution), self._tick), self._tick + len(self._buckets) - 1)
+		self._buckets[tick % len(self._buckets)].append(item)
+		self._size += 1
+
+	def advance(self, now: float) -> Iterator[T]:
+		"""Hand out the items of every bucket that ended by `now`."""
+		due = int(now // self._resolution)
+		# after a long pause every bucket is due, but each one is only visited once
+		last = min(due, self._tick + len(self._buckets))
+
+		while self._tick < last:
+			index = self._tick % len(self._buckets)
+			bucket = self._buckets[index]
+			self._buckets[index] = []
+			self._size -= len(bucket)
+			self._tick += 1
+
+			yield from bucket
+
+		self._tick = max(self._tick, due)
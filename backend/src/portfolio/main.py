@@ -4,9 +4,37 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
-from .deps import get_client_session, get_config
+from .deps import (
+	_get_spotify_api,
+	get_analytics_pipeline,
+	get_blocklist,
+	get_client_session,
+	get_config,
+	get_currently_playing_poller,
+	get_dominant_colors,
+	get_enricher,
+	get_geoip,
+	get_history_recorder,
+	get_image_proxy,
+	get_profiler,
+	get_proof_of_work,
+	get_response_cache,
+	get_session_signer,
+	get_session_store,
+	get_snapshot,
+	get_store,
+)
+from .lib.middleware.analytics import AnalyticsMiddleware
+from .lib.middleware.blocklist import BlocklistMiddleware
+from .lib.middleware.challenge import ProofOfWorkMiddleware
+from .lib.middleware.etag import ETagMiddleware
+from .lib.middleware.metrics import MetricsMiddleware
+from .lib.middleware.profiling import ProfilingMiddleware
+from .lib.middleware.ratelimit import RateLimitMiddleware
+from .lib.middleware.session import SessionMiddleware
 from .lib.util import logger
-from .routers import books, spotify
+from .lib.util.blocklist import AutoBan
+from .routers import admin, analytics, books, challenge, dashboard, history, images, metrics, spotify, status
 
 
 @asynccontextmanager
@@ -14,8 +42,45 @@ async def lifespan(app: FastAPI):
 	await get_client_session.init()
 	logger.setup_logger()
 
+	# before the token is started, a restored token doesn't need a refresh
+	if config.snapshot.enabled:
+		await get_snapshot().start(get_client_session())
+
+	# get the first access token before any request needs it
+	_get_spotify_api().token.start(get_client_session())
+	get_currently_playing_poller().start(get_client_session())
+
+	if config.analytics.enabled:
+		await get_analytics_pipeline().start()
+
+	if config.history.enabled:
+		await get_history_recorder().start(get_client_session())
+
 	yield
 
+	# saved while the cache and the token are still there
+	if config.snapshot.enabled:
+		await get_snapshot().stop()
+
+	await get_currently_playing_poller().stop()
+	await get_analytics_pipeline().stop()
+	await get_history_recorder().stop()
+
+	if config.images.enabled:
+		await get_image_proxy().close()
+
+	if config.colors.enabled:
+		await get_dominant_colors().close()
+
+	if config.sessions.enabled:
+		await get_session_store().close()
+
+	if config.geoip.enabled:
+		get_geoip().close()
+
+	_get_spotify_api().token.close()
+	await get_response_cache().close()
+	await get_store().close()
 	await get_client_session.close()
 
 
@@ -25,6 +90,83 @@ app = FastAPI(root_path="/api", lifespan=lifespan)
 
 app.include_router(spotify.router)
 app.include_router(books.router)
+app.include_router(dashboard.router)
+app.include_router(analytics.router)
+app.include_router(history.router)
+
+if config.images.enabled:
+	app.include_router(images.router)
+
+if config.challenge.enabled:
+	app.include_router(challenge.router)
+
+if config.metrics.enabled:
+	app.include_router(metrics.router)
+
+if config.status.enabled:
+	app.include_router(status.router)
+
+if config.profiling.enabled:
+	app.include_router(admin.router)
+
+app.add_middleware(
+	ETagMiddleware,
+	cache_control=config.http_cache.cache_control,
+	max_entries=config.http_cache.max_entries,
+	max_body_size=config.http_cache.max_body_size,
+	max_cached_bytes=config.http_cache.max_cached_bytes,
+)
+
+# inside the proof of work, clients without a pass don't create sessions
+if config.sessions.enabled:
+	app.add_middleware(
+		SessionMiddleware,
+		store=get_session_store(),
+		signer=get_session_signer(),
+		enricher=get_enricher(),
+		paths=config.sessions.paths,
+		cookie_name=config.sessions.cookie_name,
+		secure=config.sessions.secure,
+		same_site=config.sessions.same_site,
+	)
+
+# inside the rate limiting, so asking for challenges over and over is limited too
+if config.challenge.enabled:
+	app.add_middleware(
+		ProofOfWorkMiddleware,
+		proof_of_work=get_proof_of_work(),
+		paths=config.challenge.paths,
+		header=config.challenge.header,
+		cookie_name=config.challenge.cookie_name,
+		bind_ip=config.challenge.bind_ip,
+		forwarded_header=config.api.forwarded_ip_header,
+	)
+
+if config.rate_limit.enabled:
+	app.add_middleware(
+		RateLimitMiddleware,
+		rules=config.rate_limit.rules,
+		max_keys=config.rate_limit.max_keys,
+		exempt=config.rate_limit.exempt,
+		forwarded_header=config.api.forwarded_ip_header,
+		on_limited=AutoBan(
+			get_blocklist(),
+			limit=config.blocklist.violation_limit,
+			window=config.blocklist.violation_window,
+			ban_ttl=config.blocklist.ban_ttl,
+			max_keys=config.rate_limit.max_keys,
+		)
+		if config.blocklist.enabled and config.blocklist.auto_ban
+		else None,
+	)
+
+if config.analytics.enabled:
+	app.add_middleware(
+		AnalyticsMiddleware,
+		pipeline=get_analytics_pipeline(),
+		enricher=get_enricher(),
+		paths=config.analytics.paths,
+	)
 
 app.add_middleware(
 	CORSMiddleware,
@@ -33,6 +175,28 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
+# added last so it runs first, blocked clients don't reach anything else
+if config.blocklist.enabled:
+	app.add_middleware(
+		BlocklistMiddleware,
+		blocklist=get_blocklist(),
+		forwarded_header=config.api.forwarded_ip_header,
+	)
+
+# profiles cover the other middlewares as well
+if config.profiling.enabled:
+	app.add_middleware(
+		ProfilingMiddleware,
+		profiler=get_profiler(),
+		header=config.profiling.header,
+		token=config.profiling.token,
+		sample_rate=config.profiling.sample_rate,
+	)
+
+# outermost, the latency covers every other middleware too
+if config.metrics.enabled:
+	app.add_middleware(MetricsMiddleware)
+
 
 @app.get("/healthcheck")
 async def healthcheck():
@@ -0,0 +1,55 @@
+import secrets
+from typing import Annotated, Any
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from ..deps import get_config, get_profiler
+from ..lib.util.config import Config
+from ..lib.util.profiler import RequestProfiler
+
+router = APIRouter(prefix="/admin", include_in_schema=False)
+
+
+def _unauthorized(config: Config, authorization: str | None) -> JSONResponse | None:
+	token = config.profiling.token
+
+	if token is None or not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+		return JSONResponse({"error": "Unauthorized", "message": "a valid bearer token is required"}, status_code=401)
+
+	return None
+
+
+@router.get("/profiles")
+async def profiles(
+	config: Annotated[Config, Depends(get_config)],
+	profiler: Annotated[RequestProfiler, Depends(get_profiler)],
+	authorization: Annotated[str | None, Header()] = None,
+) -> list[dict[str, Any]]:
+	"""List the kept request profiles, newest first"""
+	if (response := _unauthorized(config, authorization)) is not None:
+		return response
+
+	return [profile.summary() for profile in profiler.list()]
+
+
+@router.get("/profiles/{id}")
+async def profile(
+	id: str,
+	config: Annotated[Config, Depends(get_config)],
+	profiler: Annotated[RequestProfiler, Depends(get_profiler)],
+	authorization: Annotated[str | None, Header()] = None,
+):
+	"""Download a request profile as collapsed stacks, for flamegraph.pl or speedscope"""
+	if (response := _unauthorized(config, authorization)) is not None:
+		return response
+
+	found = profiler.get(id)
+
+	if found is None:
+		return JSONResponse({"error": "NotFound", "message": f"no profile with id {id}"}, status_code=404)
+
+	return PlainTextResponse(
+		found.collapsed(),
+		headers={"Content-Disposition": f'attachment; filename="profile-{found.id}.txt"'},
+	)
@@ -0,0 +1,33 @@
+import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+
+from ..deps import get_analytics_pipeline
+from ..lib.analytics.pipeline import AnalyticsPipeline
+from ..lib.analytics.store import GRANULARITIES, Granularity, Summary
+
+router = APIRouter(prefix="/analytics")
+
+
+@router.get(
+	"/summary",
+	responses={503: {"description": "Analytics are disabled"}},
+)
+async def summary(
+	pipeline: Annotated[AnalyticsPipeline, Depends(get_analytics_pipeline)],
+	granularity: Granularity = "day",
+	periods: Annotated[int, Query(ge=1, le=400)] = 30,
+) -> Summary:
+	"""Get the visit statistics of the last `periods` hours or days, including the current one"""
+	if not pipeline.running:
+		return JSONResponse(
+			{"error": "AnalyticsDisabled", "message": "Analytics are not enabled on this server"},
+			status_code=503,
+		)
+
+	now = time.time()
+	length = GRANULARITIES[granularity]
+
+	return await pipeline.summary(granularity, now - (periods - 1) * length, now + length)
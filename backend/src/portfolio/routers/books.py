@@ -6,6 +6,8 @@ from fastapi.responses import JSONResponse, Response
 
 from ..deps import get_hardcover_service
 from ..lib.api.hardcover_api import HardcoverApi, HardcoverBook, HardcoverError
+from ..lib.util.encoding import json_response
+from ..lib.util.ratelimit import retry_after_header
 
 router = APIRouter(prefix="/books")
 
@@ -23,9 +25,19 @@ async def currently_reading(
 			if not book:
 				return Response(status_code=204)
 
-			return JSONResponse(content=book, status_code=200)
+			return json_response(book)
 		except HardcoverError as e:
+			error = e.args[0]
+
+			# the circuit breaker is open, tell the client when to come back
+			if "retry_after" in error:
+				return JSONResponse(
+					{"error": "HardcoverUnavailable", "message": error["message"]},
+					status_code=503,
+					headers={"Retry-After": retry_after_header(error["retry_after"])},
+				)
+
 			return JSONResponse(
-				{"error": "HardcoverError", "message": e.args[0]["message"]},
+				{"error": "HardcoverError", "message": error["message"]},
 				status_code=502,
 			)
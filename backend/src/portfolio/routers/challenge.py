@@ -0,0 +1,87 @@
+import time
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from ..deps import get_config, get_proof_of_work
+from ..lib.middleware.request import client_ip
+from ..lib.util.challenge import ProofOfWork
+from ..lib.util.config import Config
+
+router = APIRouter(prefix="/challenge")
+
+
+class Challenge(BaseModel):
+	challenge: str
+	# leading zero bits of sha256("<challenge>:<solution>")
+	difficulty: int
+	# unix time
+	expires_at: int
+
+
+class Solution(BaseModel):
+	challenge: str = Field(max_length=256)
+	solution: str = Field(max_length=32)
+
+
+class Pass(BaseModel):
+	# send as the pass header, or rely on the cookie
+	token: str
+	expires_at: int
+
+
+@router.get("")
+async def challenge(proof_of_work: Annotated[ProofOfWork, Depends(get_proof_of_work)]) -> Challenge:
+	"""Get a proof of work challenge.
+
+	Find a `solution` (e.g. a counter) that makes `sha256("<challenge>:<solution>")` start
+	with `difficulty` zero bits, and redeem it for a pass with `POST /challenge`.
+	"""
+	now = time.time()
+
+	return Challenge(
+		challenge=proof_of_work.challenge(now),
+		difficulty=proof_of_work.difficulty,
+		expires_at=int(now + proof_of_work.challenge_ttl),
+	)
+
+
+@router.post(
+	"",
+	responses={400: {"description": "The solution is wrong, or the challenge expired or was already redeemed"}},
+)
+async def redeem(
+	solution: Solution,
+	request: Request,
+	proof_of_work: Annotated[ProofOfWork, Depends(get_proof_of_work)],
+	config: Annotated[Config, Depends(get_config)],
+) -> Pass:
+	"""Redeem a solved challenge for a pass to the routes that call Spotify and Hardcover"""
+	now = time.time()
+	forwarded_header = config.api.forwarded_ip_header
+	client = (
+		client_ip(request.scope, forwarded_header.lower().encode() if forwarded_header else None)
+		if config.challenge.bind_ip
+		else ""
+	)
+	token = await proof_of_work.redeem(solution.challenge, solution.solution, client, now)
+
+	if token is None:
+		return JSONResponse(
+			{"error": "InvalidSolution", "message": "The solution is wrong, or the challenge expired or was redeemed"},
+			status_code=400,
+		)
+
+	response = JSONResponse({"token": token, "expires_at": int(now + proof_of_work.pass_ttl)})
+	response.set_cookie(
+		config.challenge.cookie_name,
+		token,
+		max_age=int(proof_of_work.pass_ttl),
+		httponly=True,
+		secure=config.challenge.secure,
+		samesite="lax",
+	)
+
+	return response
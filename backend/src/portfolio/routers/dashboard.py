@@ -0,0 +1,101 @@
+import asyncio
+from collections.abc import Awaitable
+from typing import Annotated, Any
+
+from aiohttp import ClientSession
+from fastapi import APIRouter, Depends
+from loguru import logger
+from pydantic import BaseModel
+
+from ..deps import _get_hardcover_api, _get_spotify_api, get_client_session, get_config
+from ..lib.api.hardcover_api import HardcoverApi, HardcoverBook, HardcoverError
+from ..lib.api.spotify_api import SpotifyApi, SpotifyError, TopArtist, Track
+from ..lib.util.config import Config
+from ..lib.util.encoding import json_response
+
+router = APIRouter(prefix="/dashboard")
+
+
+class SectionError(BaseModel):
+	error: str
+	message: str
+
+
+class Dashboard(BaseModel):
+	currently_playing: Track | None = None
+	last_played: Track | None = None
+	top_tracks: list[Track] | None = None
+	top_artists: list[TopArtist] | None = None
+	currently_reading: HardcoverBook | None = None
+	# sections that are missing because their upstream failed or missed the deadline
+	errors: dict[str, SectionError] = {}
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+	# tasks left running past their deadline have nobody awaiting them
+	if not task.cancelled():
+		task.exception()
+
+
+async def _section(name: str, call: Awaitable[Any], deadline: float) -> tuple[str, Any, SectionError | None]:
+	task = asyncio.ensure_future(call)
+
+	try:
+		# shielded, a call that misses the deadline keeps running and still fills the cache for the next request
+		return name, await asyncio.wait_for(asyncio.shield(task), deadline), None
+	except TimeoutError:
+		task.add_done_callback(_retrieve_exception)
+		return name, None, SectionError(error="Timeout", message=f"no response within {deadline:g}s")
+	except (SpotifyError, HardcoverError) as e:
+		upstream = "Spotify" if isinstance(e, SpotifyError) else "Hardcover"
+		# `retry_after` is only set when the circuit breaker is open
+		kind = "Unavailable" if "retry_after" in e.args[0] else "Error"
+
+		return name, None, SectionError(error=upstream + kind, message=str(e.args[0]["message"]))
+	except Exception as e:
+		logger.exception(f"Dashboard section {name} failed: {e!r}")
+		return name, None, SectionError(error="InternalError", message="the section could not be loaded")
+
+
+@router.get("")
+async def dashboard(
+	spotify: Annotated[SpotifyApi, Depends(_get_spotify_api)],
+	hardcover: Annotated[HardcoverApi, Depends(_get_hardcover_api)],
+	session: Annotated[ClientSession, Depends(get_client_session)],
+	config: Annotated[Config, Depends(get_config)],
+) -> Dashboard:
+	"""Get everything the portfolio page shows in one request.
+
+	The upstream calls run at the same time, each with its own deadline, so the response
+	takes about as long as the slowest of them. A section whose upstream fails or misses
+	its deadline is `null` and has an entry in `errors`, the other sections are still returned.
+	"""
+	limit = config.dashboard.top_limit
+	calls = {
+		"currently_playing": spotify.get_currently_playing(session),
+		"last_played": spotify.get_last_played_track(session),
+		"top_tracks": spotify.get_top_tracks(session, limit=limit),
+		"top_artists": spotify.get_top_artists(session, limit=limit),
+		"currently_reading": hardcover.get_currently_reading_book(session),
+	}
+
+	deadlines = config.dashboard.deadlines
+	default_deadline = config.dashboard.default_deadline
+
+	results = await asyncio.gather(
+		*(_section(name, call, deadlines.get(name, default_deadline)) for name, call in calls.items())
+	)
+
+	# the fields of `Dashboard`, encoded without validating the sections again
+	dashboard: dict[str, Any] = {}
+	errors: dict[str, SectionError] = {}
+
+	for name, value, error in results:
+		dashboard[name] = value
+
+		if error is not None:
+			errors[name] = error
+
+	dashboard["errors"] = errors
+
+	return json_response(dashboard)
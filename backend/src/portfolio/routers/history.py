@@ -0,0 +1,85 @@
+from datetime import UTC, date, datetime, timedelta
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+
+from ..deps import get_history_recorder
+from ..lib.history.recorder import HistoryRecorder
+from ..lib.history.store import MostPlayed, PlaysPerDay
+
+router = APIRouter(prefix="/spotify/history")
+
+# the longest range a single request may ask for
+_MAX_DAYS = 400
+_DEFAULT_DAYS = 30
+
+history_error_response = {
+	422: {"description": "The range is empty or longer than 400 days"},
+	503: {"description": "The listening history is disabled"},
+}
+
+
+def _disabled() -> JSONResponse:
+	return JSONResponse(
+		{"error": "HistoryDisabled", "message": "The listening history is not enabled on this server"},
+		status_code=503,
+	)
+
+
+def _invalid_range(message: str) -> JSONResponse:
+	return JSONResponse({"error": "InvalidRange", "message": message}, status_code=422)
+
+
+def _unix_ms(value: datetime) -> int:
+	# datetimes without a timezone are UTC
+	if value.tzinfo is None:
+		value = value.replace(tzinfo=UTC)
+
+	return int(value.timestamp() * 1000)
+
+
+@router.get("/plays-per-day", responses=history_error_response)
+async def plays_per_day(
+	recorder: Annotated[HistoryRecorder, Depends(get_history_recorder)],
+	start: date | None = None,
+	end: date | None = None,
+	utc_offset: Annotated[int, Query(ge=-12 * 60, le=14 * 60)] = 0,
+) -> PlaysPerDay:
+	"""Get the number of plays of every day from `start` to `end` (inclusive), the last 30 days by default.
+
+	Days start at midnight `utc_offset` minutes from UTC, e.g. 120 for UTC+2.
+	"""
+	if not recorder.running:
+		return _disabled()
+
+	if end is None:
+		end = (datetime.now(UTC) + timedelta(minutes=utc_offset)).date()
+
+	if start is None:
+		start = end - timedelta(days=_DEFAULT_DAYS - 1)
+
+	if start > end or (end - start).days >= _MAX_DAYS:
+		return _invalid_range(f"start must be before end and at most {_MAX_DAYS} days apart")
+
+	return await recorder.plays_per_day(start, end, utc_offset)
+
+
+@router.get("/most-played", responses=history_error_response)
+async def most_played(
+	recorder: Annotated[HistoryRecorder, Depends(get_history_recorder)],
+	start: datetime | None = None,
+	end: datetime | None = None,
+	limit: Annotated[int, Query(ge=1, le=50)] = 10,
+) -> MostPlayed:
+	"""Get the most played tracks from `start` to `end`, the last 30 days by default"""
+	if not recorder.running:
+		return _disabled()
+
+	end_ms = _unix_ms(end) if end is not None else _unix_ms(datetime.now(UTC))
+	start_ms = _unix_ms(start) if start is not None else end_ms - _DEFAULT_DAYS * 24 * 60 * 60 * 1000
+
+	if start_ms >= end_ms or end_ms - start_ms > _MAX_DAYS * 24 * 60 * 60 * 1000:
+		return _invalid_range(f"start must be before end and at most {_MAX_DAYS} days apart")
+
+	return await recorder.most_played(start_ms, end_ms, limit)
@@ -0,0 +1,68 @@
+from typing import Annotated, Literal
+
+from aiohttp import ClientSession
+from fastapi import APIRouter, Depends, Header, Path, Query
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+from ..deps import get_client_session, get_config, get_image_proxy
+from ..lib.images.proxy import ImageError, ImageNotFound, ImageProxy
+from ..lib.middleware.etag import etag_matches
+from ..lib.util.config import Config
+
+router = APIRouter(prefix="/images")
+
+# a variant of a key never changes, the source urls are content addressed too
+_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@router.get(
+	"/{key}",
+	response_class=FileResponse,
+	responses={
+		200: {"description": "The image", "content": {"image/avif": {}, "image/webp": {}, "image/jpeg": {}}},
+		304: {"description": "The client's copy is current"},
+		404: {"description": "Not the key of a proxied image"},
+		502: {"description": "The source image couldn't be fetched or isn't an image"},
+	},
+)
+async def image(
+	key: Annotated[str, Path(pattern="^[0-9a-f]{32}$")],
+	proxy: Annotated[ImageProxy, Depends(get_image_proxy)],
+	session: Annotated[ClientSession, Depends(get_client_session)],
+	config: Annotated[Config, Depends(get_config)],
+	w: Annotated[int | None, Query(ge=1, le=4096)] = None,
+	format: Literal["avif", "webp", "jpeg"] | None = None,
+	accept: Annotated[str | None, Header()] = None,
+	if_none_match: Annotated[str | None, Header()] = None,
+):
+	"""Get an album cover or book cover `w` pixels wide.
+
+	The width is rounded up to the next available one. Without a `format` the best
+	format the `Accept` header allows is picked (AVIF, then WebP, then JPEG).
+	"""
+	try:
+		variant = await proxy.variant(session, key, proxy.width(w), format or proxy.negotiate(accept))
+	except ImageNotFound:
+		return JSONResponse({"error": "NotFound", "message": "no image with this key"}, status_code=404)
+	except ImageError as e:
+		return JSONResponse({"error": "ImageError", "message": str(e)}, status_code=502)
+
+	headers = {"Cache-Control": _CACHE_CONTROL, "ETag": variant.etag}
+
+	if format is None:
+		headers["Vary"] = "Accept"
+
+	if if_none_match is not None and etag_matches(if_none_match, variant.etag):
+		return Response(status_code=304, headers=headers)
+
+	accel_redirect = config.images.accel_redirect
+
+	if accel_redirect is not None:
+		# nginx sends the file itself
+		relative = variant.path.relative_to(config.images.directory).as_posix()
+		headers["X-Accel-Redirect"] = f"{accel_redirect.rstrip('/')}/{relative}"
+
+		return Response(media_type=variant.media_type, headers=headers)
+
+	# sent with `http.response.pathsend` (sendfile) by servers that support it
+	return FileResponse(variant.path, media_type=variant.media_type, headers=headers)
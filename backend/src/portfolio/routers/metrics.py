@@ -0,0 +1,133 @@
+import secrets
+from collections.abc import Iterator
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from ..deps import (
+	_get_hardcover_api,
+	_get_spotify_api,
+	get_analytics_pipeline,
+	get_blocklist,
+	get_client_session,
+	get_config,
+	get_currently_playing_poller,
+	get_response_cache,
+)
+from ..lib.util.config import Config
+from ..lib.util.metrics import REGISTRY, snapshot
+
+router = APIRouter()
+
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _snapshots() -> Iterator[str]:
+	"""Metrics read from the stats objects the status endpoints serve."""
+	hosts = get_client_session.pool_stats.hosts.items()
+
+	yield snapshot(
+		"portfolio_upstream_requests_in_flight",
+		"gauge",
+		"Upstream requests waiting for a connection or their response headers",
+		(({"host": host}, stats.in_flight) for host, stats in hosts),
+	)
+	yield snapshot(
+		"portfolio_upstream_connections_waiting",
+		"gauge",
+		"Upstream requests waiting for a free pooled connection",
+		(({"host": host}, stats.waiting) for host, stats in hosts),
+	)
+	yield snapshot(
+		"portfolio_upstream_connections_created_total",
+		"counter",
+		"Upstream connections opened",
+		(({"host": host}, stats.connections_created) for host, stats in hosts),
+	)
+	yield snapshot(
+		"portfolio_upstream_connections_reused_total",
+		"counter",
+		"Upstream requests sent on a kept alive connection",
+		(({"host": host}, stats.connections_reused) for host, stats in hosts),
+	)
+	yield snapshot(
+		"portfolio_upstream_pool_queued_seconds_total",
+		"counter",
+		"Time upstream requests spent waiting for a pooled connection",
+		(({"host": host}, stats.queued_seconds) for host, stats in hosts),
+	)
+
+	cache = get_response_cache()
+	yield snapshot("portfolio_cache_entries", "gauge", "Entries in the response cache", [({}, len(cache))])
+	yield snapshot(
+		"portfolio_cache_events_total",
+		"counter",
+		"Response cache counters by event (hits, misses, stale_hits, evictions, ...)",
+		(({"event": event}, value) for event, value in cache.stats.as_dict().items()),
+	)
+
+	breakers = {"spotify": _get_spotify_api().breaker, "hardcover": _get_hardcover_api().breaker}
+	yield snapshot(
+		"portfolio_upstream_breaker_state",
+		"gauge",
+		"Circuit breaker state, 0 closed, 1 half open, 2 open",
+		(({"upstream": name}, _BREAKER_STATES[breaker.state]) for name, breaker in breakers.items()),
+	)
+	yield snapshot(
+		"portfolio_upstream_breaker_rejected_total",
+		"counter",
+		"Calls failed fast while the circuit was open",
+		(({"upstream": name}, breaker.stats.rejected) for name, breaker in breakers.items()),
+	)
+
+	token = _get_spotify_api().token.metrics.as_dict()
+	yield snapshot(
+		"portfolio_token_expires_in_seconds",
+		"gauge",
+		"Seconds until the access token expires",
+		[({"token": "spotify"}, token["token_expires_in_seconds"])],
+	)
+	yield snapshot(
+		"portfolio_token_age_seconds",
+		"gauge",
+		"Seconds since the access token was issued",
+		[({"token": "spotify"}, token["token_age_seconds"])],
+	)
+
+	stream = get_currently_playing_poller().broadcaster.stats
+	yield snapshot(
+		"portfolio_stream_subscribers", "gauge", "Open currently playing streams", [({}, stream.subscribers)]
+	)
+
+	analytics = get_analytics_pipeline()
+	yield snapshot(
+		"portfolio_analytics_buffered_events",
+		"gauge",
+		"Analytics events waiting to be written",
+		[({}, len(analytics.buffer))],
+	)
+	yield snapshot(
+		"portfolio_analytics_dropped_events_total",
+		"counter",
+		"Analytics events dropped or sampled out because the buffer was full",
+		[({}, analytics.buffer.stats.dropped + analytics.buffer.stats.sampled_out)],
+	)
+
+	yield snapshot("portfolio_blocklist_entries", "gauge", "Blocked networks", [({}, len(get_blocklist()))])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(
+	config: Annotated[Config, Depends(get_config)],
+	authorization: Annotated[str | None, Header()] = None,
+):
+	"""Prometheus metrics of this worker"""
+	token = config.metrics.token
+
+	if token is not None and not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+		return JSONResponse({"error": "Unauthorized", "message": "a valid bearer token is required"}, status_code=401)
+
+	return PlainTextResponse(REGISTRY.render(_snapshots()), media_type=_CONTENT_TYPE)
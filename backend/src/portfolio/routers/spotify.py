@@ -1,17 +1,24 @@
+import asyncio
 from typing import Annotated, Literal
 
 from aiohttp import ClientSession
-from fastapi import APIRouter, Depends, Query
-from fastapi.responses import JSONResponse, Response
+from fastapi import APIRouter, Depends, Query, WebSocket
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
-from ..deps import _get_spotify_api, get_client_session, get_spotify_service
+from ..deps import _get_spotify_api, get_client_session, get_config, get_currently_playing_poller, get_spotify_service
 from ..lib.api.spotify_api import (
 	SpotifyApi,
 	SpotifyError,
+	TimeRange,
 	TopArtist,
 	Track,
 )
+from ..lib.api.spotify_poller import CurrentlyPlayingPoller
+from ..lib.util.broadcast import BroadcastFull, SubscriptionClosed
+from ..lib.util.config import Config
+from ..lib.util.encoding import json_response
+from ..lib.util.ratelimit import retry_after_header
 
 # Set to None to be declared when the lifecycle of the route starts
 
@@ -37,9 +44,27 @@ spotify_error_response = {
 			},
 		},
 	},
+	503: {
+		"model": SpotifyErrorMessage,
+		"description": "Spotify is failing, the request wasn't sent, see `Retry-After`",
+	},
 }
 
 
+def _spotify_error_response(e: SpotifyError) -> JSONResponse:
+	error = e.args[0]
+
+	# the circuit breaker is open, tell the client when to come back
+	if "retry_after" in error:
+		return JSONResponse(
+			{"error": "SpotifyUnavailable", "message": error["message"]},
+			status_code=503,
+			headers={"Retry-After": retry_after_header(error["retry_after"])},
+		)
+
+	return JSONResponse({"error": "SpotifyError", "message": error["message"]}, status_code=502)
+
+
 @router.get(
 	"/currently-playing",
 	responses={
@@ -60,12 +85,96 @@ async def currently_playing(
 			if track is None:
 				return Response(status_code=204)  # 204 No Content
 
-			return track
+			return json_response(track)
 		except SpotifyError as e:
-			return JSONResponse(
-				{"error": "SpotifyError", "message": e.args[0]["message"]},
-				status_code=502,
-			)
+			return _spotify_error_response(e)
+
+
+@router.get(
+	"/currently-playing/stream",
+	response_class=StreamingResponse,
+	responses={
+		200: {
+			"description": "Server-Sent Events, one `data:` event per change of the currently playing track",
+			"content": {"text/event-stream": {}},
+		},
+		503: {"description": "Too many open streams"},
+	},
+)
+async def currently_playing_stream(
+	poller: Annotated[CurrentlyPlayingPoller, Depends(get_currently_playing_poller)],
+	config: Annotated[Config, Depends(get_config)],
+):
+	"""Stream the currently playing track from user's spotify.
+
+	Each event is `{"observed_at": <unix ms>, "track": Track | null}` and is only sent when
+	the track, the play state or the position (seek) changes. While `is_playing` is true
+	clients should advance `progress_ms` locally from `observed_at`.
+	"""
+	try:
+		subscription = poller.broadcaster.subscribe()
+	except BroadcastFull:
+		return JSONResponse({"error": "StreamFull", "message": "too many open streams"}, status_code=503)
+
+	async def events():
+		try:
+			while True:
+				message = await subscription.next(config.stream.heartbeat_interval)
+
+				# comment line to keep idle connections (and proxies) alive
+				if message is None:
+					yield b": keep-alive\n\n"
+				else:
+					yield b"data: " + message + b"\n\n"
+		except SubscriptionClosed:
+			return
+		finally:
+			subscription.close()
+
+	return StreamingResponse(
+		events(),
+		media_type="text/event-stream",
+		headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+	)
+
+
+@router.websocket("/currently-playing/ws")
+async def currently_playing_ws(
+	websocket: WebSocket,
+	poller: Annotated[CurrentlyPlayingPoller, Depends(get_currently_playing_poller)],
+):
+	"""WebSocket version of `/currently-playing/stream`, every message is a JSON text frame."""
+	try:
+		subscription = poller.broadcaster.subscribe()
+	except BroadcastFull:
+		await websocket.close(code=1013)  # 1013 Try Again Later
+		return
+
+	await websocket.accept()
+
+	async def forward():
+		async for message in subscription:
+			await websocket.send_text(message.decode())
+
+	async def wait_for_disconnect():
+		# clients don't send anything, this only returns once the client is gone
+		while (await websocket.receive())["type"] != "websocket.disconnect":
+			pass
+
+	sending = asyncio.create_task(forward())
+	receiving = asyncio.create_task(wait_for_disconnect())
+
+	try:
+		await asyncio.wait({sending, receiving}, return_when=asyncio.FIRST_COMPLETED)
+	finally:
+		subscription.close()
+		receiving.cancel()
+		sending.cancel()
+		await asyncio.gather(sending, receiving, return_exceptions=True)
+
+	# the stream ended while the client is still connected, it was dropped as a slow consumer
+	if not sending.cancelled() and sending.exception() is None:
+		await websocket.close(code=1013)
 
 
 @router.get("/last-played", responses=spotify_error_response)
@@ -79,12 +188,9 @@ async def last_played(
 		try:
 			track = await api.get_last_played_track(session)
 
-			return track
+			return json_response(track)
 		except SpotifyError as e:
-			return JSONResponse(
-				{"error": "SpotifyError", "message": e.args[0]["message"]},
-				status_code=502,
-			)
+			return _spotify_error_response(e)
 
 
 @router.get("/top-{type}", responses=spotify_error_response)
@@ -92,8 +198,12 @@ async def top_type(
 	service: Annotated[tuple[SpotifyApi, ClientSession], Depends(get_spotify_service)],
 	type: Literal["artists", "tracks"],
 	limit: int = Query(default=10, ge=1, le=50),
+	time_range: TimeRange = "short_term",
 ) -> list[Track] | list[TopArtist] | None:
-	"""Get the top `type` from user's spotify"""
+	"""Get the top `type` of a `time_range` from user's spotify.
+
+	`short_term` is about the last 4 weeks, `medium_term` 6 months and `long_term` a year.
+	"""
 	# check if type is correct
 	if type not in ["artists", "tracks"]:
 		return JSONResponse(
@@ -109,15 +219,12 @@ async def top_type(
 	if api and session:
 		try:
 			if type == "artists":
-				top_user_artists = await api.get_top_month_artists(session, limit=limit)
+				top_user_artists = await api.get_top_artists(session, limit=limit, time_range=time_range)
 
-				return top_user_artists
+				return json_response(top_user_artists)
 			if type == "tracks":
-				top_user_tracks = await api.get_top_month_tracks(session, limit=limit)
+				top_user_tracks = await api.get_top_tracks(session, limit=limit, time_range=time_range)
 
-				return top_user_tracks
+				return json_response(top_user_tracks)
 		except SpotifyError as e:
-			return JSONResponse(
-				{"error": "SpotifyError", "message": e.args[0]["message"]},
-				status_code=502,
-			)
+			return _spotify_error_response(e)
@@ -0,0 +1,163 @@
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import JSONResponse
+
+from ..deps import (
+	_get_hardcover_api,
+	_get_spotify_api,
+	get_analytics_pipeline,
+	get_blocklist,
+	get_client_session,
+	get_config,
+	get_currently_playing_poller,
+	get_dominant_colors,
+	get_geoip,
+	get_history_recorder,
+	get_image_proxy,
+	get_proof_of_work,
+	get_response_cache,
+	get_session_store,
+	get_snapshot,
+)
+from ..lib.analytics.events import classify_user_agent
+from ..lib.analytics.pipeline import AnalyticsPipeline
+from ..lib.api.hardcover_api import HardcoverApi
+from ..lib.api.spotify_api import SpotifyApi
+from ..lib.api.spotify_poller import CurrentlyPlayingPoller
+from ..lib.history.recorder import HistoryRecorder
+from ..lib.util.blocklist import Blocklist
+from ..lib.util.cache import SwrCache
+from ..lib.util.config import Config
+
+
+async def _authorize(
+	config: Annotated[Config, Depends(get_config)],
+	authorization: Annotated[str | None, Header()] = None,
+) -> None:
+	token = config.status.token
+
+	if token is not None and not secrets.compare_digest(authorization or "", f"Bearer {token}"):
+		raise HTTPException(401, "a valid bearer token is required", headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix="/status", dependencies=[Depends(_authorize)])
+
+
+@router.get("/cache")
+async def cache_status(cache: Annotated[SwrCache, Depends(get_response_cache)]) -> dict[str, int]:
+	"""Get the hit/miss counters of the upstream response cache"""
+	return {"entries": len(cache), **cache.stats.as_dict()}
+
+
+@router.get("/spotify-token")
+async def spotify_token_status(api: Annotated[SpotifyApi, Depends(_get_spotify_api)]) -> dict[str, float | int | None]:
+	"""Get the age of the Spotify access token and the latency of its refreshes"""
+	return api.token.metrics.as_dict()
+
+
+@router.get("/breakers")
+async def breaker_status(
+	spotify: Annotated[SpotifyApi, Depends(_get_spotify_api)],
+	hardcover: Annotated[HardcoverApi, Depends(_get_hardcover_api)],
+) -> dict[str, dict[str, str | int | float | None]]:
+	"""Get the circuit breaker state of every upstream api"""
+	return {"spotify": spotify.breaker.stats.as_dict(), "hardcover": hardcover.breaker.stats.as_dict()}
+
+
+@router.get("/stream")
+async def stream_status(
+	poller: Annotated[CurrentlyPlayingPoller, Depends(get_currently_playing_poller)],
+) -> dict[str, int]:
+	"""Get the subscriber counters of the currently playing stream"""
+	return poller.broadcaster.stats.as_dict()
+
+
+@router.get("/http-pool")
+async def http_pool_status() -> dict[str, dict[str, float | int | None]]:
+	"""Get the connection pool usage of the upstream hosts"""
+	return get_client_session.pool_stats.as_dict()
+
+
+@router.get("/blocklist")
+async def blocklist_status(blocklist: Annotated[Blocklist, Depends(get_blocklist)]) -> dict[str, int]:
+	"""Get the size of the blocklist and how many requests it rejected"""
+	return blocklist.stats.as_dict()
+
+
+@router.get("/analytics")
+async def analytics_status(pipeline: Annotated[AnalyticsPipeline, Depends(get_analytics_pipeline)]) -> dict[str, int]:
+	"""Get the backlog of the analytics buffer and how many events were dropped or written"""
+	return {"buffered": len(pipeline.buffer), "flushed": pipeline.flushed, **pipeline.buffer.stats.as_dict()}
+
+
+@router.get("/images")
+async def images_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, int]:
+	"""Get the counters of the image proxy and the size of its cache"""
+	if not config.images.enabled:
+		return JSONResponse({"error": "NotFound", "message": "the image proxy is disabled"}, status_code=404)
+
+	return get_image_proxy().stats.as_dict()
+
+
+@router.get("/colors")
+async def colors_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, int]:
+	"""Get how many dominant colors are known and how they were served"""
+	if not config.colors.enabled:
+		return JSONResponse({"error": "NotFound", "message": "dominant colors are disabled"}, status_code=404)
+
+	colors = get_dominant_colors()
+
+	return {"colors": len(colors), **colors.stats.as_dict()}
+
+
+@router.get("/history")
+async def history_status(
+	recorder: Annotated[HistoryRecorder, Depends(get_history_recorder)],
+) -> dict[str, int | float | None]:
+	"""Get how many plays the listening history has and when it was last synced"""
+	if not recorder.running:
+		return JSONResponse({"error": "NotFound", "message": "the listening history is disabled"}, status_code=404)
+
+	return {"plays": await recorder.count(), "synced": recorder.synced, "last_sync": recorder.last_sync}
+
+
+@router.get("/sessions")
+async def sessions_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, int | None]:
+	"""Get how many browser sessions are live and how many were created, expired or rejected"""
+	if not config.sessions.enabled:
+		return JSONResponse({"error": "NotFound", "message": "sessions are disabled"}, status_code=404)
+
+	store = get_session_store()
+
+	return {"sessions": await store.count(), **store.stats.as_dict()}
+
+
+@router.get("/challenge")
+async def challenge_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, int]:
+	"""Get how many proof of work challenges were issued and solved and how many requests were let through"""
+	if not config.challenge.enabled:
+		return JSONResponse({"error": "NotFound", "message": "proof of work challenges are disabled"}, status_code=404)
+
+	return get_proof_of_work().stats.as_dict()
+
+
+@router.get("/enrichment")
+async def enrichment_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, dict[str, int] | None]:
+	"""Get the size and lookups of the GeoIP table and how well the user agent cache does"""
+	user_agents = classify_user_agent.cache_info()
+
+	return {
+		"geoip": {"ranges": len(get_geoip()), **get_geoip().stats.as_dict()} if config.geoip.enabled else None,
+		"user_agents": {"cached": user_agents.currsize, "hits": user_agents.hits, "misses": user_agents.misses},
+	}
+
+
+@router.get("/snapshot")
+async def snapshot_status(config: Annotated[Config, Depends(get_config)]) -> dict[str, int]:
+	"""Get how much the warm start snapshot restored and how often it was saved"""
+	if not config.snapshot.enabled:
+		return JSONResponse({"error": "NotFound", "message": "the snapshot is disabled"}, status_code=404)
+
+	return get_snapshot().stats.as_dict()
@@ -0,0 +1,50 @@
+"""Blocking networks with and without a time to live."""
+
+import time
+
+from portfolio.lib.util.blocklist import Blocklist
+
+
+def test_ttl_doesnt_shorten_a_permanent_block() -> None:
+	blocklist = Blocklist()
+	blocklist.add("203.0.113.0/24")
+	# e.g. an auto-ban of an address in it
+	blocklist.add("203.0.113.0/24", ttl=60)
+
+	later = time.time() + 3600
+	assert blocklist.purge(later) == 0
+	assert blocklist.is_blocked("203.0.113.7", later)
+
+
+def test_longer_ttl_extends_and_shorter_keeps() -> None:
+	blocklist = Blocklist()
+	blocklist.add("198.51.100.1", ttl=60)
+	blocklist.add("198.51.100.1", ttl=600)
+	blocklist.add("198.51.100.1", ttl=10)
+
+	now = time.time()
+	assert blocklist.purge(now + 120) == 0
+	assert blocklist.is_blocked("198.51.100.1", now + 120)
+	assert blocklist.purge(now + 601) == 1
+	assert not blocklist.is_blocked("198.51.100.1", now + 601)
+
+
+def test_temporary_block_becomes_permanent() -> None:
+	blocklist = Blocklist()
+	blocklist.add("2001:db8::/32", ttl=60)
+	blocklist.add("2001:db8::/32")
+
+	later = time.time() + 3600
+	assert blocklist.purge(later) == 0
+	assert blocklist.is_blocked("2001:db8::1", later)
+
+
+def test_removed_block_can_be_added_shorter() -> None:
+	blocklist = Blocklist()
+	blocklist.add("192.0.2.1")
+	blocklist.remove("192.0.2.1")
+	blocklist.add("192.0.2.1", ttl=60)
+
+	later = time.time() + 120
+	assert blocklist.purge(later) == 1
+	assert not blocklist.is_blocked("192.0.2.1", later)
@@ -0,0 +1,84 @@
+"""Redeeming proof of work challenges, once across every worker sharing a store."""
+
+import time
+
+import fakeredis
+
+from portfolio.lib.store.memory import MemoryBackend
+from portfolio.lib.store.redis import RedisBackend
+from portfolio.lib.util.challenge import ProofOfWork, solve
+
+_SECRET = b"test secret"
+
+
+def _proof_of_work(store, **kwargs) -> ProofOfWork:
+	return ProofOfWork(_SECRET, store, difficulty=4, challenge_ttl=60, pass_ttl=60, **kwargs)
+
+
+async def test_redeem_once() -> None:
+	proof_of_work = _proof_of_work(MemoryBackend())
+	now = time.time()
+	challenge = proof_of_work.challenge(now)
+	solution = solve(challenge, 4)
+
+	token = await proof_of_work.redeem(challenge, solution, "client", now)
+
+	assert token is not None
+	assert proof_of_work.check_pass(token.encode(), "client", now)
+	assert not proof_of_work.check_pass(token.encode(), "another client", now)
+	assert await proof_of_work.redeem(challenge, solution, "client", now) is None
+	assert proof_of_work.stats.solved == 1
+	assert proof_of_work.stats.failed == 1
+
+
+async def test_wrong_and_expired_solutions_are_rejected() -> None:
+	proof_of_work = _proof_of_work(MemoryBackend())
+	now = time.time()
+	challenge = proof_of_work.challenge(now)
+	solution = solve(challenge, 4)
+
+	assert await proof_of_work.redeem(challenge + "0", solution, "client", now) is None
+	assert await proof_of_work.redeem(challenge, solution, "client", now + 61) is None
+	# not recorded by the failed attempts
+	assert await proof_of_work.redeem(challenge, solution, "client", now) is not None
+
+
+async def test_redeem_once_across_workers() -> None:
+	store = RedisBackend(fakeredis.FakeAsyncRedis())
+	first, second = _proof_of_work(store), _proof_of_work(store)
+	now = time.time()
+	challenge = first.challenge(now)
+	solution = solve(challenge, 4)
+
+	assert await first.redeem(challenge, solution, "client", now) is not None
+	assert await second.redeem(challenge, solution, "client", now) is None
+
+
+async def test_full_refuses_instead_of_forgetting() -> None:
+	proof_of_work = _proof_of_work(MemoryBackend(), max_solved=1)
+	now = time.time()
+	first, second = proof_of_work.challenge(now), proof_of_work.challenge(now)
+
+	assert await proof_of_work.redeem(first, solve(first, 4), "client", now) is not None
+	assert await proof_of_work.redeem(second, solve(second, 4), "client", now) is None
+	assert proof_of_work.stats.refused == 1
+	# the first one is still remembered
+	assert await proof_of_work.redeem(first, solve(first, 4), "client", now) is None
+
+	# room again once the first one expired, while it can't be redeemed anymore anyway
+	later = proof_of_work.challenge(now + 61)
+	assert await proof_of_work.redeem(later, solve(later, 4), "client", now + 61) is not None
+
+
+async def test_memory_set_if_absent_forgets_expired_keys() -> None:
+	store = MemoryBackend()
+
+	assert await store.set_if_absent("key", b"1", ttl=0.01)
+	assert not await store.set_if_absent("key", b"2", ttl=0.01)
+
+	time.sleep(0.02)
+	assert await store.set_if_absent("other", b"1", ttl=60)
+	# removed on the write, without being read
+	assert "key" not in store._values
+	assert await store.set_if_absent("key", b"3", ttl=60)
+	assert await store.get("key") == b"3"
@@ -0,0 +1,81 @@
+"""Dominant colors of the top lists are analyzed in the background."""
+
+import asyncio
+import json
+import time
+
+import pytest
+from aiohttp import ClientSession
+
+from portfolio.lib.api.spotify_api import SpotifyApi
+from portfolio.lib.images.colors import DominantColors
+from portfolio.lib.util.config import ApiConfig, ColorsConfig, Config, HardcoverConfig, SpotifyConfig
+from portfolio.lib.util.http import UpstreamResponse
+
+_ANALYSIS_TIME = 0.2
+
+
+@pytest.fixture
+async def colors(tmp_path):
+	colors = DominantColors(ColorsConfig(enabled=True, database=str(tmp_path / "colors.db")))
+	analyzed: list[str] = []
+
+	async def compute(session, url: str) -> str:
+		analyzed.append(url)
+		await asyncio.sleep(_ANALYSIS_TIME)
+		return "#123456"
+
+	# no process pool or image server, only the time an analysis takes
+	colors._compute = compute
+	colors.analyzed = analyzed
+
+	yield colors
+	await colors.close()
+
+
+async def test_peek_analyzes_in_the_background(colors: DominantColors) -> None:
+	assert colors.peek(None, "https://i.scdn.co/image/a") is None
+	# asking again while it's analyzed doesn't start another analysis
+	assert colors.peek(None, "https://i.scdn.co/image/a") is None
+
+	await asyncio.sleep(_ANALYSIS_TIME * 2)
+
+	assert colors.peek(None, "https://i.scdn.co/image/a") == "#123456"
+	assert colors.analyzed == ["https://i.scdn.co/image/a"]
+	assert colors.stats.deferred == 1
+
+
+async def test_top_tracks_dont_wait_for_the_colors(colors: DominantColors) -> None:
+	config = Config(
+		spotify=SpotifyConfig(client_id="id", client_secret="secret", refresh_token="token"),
+		hardcover=HardcoverConfig(user_id="id", api_token="token"),
+		api=ApiConfig(allowed_origins=("http://localhost",)),
+	)
+	api = SpotifyApi(config, colors=colors)
+	items = [
+		{
+			"name": f"track {i}",
+			"uri": f"spotify:track:{i}",
+			"artists": [{"name": "artist"}],
+			"album": {"name": "album", "images": [{"url": f"https://i.scdn.co/image/{i}"}]},
+		}
+		for i in range(50)
+	]
+
+	async def get(session, url, params=None) -> UpstreamResponse:
+		return UpstreamResponse(200, json.dumps({"items": items}).encode())
+
+	api._get = get
+
+	async with ClientSession() as session:
+		start = time.perf_counter()
+		tracks = await api.get_top_tracks(session, limit=50)
+
+		assert time.perf_counter() - start < _ANALYSIS_TIME
+		assert [track.album_image_dominant_color for track in tracks] == [None] * 50
+
+		await asyncio.sleep(_ANALYSIS_TIME * 2)
+
+		tracks = await api.get_top_tracks(session, limit=50)
+
+	assert [track.album_image_dominant_color for track in tracks] == ["#123456"] * 50
@@ -0,0 +1,76 @@
+"""ETags and the bounded memory of the last bodies."""
+
+from portfolio.lib.middleware.etag import ETagMiddleware
+
+
+def _app(body: bytes):
+	async def app(scope, receive, send) -> None:
+		await send(
+			{"type": "http.response.start", "status": 200, "headers": [(b"content-length", str(len(body)).encode())]}
+		)
+		await send({"type": "http.response.body", "body": body})
+
+	return app
+
+
+async def _get(middleware: ETagMiddleware, query: bytes = b"", if_none_match: bytes | None = None) -> list[dict]:
+	messages = []
+
+	async def send(message) -> None:
+		messages.append(message)
+
+	headers = [(b"if-none-match", if_none_match)] if if_none_match is not None else []
+	scope = {
+		"type": "http",
+		"method": "GET",
+		"path": "/spotify/top-tracks",
+		"root_path": "",
+		"query_string": query,
+		"headers": headers,
+	}
+	await middleware(scope, None, send)
+
+	return messages
+
+
+async def test_not_modified() -> None:
+	middleware = ETagMiddleware(_app(b"body"), cache_control={"/spotify/": "public, max-age=60"})
+
+	start, body = await _get(middleware)
+	headers = dict(start["headers"])
+	assert start["status"] == 200
+	assert body["body"] == b"body"
+	assert headers[b"cache-control"] == b"public, max-age=60"
+
+	start, body = await _get(middleware, if_none_match=headers[b"etag"])
+	assert start["status"] == 304
+	assert body["body"] == b""
+
+
+async def test_query_order_shares_an_entry() -> None:
+	middleware = ETagMiddleware(_app(b"body"), cache_control={})
+
+	await _get(middleware, b"time_range=short_term&limit=10")
+	await _get(middleware, b"limit=10&time_range=short_term")
+
+	assert len(middleware._etags) == 1
+
+
+async def test_kept_bodies_are_bounded_in_bytes() -> None:
+	body = b"x" * 1000
+	middleware = ETagMiddleware(_app(body), cache_control={}, max_entries=100, max_cached_bytes=2500)
+
+	for i in range(50):
+		await _get(middleware, b"junk=%d" % i)
+
+	assert len(middleware._etags) == 2
+	assert middleware._cached_bytes == 2000
+
+
+async def test_bodies_over_the_byte_limit_still_get_an_etag() -> None:
+	middleware = ETagMiddleware(_app(b"x" * 1000), cache_control={}, max_cached_bytes=100)
+
+	start, _ = await _get(middleware)
+
+	assert b"etag" in dict(start["headers"])
+	assert middleware._cached_bytes == 0
@@ -0,0 +1,87 @@
+"""Syncing the listening history past plays that can't be kept, like local files."""
+
+import json
+
+import pytest
+
+from portfolio.lib.api.spotify_api import SpotifyApi
+from portfolio.lib.history.recorder import HistoryRecorder
+from portfolio.lib.util.config import ApiConfig, Config, HardcoverConfig, HistoryConfig, SpotifyConfig
+from portfolio.lib.util.http import UpstreamResponse
+
+
+def _item(played_at: str, uri: str, images: list[dict]) -> dict:
+	return {
+		"played_at": played_at,
+		"track": {
+			"uri": uri,
+			"name": "name",
+			"artists": [{"name": "artist"}],
+			"album": {"name": "album", "images": images},
+			"duration_ms": 1000,
+		},
+	}
+
+
+_IMAGES = [{"url": "https://i.scdn.co/image/abc"}]
+
+_TRACK = _item("2026-01-01T10:00:00+00:00", "spotify:track:abc", _IMAGES)
+_LOCAL = _item("2026-01-01T10:05:00+00:00", "spotify:local:artist:album:name:180", [])
+_NO_IMAGES = _item("2026-01-01T10:10:00+00:00", "spotify:track:def", [])
+
+
+@pytest.fixture
+def api() -> SpotifyApi:
+	config = Config(
+		spotify=SpotifyConfig(client_id="id", client_secret="secret", refresh_token="token"),
+		hardcover=HardcoverConfig(user_id="id", api_token="token"),
+		api=ApiConfig(allowed_origins=("http://localhost",)),
+	)
+
+	return SpotifyApi(config)
+
+
+def _serve(api: SpotifyApi, pages: list[dict]) -> list[dict]:
+	"""Answer the recently played requests with `pages` in order, returns the params of every request."""
+	requests: list[dict] = []
+
+	async def get(session, url, params=None) -> UpstreamResponse:
+		requests.append(dict(params or {}))
+		page = pages.pop(0) if pages else {"items": [], "cursors": None}
+		return UpstreamResponse(200, json.dumps(page).encode())
+
+	api._get = get
+	return requests
+
+
+async def test_local_files_and_plays_without_images_are_skipped(api: SpotifyApi) -> None:
+	_serve(api, [{"items": [_NO_IMAGES, _LOCAL, _TRACK], "cursors": None}])
+
+	plays, cursor = await api.get_recently_played(None)
+
+	assert [play.track_id for play in plays] == ["abc"]
+	# the cursor still covers the skipped plays
+	assert cursor == 1767262200000
+
+
+async def test_sync_moves_past_a_page_of_skipped_plays(api: SpotifyApi, tmp_path) -> None:
+	requests = _serve(
+		api,
+		[
+			{"items": [_LOCAL], "cursors": {"after": "1767261900000"}},
+			{"items": [_TRACK], "cursors": {"after": "1767261600000"}},
+		],
+	)
+	recorder = HistoryRecorder(api, HistoryConfig(database=str(tmp_path / "history.db")))
+	await recorder.start(None)
+	recorder._task.cancel()
+
+	try:
+		assert await recorder.sync(None) == 0
+		assert await recorder.sync(None) == 1
+		assert await recorder.count() == 1
+	finally:
+		await recorder.stop()
+
+	# the second sync asked for the plays after the skipped one
+	assert requests[1]["after"] == 1767261900000
@@ -0,0 +1,49 @@
+"""Timeouts of the upstream requests."""
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from portfolio.lib.util.config import HttpConfig, TimeoutConfig
+from portfolio.lib.util.http import create_session, fetch
+
+
+@pytest.fixture
+async def server():
+	async def slow(request: web.Request) -> web.Response:
+		await asyncio.sleep(2)
+		return web.Response(text="late")
+
+	app = web.Application()
+	app.router.add_get("/slow", slow)
+
+	async with TestServer(app) as server:
+		yield server
+
+
+async def test_session_timeout_applies(server: TestServer) -> None:
+	session = create_session(HttpConfig(total_timeout=0.2))
+
+	try:
+		with pytest.raises(TimeoutError):
+			await fetch(session, "GET", str(server.make_url("/slow")))
+	finally:
+		await session.close()
+
+
+async def test_host_timeout_overrides_the_session_timeout(server: TestServer) -> None:
+	config = HttpConfig(total_timeout=10, host_timeouts={server.host: TimeoutConfig(connect=1, read=0.2)})
+	session = create_session(config)
+
+	start = time.perf_counter()
+
+	try:
+		with pytest.raises(TimeoutError):
+			await fetch(session, "GET", str(server.make_url("/slow")))
+	finally:
+		await session.close()
+
+	assert time.perf_counter() - start < 1
@@ -0,0 +1,107 @@
+"""Fetching source images within the size limit and serving cached variants."""
+
+import io
+
+import pytest
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from portfolio.lib.images.proxy import ImageError, ImageProxy
+from portfolio.lib.util.config import ImagesConfig
+
+Image = pytest.importorskip("PIL.Image")
+
+_MAX_SOURCE_SIZE = 100_000
+
+
+def _jpeg() -> bytes:
+	data = io.BytesIO()
+	Image.new("RGB", (32, 32), (200, 30, 30)).save(data, "JPEG")
+	return data.getvalue()
+
+
+@pytest.fixture
+async def server():
+	sent = {"bytes": 0}
+
+	async def small(request: web.Request) -> web.Response:
+		return web.Response(body=_jpeg(), content_type="image/jpeg")
+
+	async def large(request: web.Request) -> web.Response:
+		return web.Response(body=b"\0" * (_MAX_SOURCE_SIZE * 10), content_type="image/jpeg")
+
+	async def chunked(request: web.Request) -> web.StreamResponse:
+		# no Content-Length, the size only shows while reading
+		response = web.StreamResponse()
+		response.enable_chunked_encoding()
+		await response.prepare(request)
+
+		try:
+			for _ in range(1000):
+				await response.write(b"\0" * 10_000)
+				sent["bytes"] += 10_000
+		except (ConnectionResetError, ConnectionError):
+			pass
+
+		return response
+
+	app = web.Application()
+	app.router.add_get("/small.jpg", small)
+	app.router.add_get("/large.jpg", large)
+	app.router.add_get("/chunked.jpg", chunked)
+
+	async with TestServer(app) as server:
+		server.sent = sent
+		yield server
+
+
+@pytest.fixture
+async def proxy(tmp_path):
+	proxy = ImageProxy(
+		ImagesConfig(
+			enabled=True,
+			public_url="https://example.com/images",
+			directory=str(tmp_path),
+			max_source_size=_MAX_SOURCE_SIZE,
+			formats=["jpeg"],
+			workers=1,
+		)
+	)
+	yield proxy
+	await proxy.close()
+
+
+def _key(proxy: ImageProxy, url: str) -> str:
+	return proxy.url(url).rpartition("/")[2]
+
+
+async def test_too_large_sources_are_refused(server: TestServer, proxy: ImageProxy) -> None:
+	async with ClientSession() as session:
+		for name in ("large.jpg", "chunked.jpg"):
+			with pytest.raises(ImageError, match="bigger than"):
+				await proxy.variant(session, _key(proxy, str(server.make_url(f"/{name}"))), 64, "jpeg")
+
+	assert proxy.stats.errors == 2
+	# the chunked body wasn't read to the end
+	assert server.sent["bytes"] < 1000 * 10_000
+
+
+async def test_variant_that_disappears_is_a_miss(server: TestServer, proxy: ImageProxy) -> None:
+	key = _key(proxy, str(server.make_url("/small.jpg")))
+
+	async with ClientSession() as session:
+		first = await proxy.variant(session, key, 64, "jpeg")
+		assert first.path.exists()
+
+		assert await proxy.variant(session, key, 64, "jpeg") == first
+		assert proxy.stats.hits == 1
+
+		# evicted by another worker
+		first.path.unlink()
+		second = await proxy.variant(session, key, 64, "jpeg")
+
+	assert second == first
+	assert second.path.exists()
+	assert proxy.stats.hits == 1
+	assert proxy.stats.renders == 2
+	assert proxy.stats.fetches == 1
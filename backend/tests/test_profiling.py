@@ -0,0 +1,61 @@
+"""Profiling requests with a bounded number of sampling threads."""
+
+import asyncio
+
+from portfolio.lib.middleware.profiling import ProfilingMiddleware
+from portfolio.lib.util.profiler import RequestProfiler
+
+
+async def _app(scope, receive, send) -> None:
+	await asyncio.sleep(0.05)
+	await send({"type": "http.response.start", "status": 200, "headers": []})
+	await send({"type": "http.response.body", "body": b""})
+
+
+async def _request(app, headers: list[tuple[bytes, bytes]] | None = None) -> dict:
+	messages = []
+
+	async def send(message) -> None:
+		messages.append(message)
+
+	scope = {"type": "http", "method": "GET", "path": "/spotify/top-tracks", "root_path": "", "headers": headers or []}
+	await app(scope, None, send)
+
+	return dict(messages[0]["headers"])
+
+
+async def _settle(profiler: RequestProfiler) -> None:
+	# the sampling threads hand their profiles back through the loop
+	for _ in range(100):
+		if not profiler._active:
+			return
+
+		await asyncio.sleep(0.01)
+
+
+async def test_concurrent_profiles_are_capped() -> None:
+	profiler = RequestProfiler(interval=0.001, max_profiles=50, max_concurrent=2)
+	app = ProfilingMiddleware(_app, profiler=profiler, header="X-Profile", sample_rate=1.0)
+
+	responses = await asyncio.gather(*(_request(app) for _ in range(10)))
+	await _settle(profiler)
+
+	assert sum(b"x-profile-id" in headers for headers in responses) == 2
+	assert len(profiler) == 2
+	assert all(profile.samples > 0 for profile in profiler.list())
+
+	# room again once they're done
+	assert b"x-profile-id" in await _request(app)
+
+
+async def test_wrong_token_is_still_sampled() -> None:
+	profiler = RequestProfiler(interval=0.001, max_profiles=50)
+	app = ProfilingMiddleware(_app, profiler=profiler, header="X-Profile", token="secret", sample_rate=1.0)
+
+	assert b"x-profile-id" in await _request(app, [(b"x-profile", b"wrong")])
+
+	never = ProfilingMiddleware(_app, profiler=profiler, header="X-Profile", token="secret")
+
+	assert b"x-profile-id" not in await _request(never, [(b"x-profile", b"wrong")])
+	assert b"x-profile-id" in await _request(never, [(b"x-profile", b"secret")])
+	await _settle(profiler)
@@ -0,0 +1,175 @@
+"""The token bucket, the sliding window log and the headers of the rate limit middleware."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from portfolio.lib.middleware import ratelimit as ratelimit_middleware
+from portfolio.lib.middleware.ratelimit import RateLimitMiddleware
+from portfolio.lib.util.config import RateLimitRule
+from portfolio.lib.util.ratelimit import SlidingWindowLog, TokenBucket, retry_after_header
+
+
+def test_token_bucket_burst_and_refill() -> None:
+	# 1 token per second
+	bucket = TokenBucket(limit=3, window=3, max_keys=10)
+
+	assert [bucket.hit("ip", 0).remaining for _ in range(3)] == [2, 1, 0]
+
+	denied = bucket.hit("ip", 0)
+	assert not denied.allowed
+	assert denied.retry_after == pytest.approx(1.0)
+	assert denied.reset == pytest.approx(3.0)
+
+	assert bucket.hit("ip", 0.5).retry_after == pytest.approx(0.5)
+	assert bucket.hit("ip", 1.0).allowed
+
+	# never refilled past the limit
+	assert bucket.hit("ip", 100).remaining == 2
+
+
+def test_token_bucket_keys_are_independent() -> None:
+	bucket = TokenBucket(limit=1, window=60, max_keys=10)
+
+	assert bucket.hit("a", 0).allowed
+	assert not bucket.hit("a", 0).allowed
+	assert bucket.hit("b", 0).allowed
+
+
+def test_sliding_window_is_exact() -> None:
+	log = SlidingWindowLog(limit=2, window=10, max_keys=10)
+
+	assert log.hit("ip", 0).allowed
+	assert log.hit("ip", 1).remaining == 0
+
+	denied = log.hit("ip", 5)
+	assert not denied.allowed
+	# until the request at 0 leaves the window
+	assert denied.retry_after == pytest.approx(5.0)
+	assert denied.reset == pytest.approx(6.0)
+
+	assert not log.hit("ip", 9.9).allowed
+	assert log.hit("ip", 10).allowed
+	assert not log.hit("ip", 10.5).allowed
+	assert log.hit("ip", 11).allowed
+
+
+@pytest.mark.parametrize("limiter_class", [TokenBucket, SlidingWindowLog])
+def test_idle_and_excess_keys_are_evicted(limiter_class) -> None:
+	limiter = limiter_class(limit=5, window=10, max_keys=3)
+
+	for i in range(5):
+		limiter.hit(str(i), 0)
+
+	assert len(limiter) == 3
+
+	# a new key after a whole window drops every idle one
+	limiter.hit("new", 20)
+	assert len(limiter) == 1
+
+
+def test_retry_after_is_rounded_up_to_whole_seconds() -> None:
+	assert retry_after_header(0.01) == "1"
+	assert retry_after_header(1.2) == "2"
+	assert retry_after_header(3) == "3"
+
+
+class _Clock:
+	def __init__(self) -> None:
+		self.now = 1000.0
+
+	def monotonic(self) -> float:
+		return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+	clock = _Clock()
+	monkeypatch.setattr(ratelimit_middleware, "time", SimpleNamespace(monotonic=clock.monotonic))
+	return clock
+
+
+async def _ok(scope, receive, send) -> None:
+	await send({"type": "http.response.start", "status": 200, "headers": []})
+	await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def _get(
+	middleware: RateLimitMiddleware, path: str, ip: str = "1.2.3.4"
+) -> tuple[int, dict[bytes, bytes], bytes]:
+	messages = []
+
+	async def send(message) -> None:
+		messages.append(message)
+
+	scope = {"type": "http", "method": "GET", "path": path, "root_path": "", "headers": [], "client": (ip, 1234)}
+	await middleware(scope, None, send)
+
+	return messages[0]["status"], dict(messages[0]["headers"]), messages[1]["body"]
+
+
+def _middleware(**kwargs) -> RateLimitMiddleware:
+	rules = [
+		RateLimitRule(prefix="/spotify/", limit=2, window=64),
+		RateLimitRule(prefix="/spotify/currently-playing/", algorithm="sliding_window", limit=1, window=30),
+	]
+	return RateLimitMiddleware(_ok, rules=rules, max_keys=100, **kwargs)
+
+
+async def test_headers_of_allowed_and_limited_requests(clock: _Clock) -> None:
+	limited: list[str] = []
+	middleware = _middleware(on_limited=limited.append)
+
+	status, headers, _ = await _get(middleware, "/spotify/top-tracks")
+	assert status == 200
+	assert headers[b"ratelimit-limit"] == b"2"
+	assert headers[b"ratelimit-remaining"] == b"1"
+	# a token every 32 s, exact in binary so the rounding up is too
+	assert headers[b"ratelimit-reset"] == b"32"
+	assert headers[b"ratelimit-policy"] == b"2;w=64"
+	assert b"retry-after" not in headers
+
+	await _get(middleware, "/spotify/top-tracks")
+	clock.now += 16
+
+	status, headers, body = await _get(middleware, "/spotify/top-tracks")
+	assert status == 429
+	assert json.loads(body)["error"] == "RateLimited"
+	assert headers[b"ratelimit-remaining"] == b"0"
+	assert headers[b"retry-after"] == b"16"
+	assert limited == ["1.2.3.4"]
+
+	clock.now += 16
+	status, _, _ = await _get(middleware, "/spotify/top-tracks")
+	assert status == 200
+
+
+async def test_longest_prefix_wins(clock: _Clock) -> None:
+	middleware = _middleware()
+
+	status, headers, _ = await _get(middleware, "/spotify/currently-playing/stream")
+	assert status == 200
+	assert headers[b"ratelimit-policy"] == b"1;w=30"
+
+	clock.now += 12.5
+	status, headers, _ = await _get(middleware, "/spotify/currently-playing/stream")
+	assert status == 429
+	assert headers[b"retry-after"] == b"18"
+
+	# the other rule keeps its own count
+	status, _, _ = await _get(middleware, "/spotify/top-tracks")
+	assert status == 200
+
+
+async def test_unlimited_paths_and_exempt_clients(clock: _Clock) -> None:
+	middleware = _middleware(exempt=["10.0.0.1"])
+
+	for _ in range(5):
+		status, headers, _ = await _get(middleware, "/healthcheck")
+		assert status == 200
+		assert b"ratelimit-limit" not in headers
+
+		status, headers, _ = await _get(middleware, "/spotify/top-tracks", ip="10.0.0.1")
+		assert status == 200
+		assert b"ratelimit-limit" not in headers
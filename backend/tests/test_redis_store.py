@@ -0,0 +1,193 @@
+"""`RedisBackend` and the shared cache and token on top of it.
+
+Runs against fakeredis with Lua support (the lock release is a script), and against
+a real server as well when `REDIS_URL` is set, e.g. `REDIS_URL=redis://localhost:6379/15`.
+The server's database is flushed, don't point it at one that is in use.
+"""
+
+import asyncio
+import os
+import time
+
+import fakeredis
+import pytest
+from pydantic import TypeAdapter
+
+from portfolio.lib.store.redis import RedisBackend
+from portfolio.lib.util.cache import SwrCache
+from portfolio.lib.util.config import CachePolicy
+from portfolio.lib.util.token import TokenManager
+
+_SERVERS = ["fakeredis"] + (["redis-server"] if os.environ.get("REDIS_URL") else [])
+
+
+@pytest.fixture(params=_SERVERS)
+async def client(request):
+	if request.param == "fakeredis":
+		client = fakeredis.FakeAsyncRedis()
+	else:
+		from redis.asyncio import Redis
+
+		client = Redis.from_url(os.environ["REDIS_URL"])
+
+	await client.flushdb()
+	yield client
+	await client.flushdb()
+	await client.aclose()
+
+
+@pytest.fixture
+def backend(client) -> RedisBackend:
+	return RedisBackend(client, key_prefix="test:")
+
+
+async def test_get_set_delete(backend: RedisBackend, client) -> None:
+	assert await backend.get("missing") is None
+
+	await backend.set("key", b"value")
+	assert await backend.get("key") == b"value"
+	# every key is prefixed
+	assert await client.get("test:key") == b"value"
+
+	await backend.delete("key")
+	assert await backend.get("key") is None
+
+
+async def test_set_ttl(backend: RedisBackend) -> None:
+	await backend.set("key", b"value", ttl=0.05)
+	assert await backend.get("key") == b"value"
+
+	await asyncio.sleep(0.1)
+	assert await backend.get("key") is None
+
+
+async def test_set_if_absent(backend: RedisBackend) -> None:
+	assert await backend.set_if_absent("key", b"first", ttl=0.05)
+	assert not await backend.set_if_absent("key", b"second", ttl=0.05)
+	assert await backend.get("key") == b"first"
+
+	await asyncio.sleep(0.1)
+	assert await backend.set_if_absent("key", b"third", ttl=10)
+	assert await backend.get("key") == b"third"
+
+
+async def test_lock_is_exclusive(backend: RedisBackend) -> None:
+	token = await backend.acquire_lock("name", ttl=10)
+
+	assert token is not None
+	assert await backend.acquire_lock("name", ttl=10) is None
+	# other names are independent
+	assert await backend.acquire_lock("other", ttl=10) is not None
+
+	await backend.release_lock("name", token)
+	assert await backend.acquire_lock("name", ttl=10) is not None
+
+
+async def test_release_with_another_token_keeps_the_lock(backend: RedisBackend) -> None:
+	token = await backend.acquire_lock("name", ttl=10)
+	assert token is not None
+
+	await backend.release_lock("name", "not the token")
+	assert await backend.acquire_lock("name", ttl=10) is None
+
+	await backend.release_lock("name", token)
+	assert await backend.acquire_lock("name", ttl=10) is not None
+
+
+async def test_lock_expires(backend: RedisBackend) -> None:
+	token = await backend.acquire_lock("name", ttl=0.05)
+	assert token is not None
+
+	await asyncio.sleep(0.1)
+	new_token = await backend.acquire_lock("name", ttl=10)
+	assert new_token is not None
+
+	# the expired holder can't release the new holder's lock
+	await backend.release_lock("name", token)
+	assert await backend.acquire_lock("name", ttl=10) is None
+
+
+async def test_token_is_refreshed_once_for_every_worker(backend: RedisBackend) -> None:
+	requests = 0
+
+	async def refresh(session) -> tuple[str, float]:
+		nonlocal requests
+		requests += 1
+		await asyncio.sleep(0.05)
+		return f"token {requests}", 3600.0
+
+	# one manager per worker, all sharing the same store
+	managers = [TokenManager(refresh, margin=60, store=backend) for _ in range(4)]
+
+	try:
+		tokens = await asyncio.gather(*(manager.get(None) for manager in managers))
+	finally:
+		for manager in managers:
+			manager.close()
+
+	assert requests == 1
+	assert tokens == ["token 1"] * 4
+	assert sum(manager.metrics.adopted for manager in managers) == 3
+
+
+async def test_shared_token_is_adopted(backend: RedisBackend) -> None:
+	async def refresh(session) -> tuple[str, float]:
+		return "token", 3600.0
+
+	async def unreachable(session) -> tuple[str, float]:
+		raise AssertionError("the shared token should have been used")
+
+	first = TokenManager(refresh, margin=60, store=backend)
+	second = TokenManager(unreachable, margin=60, store=backend)
+
+	try:
+		assert await first.get(None) == "token"
+		assert await second.get(None) == "token"
+	finally:
+		first.close()
+		second.close()
+
+
+async def test_cache_is_shared_between_workers(backend: RedisBackend) -> None:
+	policies = {"policy": CachePolicy(ttl=60, stale_ttl=60)}
+	adapter = TypeAdapter(list[int])
+	first, second = SwrCache(10, policies, backend), SwrCache(10, policies, backend)
+
+	async def fetch() -> list[int]:
+		return [1, 2, 3]
+
+	async def unreachable() -> list[int]:
+		raise AssertionError("the shared entry should have been used")
+
+	assert await first.get_or_fetch("key", fetch, policy="policy", adapter=adapter) == [1, 2, 3]
+	assert await second.get_or_fetch("key", unreachable, policy="policy", adapter=adapter) == [1, 2, 3]
+	assert second.stats.shared_hits == 1
+
+
+async def test_stale_entry_is_revalidated_by_one_worker(backend: RedisBackend) -> None:
+	policies = {"policy": CachePolicy(ttl=60, stale_ttl=60)}
+	adapter = TypeAdapter(int)
+	caches = [SwrCache(10, policies, backend) for _ in range(4)]
+	fetches = 0
+
+	async def fetch() -> int:
+		nonlocal fetches
+		fetches += 1
+		await asyncio.sleep(0.05)
+		return fetches
+
+	for cache in caches:
+		# the same stale entry in every worker
+		entry = cache.set("key", 0, policy="policy")
+		entry.fresh_until = time.time() - 1
+
+	assert (
+		await asyncio.gather(*(c.get_or_fetch("key", fetch, policy="policy", adapter=adapter) for c in caches))
+		== [0] * 4
+	)
+
+	await asyncio.gather(*(task for cache in caches for task in list(cache._revalidating.values())))
+
+	assert fetches == 1
+	assert sum(cache.stats.revalidations for cache in caches) == 1
+	assert await backend.acquire_lock("cache:key", ttl=1) is not None
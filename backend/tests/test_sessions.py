@@ -0,0 +1,224 @@
+"""The session cookie, its store and the timing wheel the store expires through."""
+
+import time
+
+from portfolio.lib.analytics.enrich import Enricher
+from portfolio.lib.middleware import session as session_middleware
+from portfolio.lib.middleware.session import SessionMiddleware
+from portfolio.lib.sessions.session import Session, SessionSigner
+from portfolio.lib.sessions.store import MemorySessionStore
+from portfolio.lib.util.wheel import TimingWheel
+
+_BROWSER = b"Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+_BOT = b"Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)"
+
+_TTL = 60 * 60
+
+
+def test_wheel_hands_out_due_items() -> None:
+	wheel: TimingWheel[str] = TimingWheel(horizon=100, resolution=10, now=0)
+	wheel.schedule("early", 15)
+	wheel.schedule("late", 55)
+
+	assert list(wheel.advance(10)) == []
+	assert list(wheel.advance(20)) == ["early"]
+	assert list(wheel.advance(60)) == ["late"]
+	assert len(wheel) == 0
+
+
+def test_wheel_after_a_long_pause() -> None:
+	wheel: TimingWheel[int] = TimingWheel(horizon=100, resolution=10, now=0)
+
+	for i in range(100):
+		wheel.schedule(i, i)
+
+	# many times the horizon later, every item comes out once
+	assert sorted(wheel.advance(10_000)) == list(range(100))
+	assert len(wheel) == 0
+
+	# and the wheel carries on from there
+	wheel.schedule(100, 10_050)
+	assert list(wheel.advance(10_040)) == []
+	assert list(wheel.advance(10_060)) == [100]
+
+
+def test_wheel_deadline_past_the_horizon_comes_back_early() -> None:
+	wheel: TimingWheel[str] = TimingWheel(horizon=100, resolution=10, now=0)
+	wheel.schedule("far", 1000)
+
+	assert list(wheel.advance(120)) == ["far"]
+
+
+def test_signer_round_trip() -> None:
+	signer = SessionSigner(b"secret")
+	id = bytes(range(16))
+
+	assert signer.verify(signer.sign(id).encode()) == id
+	assert SessionSigner(b"another secret").verify(signer.sign(id).encode()) is None
+
+
+def test_signer_rejects_tampered_and_short_cookies() -> None:
+	signer = SessionSigner(b"secret")
+	cookie = signer.sign(bytes(range(16))).encode()
+	encoded_id, _, encoded_mac = cookie.partition(b".")
+	flipped_mac = encoded_mac[:-1] + (b"0" if encoded_mac[-1:] != b"0" else b"1")
+	flipped_id = (b"0" if encoded_id[:1] != b"0" else b"1") + encoded_id[1:]
+
+	for value in [
+		encoded_id + b"." + flipped_mac,
+		flipped_id + b"." + encoded_mac,
+		cookie[:-2],
+		encoded_id,
+		b"",
+		b"zz" + cookie[2:],
+		cookie + b"00",
+	]:
+		assert signer.verify(value) is None, value
+
+
+async def test_store_expires_after_a_long_pause() -> None:
+	now = int(time.time())
+	store = MemorySessionStore(_TTL, max_sessions=100, now=now)
+
+	for _ in range(10):
+		await store.save(Session.new(now, "1.2.3.4", "desktop", None))
+
+	assert await store.expire(now + _TTL // 2) == 0
+	assert await store.expire(now + 100 * _TTL) == 10
+	assert await store.count() == 0
+	assert store.stats.expired == 10
+
+
+async def test_store_keeps_a_session_in_use() -> None:
+	now = int(time.time())
+	store = MemorySessionStore(_TTL, max_sessions=100, now=now)
+	session = Session.new(now, "1.2.3.4", "desktop", None)
+	await store.save(session)
+
+	session.last_seen = now + _TTL - 1
+	await store.save(session)
+
+	# handed out at its old deadline, scheduled again
+	assert await store.expire(now + _TTL + 60) == 0
+	assert await store.get(session.id, now + _TTL + 60) is not None
+
+	assert await store.expire(now + 2 * _TTL + 60) == 1
+
+
+def _app(cache_control: bytes = b"public, max-age=60"):
+	async def app(scope, receive, send) -> None:
+		await send({"type": "http.response.start", "status": 200, "headers": [(b"cache-control", cache_control)]})
+		await send({"type": "http.response.body", "body": b"body"})
+
+	return app
+
+
+def _middleware(store: MemorySessionStore, signer: SessionSigner) -> SessionMiddleware:
+	return SessionMiddleware(_app(), store=store, signer=signer, enricher=Enricher(), paths=["/spotify/"])
+
+
+async def _get(
+	middleware: SessionMiddleware, cookie: bytes | None = None, user_agent: bytes = _BROWSER
+) -> tuple[dict[bytes, bytes], dict]:
+	"""The response headers and the request state."""
+	messages = []
+
+	async def send(message) -> None:
+		messages.append(message)
+
+	headers = [(b"user-agent", user_agent)] + ([(b"cookie", b"theme=dark; session=" + cookie)] if cookie else [])
+	scope = {
+		"type": "http",
+		"method": "GET",
+		"path": "/spotify/top-tracks",
+		"root_path": "",
+		"query_string": b"",
+		"headers": headers,
+		"client": ("1.2.3.4", 1234),
+	}
+	await middleware(scope, None, send)
+
+	return dict(messages[0]["headers"]), scope.get("state", {})
+
+
+def _cookie_value(headers: dict[bytes, bytes]) -> bytes:
+	return headers[b"set-cookie"].split(b";")[0].partition(b"=")[2]
+
+
+async def test_new_session_gets_a_private_cookie() -> None:
+	store = MemorySessionStore(_TTL, max_sessions=100, now=int(time.time()))
+	middleware = _middleware(store, SessionSigner(b"secret"))
+
+	headers, state = await _get(middleware)
+
+	assert b"HttpOnly" in headers[b"set-cookie"]
+	# the route's public cache control is overridden, a shared cache mustn't keep the cookie
+	assert headers[b"cache-control"] == b"private, no-store"
+	assert state["session"].requests == 1
+
+	# the cookie brings the same session back, without setting it again
+	headers, returning = await _get(middleware, _cookie_value(headers))
+
+	assert b"set-cookie" not in headers
+	assert headers[b"cache-control"] == b"public, max-age=60"
+	assert returning["session"].id == state["session"].id
+	assert returning["session"].requests == 2
+	assert store.stats.created == 1
+
+
+async def test_tampered_cookie_gets_a_new_session() -> None:
+	store = MemorySessionStore(_TTL, max_sessions=100, now=int(time.time()))
+	signer = SessionSigner(b"secret")
+	middleware = _middleware(store, signer)
+
+	forged = SessionSigner(b"not the secret").sign(bytes(16)).encode()
+	headers, state = await _get(middleware, forged)
+
+	assert state["session"].id != bytes(16)
+	assert signer.verify(_cookie_value(headers)) == state["session"].id
+	assert store.stats.invalid == 1
+
+
+async def test_cookie_is_refreshed_after_a_day() -> None:
+	store = MemorySessionStore(_TTL * 48, max_sessions=100, now=int(time.time()))
+	middleware = _middleware(store, SessionSigner(b"secret"))
+
+	headers, state = await _get(middleware)
+	cookie = _cookie_value(headers)
+
+	# last seen a bit more than the refresh interval ago
+	session = state["session"]
+	session.last_seen -= session_middleware._COOKIE_REFRESH + 1
+	await store.save(session)
+
+	headers, _ = await _get(middleware, cookie)
+
+	assert _cookie_value(headers) == cookie
+	assert headers[b"cache-control"] == b"private, no-store"
+
+
+async def test_bots_get_no_session() -> None:
+	store = MemorySessionStore(_TTL, max_sessions=100, now=int(time.time()))
+	middleware = _middleware(store, SessionSigner(b"secret"))
+
+	headers, state = await _get(middleware, user_agent=_BOT)
+
+	assert b"set-cookie" not in headers
+	assert "session" not in state
+	assert await store.count() == 0
+
+
+async def test_full_store_rejects_new_sessions() -> None:
+	store = MemorySessionStore(_TTL, max_sessions=1, now=int(time.time()))
+	middleware = _middleware(store, SessionSigner(b"secret"))
+
+	first, _ = await _get(middleware)
+	headers, state = await _get(middleware)
+
+	assert b"set-cookie" not in headers
+	assert "session" not in state
+	assert store.stats.rejected == 1
+
+	# the session that fit still works
+	headers, state = await _get(middleware, _cookie_value(first))
+	assert state["session"].requests == 2
@@ -0,0 +1,52 @@
+"""Saving the warm start snapshot from one worker at a time and restoring it."""
+
+import os
+
+import pytest
+
+from portfolio.lib.store.memory import MemoryBackend
+from portfolio.lib.util.cache import SwrCache
+from portfolio.lib.util.config import CachePolicy
+from portfolio.lib.util.snapshot import Snapshot
+
+pytest.importorskip("cryptography")
+
+_POLICIES = {"policy": CachePolicy(ttl=60, stale_ttl=60)}
+
+
+def _snapshot(path: str, store: MemoryBackend | None = None, cache: SwrCache | None = None) -> Snapshot:
+	return Snapshot(
+		path,
+		b"test secret",
+		cache=cache or SwrCache(10, _POLICIES),
+		tokens={},
+		owners=[],
+		interval=60,
+		lock_store=store,
+	)
+
+
+async def test_one_worker_saves(tmp_path) -> None:
+	path = str(tmp_path / "snapshot.bin")
+	store = MemoryBackend()
+	workers = [_snapshot(path, store) for _ in range(3)]
+
+	assert [await worker._owns_save() for worker in workers] == [True, False, False]
+	# the owner keeps saving until its lock runs out
+	assert await workers[0]._owns_save()
+
+	for worker in workers:
+		await worker.stop()
+
+	assert [worker.stats.saves for worker in workers] == [1, 0, 0]
+	assert os.listdir(tmp_path) == ["snapshot.bin"]
+
+
+async def test_restore(tmp_path) -> None:
+	path = str(tmp_path / "snapshot.bin")
+
+	await _snapshot(path).save()
+	snapshot = _snapshot(path)
+
+	assert await snapshot.restore(None)
+	assert not await _snapshot(str(tmp_path / "missing.bin")).restore(None)
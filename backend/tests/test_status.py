@@ -0,0 +1,44 @@
+"""The bearer token of the `/status` endpoints."""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from portfolio.deps import get_config
+from portfolio.lib.util.config import ApiConfig, Config, HardcoverConfig, SpotifyConfig, StatusConfig
+from portfolio.routers import status
+
+
+def _client(token: str | None) -> TestClient:
+	config = Config(
+		spotify=SpotifyConfig(client_id="id", client_secret="secret", refresh_token="token"),
+		hardcover=HardcoverConfig(user_id="id", api_token="token"),
+		api=ApiConfig(allowed_origins=("http://localhost",)),
+		status=StatusConfig(enabled=True, token=token),
+	)
+
+	app = FastAPI()
+	app.include_router(status.router)
+	app.dependency_overrides[get_config] = lambda: config
+
+	return TestClient(app)
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", "secret"])
+def test_token_is_required(authorization: str | None) -> None:
+	headers = {"Authorization": authorization} if authorization is not None else {}
+
+	response = _client("secret").get("/status/http-pool", headers=headers)
+
+	assert response.status_code == 401
+	assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+def test_valid_token_is_let_through() -> None:
+	response = _client("secret").get("/status/http-pool", headers={"Authorization": "Bearer secret"})
+
+	assert response.status_code == 200
+
+
+def test_open_without_a_token() -> None:
+	assert _client(None).get("/status/http-pool").status_code == 200
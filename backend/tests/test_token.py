@@ -0,0 +1,28 @@
+"""Scheduling the background refreshes of the access token."""
+
+import asyncio
+
+from portfolio.lib.util.token import TokenManager
+
+
+async def test_margin_longer_than_the_lifetime_doesnt_refresh_in_a_loop() -> None:
+	refreshes = 0
+
+	async def refresh(session) -> tuple[str, float]:
+		nonlocal refreshes
+		refreshes += 1
+		return f"token {refreshes}", 60.0
+
+	# refreshing an hour before a token of a minute expires
+	manager = TokenManager(refresh, margin=3600)
+
+	try:
+		assert await manager.get(None) == "token 1"
+		await asyncio.sleep(0.2)
+		assert await manager.get(None) == "token 1"
+
+		assert refreshes == 1
+		# refreshed half way through its lifetime instead
+		assert 29 < manager._scheduled.when() - asyncio.get_running_loop().time() <= 30
+	finally:
+		manager.close()
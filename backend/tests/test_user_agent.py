@@ -0,0 +1,67 @@
+"""Classifying user agents into a device platform and an operating system."""
+
+import pytest
+
+from portfolio.lib.analytics.events import UserAgent, classify_user_agent
+
+
+@pytest.mark.parametrize(
+	("user_agent", "expected"),
+	[
+		(
+			"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+			UserAgent("desktop", "windows"),
+		),
+		(
+			"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/126.0 Safari/537.36 Edg/126.0",
+			UserAgent("desktop", "windows"),
+		),
+		# "Microsoft" contains "cros"
+		(
+			"Microsoft Office/16.0 (Windows NT 10.0; Microsoft Outlook 16.0.17328; Pro)",
+			UserAgent("desktop", "windows"),
+		),
+		("Microsoft Office Word 2014", UserAgent("desktop", "unknown")),
+		(
+			"Mozilla/5.0 (compatible; MSIE 10.0; Windows Phone 8.0; Trident/6.0; IEMobile/10.0; Microsoft; Lumia 920)",
+			UserAgent("mobile", "windows"),
+		),
+		(
+			"Mozilla/5.0 (X11; CrOS x86_64 14541.0.0) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+			UserAgent("desktop", "chromeos"),
+		),
+		(
+			"Mozilla/5.0 (X11; CrOS aarch64 15359.58.0) AppleWebKit/537.36 Chrome/126.0 Safari/537.36",
+			UserAgent("desktop", "chromeos"),
+		),
+		(
+			"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 Version/17.5 Safari/605.1.15",
+			UserAgent("desktop", "macos"),
+		),
+		(
+			"Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+			UserAgent("mobile", "ios"),
+		),
+		(
+			"Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+			UserAgent("tablet", "ios"),
+		),
+		(
+			"Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 Chrome/126.0 Mobile Safari/537.36",
+			UserAgent("mobile", "android"),
+		),
+		# Android tablets leave "Mobile" out
+		(
+			"Mozilla/5.0 (Linux; Android 14; SM-X710) AppleWebKit/537.36 Chrome/126.0 Safari/537.36",
+			UserAgent("tablet", "android"),
+		),
+		("Mozilla/5.0 (X11; Linux x86_64; rv:127.0) Gecko/20100101 Firefox/127.0", UserAgent("desktop", "linux")),
+		(
+			"Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+			UserAgent("bot", "unknown"),
+		),
+		("", UserAgent("unknown", "unknown")),
+	],
+)
+def test_classify_user_agent(user_agent: str, expected: UserAgent) -> None:
+	assert classify_user_agent(user_agent) == expected